@@ -10,21 +10,56 @@ Initialize - allows user to initialize the parameters the irriagtion system oper
 Water Log - Displays logs for data on what was watered, and when, as well as errors.
 '''
 
-import atexit, bcrypt, geopy, json, os, re, requests, sqlite3, time, traceback
-import RPi.GPIO as GPIO
+import array, atexit, fcntl, functools, glob, hashlib, hmac, json, math, os, pickle, queue, random, re, sqlite3, sys, threading, time, traceback, uuid
+#startup timing report starts here, so it covers the heavier imports below
+startup_began = time.perf_counter()
+startup_timings = {}
+import bcrypt, requests
+import hardware, metrics, profiler, raindecision
+from apscheduler.events import EVENT_JOB_MISSED
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import date, datetime
-from geopy.geocoders import Nominatim
-from gpiozero import CPUTemperature
-from flask import flash, Flask, jsonify, redirect, render_template, request, session, url_for
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from flask import flash, Flask, g, jsonify, redirect, render_template, request, Response, send_from_directory, session, url_for
 from flask_assets import Environment, Bundle
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 
+startup_timings['imports'] = time.perf_counter() - startup_began
 __version__ = '0.5.1'
 __build__ = '2026-06-14'
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
+#Prometheus style metrics, served at /metrics
+registry = metrics.Registry()
+route_latency = registry.histogram('gardenbot_http_request_duration_seconds', 'Time to handle a request, by Flask endpoint.',
+	('endpoint', 'method'))
+route_requests = registry.counter('gardenbot_http_requests_total', 'Requests handled, by Flask endpoint and status.',
+	('endpoint', 'method', 'status'))
+sql_statements = registry.counter('gardenbot_sql_statements_total', 'Statements ran through the sql* helpers.', ('kind',))
+sql_seconds = registry.counter('gardenbot_sql_seconds_total', 'Time spent in statements ran through the sql* helpers.', ('kind',))
+request_sql_statements = registry.histogram('gardenbot_request_sql_statements', 'Statements ran through the sql* helpers per request.',
+	('endpoint',), buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200))
+request_sql_seconds = registry.histogram('gardenbot_request_sql_seconds', 'Time spent in the sql* helpers per request.', ('endpoint',))
+upstream_latency = registry.histogram('gardenbot_upstream_request_duration_seconds',
+	'Time for a call to an outside API, retries included.', ('upstream',))
+upstream_errors = registry.counter('gardenbot_upstream_errors_total', 'Failed calls to outside APIs, by error.', ('upstream', 'error'))
+job_duration = registry.histogram('gardenbot_job_duration_seconds', 'Time a scheduled job ran for.', ('job',))
+job_runs = registry.counter('gardenbot_job_runs_total', 'Scheduled job runs, by result.', ('job', 'result'))
+job_misfires = registry.counter('gardenbot_job_misfires_total', 'Scheduled job runs skipped for starting too late.', ('job',))
+sensor_latency = registry.histogram('gardenbot_sensor_read_seconds', 'Time to read a telemetry sensor.', ('metric',))
+pump_on_seconds = registry.counter('gardenbot_pump_on_seconds_total', 'Seconds the pump was on.')
+#thread running a request has its [statements, seconds] in the sql* helpers here, and its profiler.Profile if profiled
+request_stats = threading.local()
+
 assets = Environment(app)
 scss = Bundle(
     'scss/styles.scss',
@@ -32,135 +67,1645 @@ scss = Bundle(
     output='css/styles.css'
 )
 assets.register('scss_all', scss)
-# Force SCSS compile on startup
-with app.app_context():
-    scss.build(force=True)
+
+def buildStyles():
+	'''
+	Compiles the SCSS only if its sources changed since the last build.
+	The sources (static/scss and the vendored Bootstrap SCSS) are hashed, and the hash is stored next to the compiled CSS.
+	A file lock keeps multiple WSGI workers from building at the same time. Returns True if it compiled.
+	'''
+	sources = sorted(glob.glob(os.path.join(app.static_folder, 'scss', '**', '*.scss'), recursive=True)
+		+ glob.glob(os.path.join(app.static_folder, 'bootstrap', 'scss', '**', '*.scss'), recursive=True))
+	digest = hashlib.sha256()
+	for path in sources:
+		digest.update(os.path.relpath(path, app.static_folder).encode('utf-8'))
+		with open(path, 'rb') as f:
+			digest.update(f.read())
+	digest = digest.hexdigest()
+
+	output = os.path.join(app.static_folder, scss.output)
+	stamp = f'{output}.sha256'
+	def current():
+		try:
+			with open(stamp) as f:
+				return os.path.exists(output) and f.read().strip() == digest
+		except OSError:
+			return False
+
+	if current():
+		return False
+	os.makedirs(os.path.dirname(output), exist_ok=True)
+	with open(f'{output}.lock', 'w') as lock:
+		fcntl.flock(lock, fcntl.LOCK_EX)
+		#another worker may have built it while we waited
+		if current():
+			return False
+		with app.app_context():
+			scss.build(force=True)
+		with open(stamp, 'w') as f:
+			f.write(digest)
+	return True
+
+began = time.perf_counter()
+buildStyles()
+startup_timings['scss'] = time.perf_counter() - began
+
+#compiled templates are kept on disk between restarts
+cacheDir = os.environ.get('GARDENBOT_CACHE', os.path.join(app.root_path, 'cache'))
+try:
+	os.makedirs(os.path.join(cacheDir, 'jinja'), exist_ok=True)
+	app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.path.join(cacheDir, 'jinja'))
+except OSError as e:
+	print(f'Jinja bytecode cache disabled, could not use {cacheDir}: {e}')
 
 # dbPath = '/var/www/RaspiGardenBot/database/app_data.db'
-dbPath = 'database/app_data.db'
+dbPath = os.environ.get('GARDENBOT_DB', 'database/app_data.db')
 weather_api_base = 'https://api.open-meteo.com/v1/forecast'
+geocode_api_base = 'https://nominatim.openstreetmap.org/search'
+#geocoded (latitude, longitude) by normalized location, backed by the geocode_cache table
+coordinates = {}
+
+#'gpio' drives the real pins. 'sim' records pin activity and uses a virtual clock, for running off a Pi.
+hardware_backend = os.environ.get('GARDENBOT_HARDWARE', 'gpio')
+GPIO, clock, cpu_sensor = hardware.load(hardware_backend)
+#With GARDENBOT_HARDWARE_SOCKET set, watering sequences are ran by the hardware daemon (hardwared.py), the one process
+#that owns the pins, so any number of app processes can water. Otherwise this process owns them.
+hardware_socket = os.environ.get('GARDENBOT_HARDWARE_SOCKET')
+if hardware_socket:
+	pins = hardware.PinClient(hardware_socket)
+else:
+	GPIO.setmode(GPIO.BCM)
+	pins = hardware.PinController(GPIO, clock)
+	atexit.register(pins.close)
+
+class ConnectionPool:
+	'''
+	Small bounded pool of long lived SQLite connections shared by Flask request threads and scheduler threads.
+	Connections are opened lazily up to 'size', and keep their prepared statement cache between uses.
+	A thread that already holds a connection (e.g. inside transaction()) gets the same one back,
+	so nested helpers share one connection and one commit.
+	Tables written inside a transaction are recorded with touch(), and every function in 'listeners'
+	is called with them once the transaction commits.
+	'''
+	def __init__(self, path, size = 4, timeout = 30, cached_statements = 256):
+		self.path = path
+		self.size = size
+		self.timeout = timeout
+		self.cached_statements = cached_statements
+		self._idle = queue.LifoQueue()
+		self._opened = 0
+		self._all = []
+		self._lock = threading.Lock()
+		self._local = threading.local()
+		self.listeners = []
+
+	def _connect(self):
+		conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+			cached_statements=self.cached_statements)
+		conn.execute('pragma journal_mode = wal')
+		conn.execute('pragma synchronous = normal')
+		return conn
+
+	def _acquire(self):
+		try:
+			return self._idle.get_nowait()
+		except queue.Empty:
+			pass
+		with self._lock:
+			if self._opened < self.size:
+				self._opened += 1
+				try:
+					conn = self._connect()
+				except Exception:
+					self._opened -= 1
+					raise
+				self._all.append(conn)
+				return conn
+		return self._idle.get(timeout=self.timeout)
+
+	def _release(self, conn):
+		if conn.in_transaction:
+			conn.rollback()
+		self._idle.put(conn)
+
+	@contextmanager
+	def connection(self):
+		'''
+		Checks a connection out of the pool for the duration of the with block.
+		'''
+		held = getattr(self._local, 'conn', None)
+		if held is not None:
+			yield held
+			return
+		conn = self._acquire()
+		self._local.conn = conn
+		try:
+			yield conn
+		finally:
+			self._local.conn = None
+			self._release(conn)
+
+	@contextmanager
+	def transaction(self):
+		'''
+		Runs the with block as one transaction. Commits on success, rolls back on error.
+		Nested transactions join the outermost one.
+		'''
+		with self.connection() as conn:
+			if getattr(self._local, 'in_transaction', False):
+				yield conn
+				return
+			self._local.in_transaction = True
+			self._local.touched = set()
+			try:
+				yield conn
+				conn.commit()
+			except BaseException:
+				conn.rollback()
+				raise
+			finally:
+				self._local.in_transaction = False
+			for listener in self.listeners:
+				try:
+					listener(self._local.touched)
+				except Exception as e:
+					print(f'Ran into an error while notifying a commit listener\ntraceback:\n{traceback.print_exception(e)}')
+
+	def touch(self, *tables):
+		'''
+		Records tables written by the current transaction. Ignored outside of transaction().
+		'''
+		if getattr(self._local, 'in_transaction', False):
+			self._local.touched.update(tables)
+
+	def close(self):
+		'''
+		Closes every connection opened by the pool.
+		'''
+		with self._lock:
+			for conn in self._all:
+				conn.close()
+			self._all = []
+			self._opened = 0
+			self._idle = queue.LifoQueue()
+
+	def after_fork(self):
+		'''
+		Forgets the connections opened before a fork, so a forked worker (e.g. gunicorn --preload) opens its own.
+		SQLite handles can't be used on both sides of a fork, and closing them in the child can release the parent's
+		locks, so they're kept referenced here and never touched again.
+		'''
+		self._inherited = getattr(self, '_inherited', []) + self._all
+		self._all = []
+		self._opened = 0
+		self._idle = queue.LifoQueue()
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+db = ConnectionPool(dbPath)
+atexit.register(db.close)
+#registered before the scheduler leader's hook, which may start using the DB right away
+os.register_at_fork(after_in_child=db.after_fork)
+
+#Tables and params added after the initial schema in database/app_data.sql. Created on startup if missing.
+schema = '''
+create table if not exists geocode_cache(
+	location text primary key,
+	latitude real not null,
+	longitude real not null,
+	"date" date not null,
+	"time" time not null
+	);
+
+create table if not exists telemetry(
+	metric text not null,
+	ts integer not null,
+	value real not null,
+	primary key (metric, ts)
+	) without rowid;
+
+create table if not exists telemetry_hourly(
+	metric text not null,
+	ts integer not null,
+	min real not null,
+	avg real not null,
+	max real not null,
+	count integer not null,
+	primary key (metric, ts)
+	) without rowid;
+
+create table if not exists telemetry_daily(
+	metric text not null,
+	ts integer not null,
+	min real not null,
+	avg real not null,
+	max real not null,
+	count integer not null,
+	primary key (metric, ts)
+	) without rowid;
+
+create table if not exists gardens(
+	id integer primary key,
+	name text not null unique,
+	enabled boolean not null default 1,
+	api_city text,
+	api_state text,
+	api_country text,
+	latitude real,
+	longitude real,
+	pump_pin tinyint not null check (pump_pin >= 0 and pump_pin <= 40),
+	valve_enable_pin tinyint not null check (valve_enable_pin >= 0 and valve_enable_pin <= 40),
+	valve_open_pin tinyint not null check (valve_open_pin >= 0 and valve_open_pin <= 40),
+	valve_close_pin tinyint not null check (valve_close_pin >= 0 and valve_close_pin <= 40),
+	water_schedule_hour tinyint not null default 11 check (water_schedule_hour >= 0 and water_schedule_hour <= 23),
+	water_time int not null default 10,
+	delay_before int not null default 1,
+	delay_after int not null default 1,
+	use_api boolean not null default 1,
+	last_rain int not null default 0,
+	"date" date not null default (date('now')),
+	"time" time not null default (time('now'))
+	);
+
+create table if not exists scheduler_jobs(
+	id text primary key,
+	next_run_time real,
+	job_state blob not null
+	);
+create index if not exists scheduler_jobs_next_run_time on scheduler_jobs(next_run_time);
+
+create table if not exists log_entries(
+	id integer primary key,
+	ts integer not null,
+	"date" date not null,
+	"time" time not null,
+	message text not null
+	);
+create index if not exists log_entries_ts on log_entries(ts);
+create virtual table if not exists log_search using fts5(message, content='log_entries', content_rowid='id');
+create trigger if not exists log_entries_search_insert after insert on log_entries
+begin
+	insert into log_search (rowid, message) values (new.id, new.message);
+end;
+create trigger if not exists log_entries_search_delete after delete on log_entries
+begin
+	insert into log_search (log_search, rowid, message) values ('delete', old.id, old.message);
+end;
+create trigger if not exists log_entries_retention after insert on log_entries
+begin
+	delete from log_entries where id <= new.id - (select val_num from system_params where param = 'log_max_entries');
+end;
+
+create table if not exists live_events(
+	id integer primary key,
+	ts integer not null,
+	event text not null,
+	data text not null
+	);
+create trigger if not exists live_events_retention after insert on live_events
+begin
+	delete from live_events where id <= new.id - 500;
+end;
+
+create table if not exists water_jobs(
+	id text primary key,
+	name text not null,
+	args text not null,
+	status text not null,
+	submitted text not null,
+	started text,
+	finished text,
+	error text,
+	pid integer
+	);
+
+create table if not exists watering_events(
+	id integer primary key,
+	garden_id integer default null references gardens(id),
+	trigger text not null,
+	outcome text not null,
+	reason text,
+	started integer not null,
+	ended integer not null,
+	duration real not null,
+	water_seconds real not null default 0,
+	rain_avg real,
+	rain_any_above boolean,
+	last_rain int
+	);
+create index if not exists watering_events_started on watering_events(started);
+create table if not exists watering_event_crops(
+	event_id integer not null references watering_events(id),
+	crop_id integer not null,
+	crop text not null,
+	primary key (event_id, crop_id)
+	) without rowid;
+create table if not exists crop_water_daily(
+	"day" date not null,
+	crop_id integer not null,
+	crop text not null,
+	cycles integer not null,
+	seconds real not null,
+	primary key ("day", crop_id)
+	) without rowid;
+create table if not exists crop_water_monthly(
+	"month" text not null,
+	crop_id integer not null,
+	crop text not null,
+	cycles integer not null,
+	seconds real not null,
+	primary key ("month", crop_id)
+	) without rowid;
+create trigger if not exists watering_event_crops_rollup after insert on watering_event_crops
+begin
+	insert into crop_water_daily ("day", crop_id, crop, cycles, seconds)
+	select date(e.started, 'unixepoch', 'localtime'), new.crop_id, new.crop, 1, e.water_seconds
+	from watering_events e where e.id = new.event_id
+	on conflict ("day", crop_id) do update set cycles = cycles + 1, seconds = seconds + excluded.seconds, crop = excluded.crop;
+	insert into crop_water_monthly ("month", crop_id, crop, cycles, seconds)
+	select strftime('%Y-%m', e.started, 'unixepoch', 'localtime'), new.crop_id, new.crop, 1, e.water_seconds
+	from watering_events e where e.id = new.event_id
+	on conflict ("month", crop_id) do update set cycles = cycles + 1, seconds = seconds + excluded.seconds, crop = excluded.crop;
+end;
+
+insert or ignore into system_params (param, val_num) values ('forecast_ttl', 900);
+insert or ignore into system_params (param, val_num) values ('temp_sample_seconds', 60);
+insert or ignore into system_params (param, val_num) values ('bcrypt_rounds', 12);
+insert or ignore into system_params (param, val_num) values ('log_max_entries', 100000);
+insert or ignore into system_params (param, val_num) values ('log_cleared_id', 0);
+'''
+
+#Crops of gardens other than the main one have a garden_id, and max_crops applies per garden
+cropGardens = '''
+alter table crops add column garden_id integer default null references gardens(id);
+create index if not exists crops_garden on crops(garden_id);
+drop trigger if exists enforce_max_crops;
+create trigger enforce_max_crops after insert on crops
+when (select count(*) from crops where garden_id is new.garden_id) > (select val_num from system_params where param = 'max_crops')
+begin
+	delete from crops
+	where id in (select id from crops where garden_id is new.garden_id order by "date" desc, "time" desc, id asc limit 1);
+end;
+'''
 
-scheduler = BackgroundScheduler()
-scheduler.start()
-atexit.register(lambda: scheduler.shutdown())
+#The 30 and 60 entry water_log tables are replaced by log_entries, which keeps 'log_max_entries' messages.
+#Messages in both old tables are only copied once.
+logEntries = '''
+insert into log_entries (ts, "date", "time", message)
+select cast(strftime('%s', "date" || ' ' || substr("time", 1, 8), 'utc') as integer), "date", "time", message
+from (select "date", "time", message from water_log_60 union select "date", "time", message from water_log)
+order by "date", "time";
+drop trigger if exists max_log_entries;
+drop trigger if exists max_log_entries_60;
+drop table water_log;
+drop table water_log_60;
+'''
 
-GPIO.setmode(GPIO.BCM)
+#The 12 entry system_temp table is replaced by the cpu_temp telemetry series. Its 'MM/DD/YYYY' dates and
+#'45.3°F' temps (in fahrenheit only if api_units was imperial, whatever the label) are converted to epoch seconds
+#and celsius, and rolled up too, since rollupTelemetry() only rolls up hours newer than the last rolled up one.
+systemTemp = '''
+create temp table old_temps as
+select cast(strftime('%s', substr("date", 7, 4) || '-' || substr("date", 1, 2) || '-' || substr("date", 4, 2) || ' ' || "time", 'utc') as integer) as ts,
+	case when (select lower(val_string) from system_params where param = 'api_units') = 'imperial'
+		then round((cast(rtrim(temp, '°FC') as real) - 32) / 1.8, 2)
+		else cast(rtrim(temp, '°FC') as real) end as value
+from system_temp;
+insert or ignore into telemetry (metric, ts, value)
+select 'cpu_temp', ts, value from old_temps where ts is not null;
+insert or ignore into telemetry_hourly (metric, ts, min, avg, max, count)
+select 'cpu_temp', ts - ts % 3600, min(value), avg(value), max(value), count(*) from old_temps where ts is not null group by ts - ts % 3600;
+insert or ignore into telemetry_daily (metric, ts, min, avg, max, count)
+select 'cpu_temp', cast(strftime('%s', date(ts, 'unixepoch', 'localtime'), 'utc') as integer) as day, min(value), avg(value), max(value), count(*)
+from old_temps where ts is not null group by day;
+drop table old_temps;
+drop trigger if exists max_temp_entries;
+drop table system_temp;
+'''
+
+def init_db():
+	'''
+	Creates any tables, columns, and params missing from an existing DB.
+	'''
+	with db.connection() as conn:
+		conn.executescript(schema)
+		if 'garden_id' not in [row[1] for row in conn.execute('pragma table_info(crops)')]:
+			conn.executescript(cropGardens)
+		if conn.execute("select 1 from sqlite_master where type = 'table' and name = 'water_log'").fetchone():
+			conn.executescript(logEntries)
+		if conn.execute("select 1 from sqlite_master where type = 'table' and name = 'system_temp'").fetchone():
+			conn.executescript(systemTemp)
+		if 'pid' not in [row[1] for row in conn.execute('pragma table_info(water_jobs)')]:
+			conn.execute('alter table water_jobs add column pid integer')
+
+#functions skipped when finding where a statement was ran from
+sql_helpers = ('recordSql', 'sqlSelectQuery', 'sqlModifyQuery', 'sqlModifyMany')
+
+def recordSql(kind, began, query):
+	'''
+	Counts a statement that started at perf_counter() 'began', for /metrics and the request it ran in,
+	and traces it with its call site if the request is being profiled.
+	'''
+	elapsed = time.perf_counter() - began
+	sql_statements.inc(kind)
+	sql_seconds.inc(kind, amount=elapsed)
+	stats = getattr(request_stats, 'sql', None)
+	if stats is not None:
+		stats[0] += 1
+		stats[1] += elapsed
+	profile = getattr(request_stats, 'profile', None)
+	if profile is not None:
+		profile.statement(kind, query, elapsed, profiler.callSite(sys._getframe(1), sql_helpers))
 
 def sqlSelectQuery(query, query_params = None, fetchall = False):
 	'''
 	Gets result of an SQL select query from the SQLite DB
 	'''
-	conn = sqlite3.connect(dbPath)
-	cur = conn.cursor()
-	if query_params is not None:
-		cur.execute(query, query_params)
-	else:
-		cur.execute(query)
-	result = None
-	if fetchall:
-		result = cur.fetchall()
-	else:
-		result = cur.fetchone()
-	conn.close()
-	return result
+	began = time.perf_counter()
+	try:
+		with db.connection() as conn:
+			cur = conn.execute(query, query_params or ())
+			if fetchall:
+				return cur.fetchall()
+			return cur.fetchone()
+	finally:
+		recordSql('select', began, query)
+
+#table written by an insert, replace, update, or delete statement
+modifiedTable = re.compile(r'^\s*(?:insert(?:\s+or\s+\w+)?\s+into|replace\s+into|update(?:\s+or\s+\w+)?|delete\s+from)\s+["`\[]?(\w+)', re.IGNORECASE)
+
+def touchQuery(query):
+	'''
+	Records the table modified by 'query' on the current transaction, so cached pages built from it are dropped.
+	'''
+	match = modifiedTable.match(query)
+	if match:
+		db.touch(match.group(1).lower())
 
 def sqlModifyQuery(query, query_params = None):
 	'''
 	Modifyies or inserts a record into SQLite DB table
+	Joins the caller's transaction if one is open, otherwise commits right away.
 	'''
-	conn = sqlite3.connect(dbPath)
-	cur = conn.cursor()
-	if query_params is not None:
-		cur.execute(query, query_params)
-	else:
-		cur.execute(query)
-	conn.commit()
-	conn.close()
+	began = time.perf_counter()
+	try:
+		with db.transaction() as conn:
+			conn.execute(query, query_params or ())
+			touchQuery(query)
+	finally:
+		recordSql('modify', began, query)
+
+def sqlModifyMany(query, seq_of_params):
+	'''
+	Runs the same modify statement for every set of params in one transaction.
+	'''
+	began = time.perf_counter()
+	try:
+		with db.transaction() as conn:
+			conn.executemany(query, seq_of_params)
+			touchQuery(query)
+	finally:
+		recordSql('modify', began, query)
+
+class SystemParams:
+	'''
+	Process wide cache of the system_params table.
+	The whole table is loaded with one query, and each value is returned typed from whichever of
+	val_bool, val_num, or val_string is set for that param. Writes go through set(), which updates
+	the DB and the cache together. The cache reloads itself after 'max_age' seconds so changes made
+	by other processes are picked up.
+	'''
+	def __init__(self, max_age = 300):
+		self.max_age = max_age
+		self._values = None
+		self._loaded = 0
+		self._lock = threading.Lock()
+
+	def _typed(self, val_string, val_num, val_bool):
+		if val_bool is not None:
+			return bool(val_bool)
+		elif val_num is not None:
+			return val_num
+		return val_string
+
+	def load(self):
+		'''
+		Loads all system params from the DB in a single query.
+		Watering calls it before reading params, since another process may have changed them since they were cached.
+		'''
+		rows = sqlSelectQuery('select param, val_string, val_num, val_bool from system_params', fetchall=True)
+		values = {row[0]: self._typed(row[1], row[2], row[3]) for row in rows}
+		with self._lock:
+			self._values = values
+			self._loaded = time.monotonic()
+		return values
+
+	def invalidate(self):
+		'''
+		Drops the cached values. They are reloaded on the next read.
+		'''
+		with self._lock:
+			self._values = None
+
+	def all(self):
+		values = self._values
+		if values is None or time.monotonic() - self._loaded > self.max_age:
+			values = self.load()
+		return values
+
+	def get(self, param, default = None):
+		return self.all().get(param, default)
+
+	def __getitem__(self, param):
+		return self.all()[param]
+
+	def _columns(self, value):
+		'''
+		Returns (val_string, val_num, val_bool) for 'value', with the columns its type doesn't go in set to null,
+		so a value stored under another type before can't shadow it.
+		'''
+		if isinstance(value, bool):
+			return None, None, value
+		elif isinstance(value, (int, float)):
+			return None, value, None
+		return value, None, None
+
+	def set(self, param, value):
+		'''
+		Writes a param to the DB, and updates the cached value.
+		The column written is picked by the type of 'value'.
+		'''
+		sqlModifyQuery('update system_params set val_string = ?, val_num = ?, val_bool = ? where param = ?', (*self._columns(value), param))
+		with self._lock:
+			if self._values is not None:
+				self._values[param] = value
+
+	def set_many(self, values):
+		'''
+		Writes several params in one transaction with one upsert statement, and updates the cache.
+		Joins the caller's transaction if one is open. The cache is dropped if the write fails.
+		'''
+		#id isn't an integer primary key, so SQLite won't pick one. The random default can collide, the next id can't.
+		try:
+			with db.transaction():
+				sqlModifyMany('''insert into system_params (id, param, val_string, val_num, val_bool)
+					values ((select coalesce(max(id), 999) + 1 from system_params), ?, ?, ?, ?)
+					on conflict(param) do update set val_string = excluded.val_string, val_num = excluded.val_num, val_bool = excluded.val_bool''',
+					[(param, *self._columns(value)) for param, value in values.items()])
+		except BaseException:
+			self.invalidate()
+			raise
+		with self._lock:
+			if self._values is not None:
+				self._values.update(values)
+
+sys_params = SystemParams()
+
+class FragmentCache:
+	'''
+	Rendered HTML of page sections, keyed by name (and an optional key, e.g. which log is shown).
+	Each fragment lists the tables it is built from. A version is kept per table and bumped by invalidate(),
+	which runs after every committed write to that table, and a fragment is re-rendered once any of its
+	tables' versions moved. Writes from other processes aren't seen, so fragments also expire after 'max_age' seconds.
+	'''
+	def __init__(self, max_age = 60):
+		self.max_age = max_age
+		self._entries = {}
+		self._versions = {}
+		self._lock = threading.Lock()
+
+	def invalidate(self, tables):
+		with self._lock:
+			for table in tables:
+				self._versions[table] = self._versions.get(table, 0) + 1
+
+	def clear(self):
+		with self._lock:
+			self._entries = {}
+
+	def get(self, name, tables, render, key = ()):
+		'''
+		Returns the cached HTML for the fragment, calling 'render' only if it is missing or one of 'tables' changed.
+		'''
+		now = time.monotonic()
+		with self._lock:
+			#taken before rendering, so a write that lands mid-render still invalidates the result
+			versions = tuple(self._versions.get(table, 0) for table in tables)
+			entry = self._entries.get((name, key))
+		if entry is not None and entry[1] == versions and now - entry[2] < self.max_age:
+			return entry[0]
+		html = render()
+		with self._lock:
+			self._entries[(name, key)] = (html, versions, now)
+		return html
+
+fragments = FragmentCache()
+db.listeners.append(fragments.invalidate)
+
+class SQLiteJobStore(BaseJobStore):
+	'''
+	APScheduler job store that keeps jobs in the scheduler_jobs table, pickled the same way as APScheduler's
+	SQLAlchemyJobStore, so next run times survive restarts and moving to another leader process.
+	Jobs that can't be restored (e.g. their function was renamed) are deleted.
+	'''
+	def __init__(self, pickle_protocol = pickle.HIGHEST_PROTOCOL):
+		super().__init__()
+		self.pickle_protocol = pickle_protocol
+
+	def lookup_job(self, job_id):
+		row = sqlSelectQuery('select job_state from scheduler_jobs where id = ?', (job_id,))
+		return self._reconstitute_job(row[0]) if row else None
+
+	def get_due_jobs(self, now):
+		return self._get_jobs('where next_run_time <= ?', (datetime_to_utc_timestamp(now),))
+
+	def get_next_run_time(self):
+		row = sqlSelectQuery('select min(next_run_time) from scheduler_jobs where next_run_time is not null')
+		return utc_timestamp_to_datetime(row[0]) if row and row[0] is not None else None
+
+	def get_all_jobs(self):
+		jobs = self._get_jobs()
+		self._fix_paused_jobs_sorting(jobs)
+		return jobs
+
+	def add_job(self, job):
+		try:
+			sqlModifyQuery('insert into scheduler_jobs (id, next_run_time, job_state) values (?, ?, ?)',
+				(job.id, datetime_to_utc_timestamp(job.next_run_time), pickle.dumps(job.__getstate__(), self.pickle_protocol)))
+		except sqlite3.IntegrityError:
+			raise ConflictingIdError(job.id)
+
+	def update_job(self, job):
+		with db.transaction() as conn:
+			cur = conn.execute('update scheduler_jobs set next_run_time = ?, job_state = ? where id = ?',
+				(datetime_to_utc_timestamp(job.next_run_time), pickle.dumps(job.__getstate__(), self.pickle_protocol), job.id))
+			db.touch('scheduler_jobs')
+			if cur.rowcount == 0:
+				raise JobLookupError(job.id)
+
+	def remove_job(self, job_id):
+		with db.transaction() as conn:
+			cur = conn.execute('delete from scheduler_jobs where id = ?', (job_id,))
+			db.touch('scheduler_jobs')
+			if cur.rowcount == 0:
+				raise JobLookupError(job_id)
+
+	def remove_all_jobs(self):
+		sqlModifyQuery('delete from scheduler_jobs')
+
+	def _reconstitute_job(self, job_state):
+		job_state = pickle.loads(job_state)
+		job_state['jobstore'] = self
+		job = Job.__new__(Job)
+		job.__setstate__(job_state)
+		job._scheduler = self._scheduler
+		job._jobstore_alias = self._alias
+		return job
+
+	def _get_jobs(self, where = '', query_params = ()):
+		jobs = []
+		failed = []
+		for job_id, job_state in sqlSelectQuery(f'select id, job_state from scheduler_jobs {where} order by next_run_time',
+				query_params, fetchall=True):
+			try:
+				jobs.append(self._reconstitute_job(job_state))
+			except Exception as e:
+				print(f'Unable to restore job "{job_id}", removing it\ntraceback:\n{traceback.print_exception(e)}')
+				failed.append((job_id,))
+		if failed:
+			sqlModifyMany('delete from scheduler_jobs where id = ?', failed)
+		return jobs
+
+#Scheduled jobs are persisted, and only ran by the process that holds the scheduler lock (see SchedulerLeader).
+#Missed runs are coalesced into one, and are still ran if they are less than a job's misfire_grace_time late.
+scheduler = BackgroundScheduler(jobstores={'default': SQLiteJobStore()},
+	job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 60})
+atexit.register(lambda: scheduler.shutdown() if scheduler.running else None)
+
+scheduler.add_listener(lambda event: job_misfires.inc(event.job_id), EVENT_JOB_MISSED)
+
+def timedJob(job_id):
+	'''
+	Decorator for scheduled job functions that records how long each run took, and whether it raised, for /metrics.
+	The wrapped function keeps its name, so the job store still finds it by reference.
+	'''
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			began = time.perf_counter()
+			result = 'error'
+			try:
+				value = func(*args, **kwargs)
+				result = 'ok'
+				return value
+			finally:
+				job_duration.observe(time.perf_counter() - began, job_id)
+				job_runs.inc(job_id, result)
+		return wrapper
+	return decorator
+
+class SchedulerLeader:
+	'''
+	Elects one process, out of all the WSGI workers using the same DB, to run the scheduled jobs.
+	The leader holds an exclusive flock on 'path'. The OS drops the lock when the leader exits or dies,
+	and every other process tries to take it every 'retry' seconds, so leadership fails over on its own.
+	'on_elected' is called once this process becomes the leader.
+	'''
+	def __init__(self, path, on_elected, retry = 15):
+		self.path = path
+		self.on_elected = on_elected
+		self.retry = retry
+		self.leader = False
+		self._file = None
+		self._thread = None
+		self._lock = threading.Lock()
+
+	def try_acquire(self):
+		with self._lock:
+			if self.leader:
+				return True
+			f = open(self.path, 'a+')
+			try:
+				fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except OSError:
+				f.close()
+				return False
+			f.seek(0)
+			f.truncate()
+			f.write(f'{os.getpid()}\n')
+			f.flush()
+			self._file = f
+			self.leader = True
+		print(f'Process {os.getpid()} is now the scheduler leader')
+		self.on_elected()
+		return True
+
+	def _wait(self):
+		while not self.try_acquire():
+			time.sleep(self.retry)
+
+	def start(self):
+		'''
+		Becomes the leader right away if no other process is, otherwise keeps trying in the background.
+		'''
+		if not self.try_acquire() and (self._thread is None or not self._thread.is_alive()):
+			self._thread = threading.Thread(target=self._wait, name='scheduler-leader', daemon=True)
+			self._thread.start()
+
+	def after_fork(self):
+		#a forked worker inherits the open lock file, but not the scheduler thread, so it has to win its own election
+		if self._file is not None:
+			self._file.close()
+		self._file = None
+		self.leader = False
+		self._thread = None
+		self._lock = threading.Lock()
+		self.start()
+
+class BackgroundThread:
+	'''
+	Daemon thread running 'target' for one of the app's background workers.
+	Threads don't survive a fork, and WSGI servers may fork worker processes after this module is imported, so
+	workers call start() whenever they're used instead of once at import. It starts the thread if there isn't one
+	running in this process yet, or if it died.
+	'''
+	def __init__(self, target, name):
+		self.target = target
+		self.name = name
+		self._thread = None
+		self._pid = None
+		self._lock = threading.Lock()
+		#the lock may have been held by another thread when the process forked
+		os.register_at_fork(after_in_child=self._after_fork)
+
+	def _after_fork(self):
+		self._lock = threading.Lock()
+
+	def running(self):
+		return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+	def start(self):
+		with self._lock:
+			if not self.running():
+				self._thread = threading.Thread(target=self.target, name=self.name, daemon=True)
+				self._pid = os.getpid()
+				self._thread.start()
+
+	def join(self, timeout = None):
+		if self.running() and self._thread is not threading.current_thread():
+			self._thread.join(timeout)
+
+class EventBroadcaster:
+	'''
+	Fans events out to every connected /api/events client, in every app process.
+	publish() queues an event, and one background thread per process writes queued events to the live_events table every
+	'poll' seconds, then reads back every event written since its last read (by any process) and puts each on every
+	subscriber's bounded queue. Events get their ids from the table, so a client reconnecting to any process can catch up
+	from Last-Event-ID, and events published by the scheduler leader reach clients of every worker.
+	publish_local() skips the table, for events every process publishes on its own (CPU temperature samples).
+	A subscriber that falls too far behind is dropped. At most 'max_subscribers' clients are subscribed at once.
+	Only the relay thread queries the DB. The lock is held just to swap the outbox and subscribers and to fan out,
+	so publish() never waits on SQLite.
+	'''
+	def __init__(self, queue_size = 100, history = 50, max_subscribers = 8, poll = 0.5):
+		self.queue_size = queue_size
+		self.history = history
+		self.max_subscribers = max_subscribers
+		self.poll = poll
+		self._subscribers = set()
+		#Last-Event-ID of each new subscriber's queue. The relay thread puts the events it missed on it, then moves it to _subscribers.
+		self._joining = {}
+		self._outbox = []
+		#id of the newest event put on the subscriber queues, None while nobody is subscribed. Only used by the relay thread.
+		self._last_id = None
+		self._relay = BackgroundThread(self._run, 'event-relay')
+		self._stop = threading.Event()
+		self._lock = threading.Lock()
+
+	def _start(self):
+		if not self._stop.is_set():
+			self._relay.start()
+
+	def _run(self):
+		while not self._stop.wait(self.poll):
+			try:
+				self.relay()
+			except Exception as e:
+				print(f'Ran into an error while relaying events\ntraceback:\n{traceback.print_exception(e)}')
+
+	def close(self):
+		'''
+		Stops the relay thread, after writing any queued events.
+		'''
+		self._stop.set()
+		self._relay.join()
+		with self._lock:
+			outbox, self._outbox = self._outbox, []
+		if outbox:
+			sqlModifyMany('insert into live_events (ts, event, data) values (?, ?, ?)', outbox)
+
+	def _fanout(self, message):
+		for q in list(self._subscribers):
+			try:
+				q.put_nowait(message)
+			except queue.Full:
+				self._subscribers.discard(q)
+
+	def relay(self):
+		'''
+		Writes queued events to live_events, and hands events written since the last relay to this process's subscribers.
+		'''
+		with self._lock:
+			outbox, self._outbox = self._outbox, []
+			joining = list(self._joining.items())
+			subscribed = bool(self._subscribers or joining)
+		if outbox:
+			sqlModifyMany('insert into live_events (ts, event, data) values (?, ?, ?)', outbox)
+		if not subscribed:
+			self._last_id = None
+			return
+		if self._last_id is None:
+			self._last_id = sqlSelectQuery('select coalesce(max(id), 0) from live_events')[0]
+		for q, last_id in joining:
+			if last_id is not None:
+				rows = sqlSelectQuery('select id, event, data from live_events where id > ? and id <= ? order by id desc limit ?',
+					(last_id, self._last_id, self.history), fetchall=True)
+				for event_id, event, data in reversed(rows):
+					try:
+						q.put_nowait((event_id, event, json.loads(data)))
+					except queue.Full:
+						break
+		rows = sqlSelectQuery('select id, event, data from live_events where id > ? order by id', (self._last_id,), fetchall=True)
+		messages = [(event_id, event, json.loads(data)) for event_id, event, data in rows]
+		with self._lock:
+			for q, _ in joining:
+				if q in self._joining:
+					del self._joining[q]
+					self._subscribers.add(q)
+			for message in messages:
+				self._fanout(message)
+		if rows:
+			self._last_id = rows[-1][0]
+
+	def publish(self, event, data):
+		with self._lock:
+			self._outbox.append((int(time.time()), event, json.dumps(data)))
+		self._start()
+
+	def publish_local(self, event, data):
+		with self._lock:
+			self._fanout((None, event, data))
+
+	def subscribe(self, last_id = None):
+		'''
+		Returns a queue that receives every published event, starting with up to 'history' kept events after 'last_id'
+		(put on it by the next relay). Returns None if 'max_subscribers' clients are already subscribed.
+		'''
+		self._start()
+		q = queue.Queue(maxsize=self.queue_size)
+		with self._lock:
+			if len(self._subscribers) + len(self._joining) >= self.max_subscribers:
+				return None
+			self._joining[q] = last_id
+		return q
+
+	def unsubscribe(self, q):
+		with self._lock:
+			self._subscribers.discard(q)
+			self._joining.pop(q, None)
+
+	def subscribed(self, q):
+		with self._lock:
+			return q in self._subscribers or q in self._joining
+
+events = EventBroadcaster()
+atexit.register(events.close)
+
+def publishEvent(event, **data):
+	'''
+	Pushes an event to live /api/events clients. Errors are printed, not raised, so they can't interrupt a watering cycle.
+	'''
+	try:
+		data['at'] = datetime.now().isoformat(timespec='seconds')
+		events.publish(event, data)
+	except Exception as e:
+		print(f'Ran into an error while publishing {event} event\ntraceback:\n{traceback.print_exception(e)}')
+
+class LogWriter:
+	'''
+	Writes log messages to log_entries from a background thread.
+	Messages are timestamped and queued by write(), then written in batches of up to 'batch_size'
+	with one transaction per batch, so callers never wait on SQLite.
+	flush() blocks until everything queued has been written. close() flushes and stops the thread.
+	'''
+	def __init__(self, batch_size = 100, linger = 0.1):
+		self.batch_size = batch_size
+		self.linger = linger
+		self._queue = queue.Queue()
+		self._writer = BackgroundThread(self._run, 'log-writer')
+		self._closed = False
+
+	def write(self, message):
+		now = datetime.now()
+		log = (int(now.timestamp()), str(now.date()), str(now.time()), message)
+		publishEvent('log', date=log[1], time=log[2][:8], message=message)
+		if self._closed:
+			self._write([log])
+			return
+		self._queue.put(log)
+		self._writer.start()
+
+	def _run(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				self._queue.task_done()
+				return
+			batch = [item]
+			stop = False
+			deadline = time.monotonic() + self.linger
+			while len(batch) < self.batch_size:
+				try:
+					item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+				except queue.Empty:
+					break
+				if item is None:
+					stop = True
+					break
+				batch.append(item)
+			self._write(batch)
+			for _ in range(len(batch) + stop):
+				self._queue.task_done()
+			if stop:
+				return
+
+	def _write(self, batch):
+		try:
+			sqlModifyMany('insert into log_entries (ts, "date", "time", message) values (?, ?, ?, ?)', batch)
+		except Exception as e:
+			print(f'Ran into an error while writing {len(batch)} log messages\ntraceback:\n{traceback.print_exception(e)}')
+
+	def flush(self):
+		'''
+		Blocks until every queued message has been written.
+		'''
+		if self._writer.running():
+			self._queue.join()
+
+	def close(self):
+		'''
+		Writes anything still queued, and stops the writer thread. Later messages are written synchronously.
+		'''
+		self._closed = True
+		if self._writer.running():
+			self._queue.put(None)
+			self._writer.join(timeout=10)
+
+log_writer = LogWriter()
+atexit.register(log_writer.close)
 
 def insertLogMessage(message):
 	'''
-	Inserts the same log message into 30 day log and read-only 60 day log
+	Queues a message for the water log.
+	The background log writer inserts it, so this never blocks on the DB.
+	'''
+	log_writer.write(message)
+
+class CircuitOpen(Exception):
+	'''
+	Raised instead of calling an upstream whose circuit breaker is open.
 	'''
-	log = (str(date.today()), str(datetime.now().time()), message)
-	sqlModifyQuery(f'insert into water_log ("date", "time", message) values {log}')
-	sqlModifyQuery(f'insert into water_log_60 ("date", "time", message) values {log}')
 
-def getCoordinates(): 
+class CircuitBreaker:
 	'''
-	Gets latitude and longitude of the location configured on the system
+	Stops calling an upstream after 'threshold' failed calls in a row. While open, calls fail right away with CircuitOpen.
+	After 'reset_timeout' seconds one trial call is let through (half open). If it succeeds the breaker closes,
+	otherwise it opens again.
+	'''
+	def __init__(self, name, threshold = 3, reset_timeout = 60):
+		self.name = name
+		self.threshold = threshold
+		self.reset_timeout = reset_timeout
+		self.failures = 0
+		self.opened = None
+		self._trial = False
+		self._lock = threading.Lock()
+
+	@property
+	def state(self):
+		if self.opened is None:
+			return 'closed'
+		return 'half_open' if self._trial else 'open'
+
+	def before(self):
+		with self._lock:
+			if self.opened is None:
+				return
+			wait = self.reset_timeout - (time.monotonic() - self.opened)
+			if wait > 0 or self._trial:
+				raise CircuitOpen(f'{self.name} is failing, not calling it for another {max(wait, 0):.0f}s')
+			self._trial = True
+
+	def success(self):
+		with self._lock:
+			self.failures = 0
+			self.opened = None
+			self._trial = False
+
+	def failure(self):
+		with self._lock:
+			self.failures += 1
+			if self._trial or self.failures >= self.threshold:
+				if self.opened is None or self._trial:
+					print(f'Circuit breaker for {self.name} opened after {self.failures} failures')
+				self.opened = time.monotonic()
+				self._trial = False
+
+class HttpClient:
+	'''
+	Shared HTTP client for calls to outside APIs.
+	One requests.Session keeps connections to each host alive between calls, and asks for gzip compressed responses.
+	Every request has connect and read timeouts. Connection errors, timeouts, 429s, and 5xx responses are retried
+	up to 'retries' times with jittered exponential backoff, as long as the call stays within 'deadline' seconds.
+	Each upstream has its own CircuitBreaker, so one that keeps failing costs callers nothing until it recovers.
+	'''
+	def __init__(self, timeout = (3.05, 10), retries = 2, backoff = 0.5, max_backoff = 4, deadline = 20, pool_size = 8):
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.deadline = deadline
+		self.session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
+		#requests already sends Accept-Encoding: gzip, deflate
+		self.session.headers['User-Agent'] = f'raspi_gardenbot/{__version__}'
+		self.breakers = {}
+		self._lock = threading.Lock()
+
+	def breaker(self, upstream):
+		with self._lock:
+			if upstream not in self.breakers:
+				self.breakers[upstream] = CircuitBreaker(upstream)
+			return self.breakers[upstream]
+
+	def _delay(self, attempt, response):
+		#full jitter, so retrying clients don't hit the upstream in step
+		delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+		retry_after = response.headers.get('Retry-After') if response is not None else None
+		if retry_after and retry_after.isdigit():
+			delay = max(delay, min(int(retry_after), self.max_backoff))
+		return delay
+
+	def get(self, url, upstream, params = None):
+		'''
+		GETs 'url', retrying transient failures. 'upstream' names the circuit breaker the call counts against.
+		Returns the response, which can still be a 4xx other than 429. Raises CircuitOpen if the breaker is open,
+		or the last error once retries are used up.
+		'''
+		breaker = self.breaker(upstream)
+		try:
+			breaker.before()
+		except CircuitOpen:
+			upstream_errors.inc(upstream, 'circuit_open')
+			raise
+		began = time.monotonic()
+		try:
+			for attempt in range(self.retries + 1):
+				response = None
+				try:
+					response = self.session.get(url, params=params, timeout=self.timeout)
+					if response.status_code == 429 or response.status_code >= 500:
+						raise requests.HTTPError(f'{response.status_code} from {upstream}', response=response)
+					breaker.success()
+					return response
+				except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+					error = e
+					delay = self._delay(attempt, response)
+					if attempt == self.retries or time.monotonic() - began + delay > self.deadline:
+						break
+					time.sleep(delay)
+				except Exception as e:
+					#not retried (e.g. too many redirects, or a broken body), but the breaker still has to hear about it,
+					#or a half open breaker would wait on its trial call forever
+					breaker.failure()
+					upstream_errors.inc(upstream, type(e).__name__)
+					raise
+			breaker.failure()
+			#timeouts are also ConnectionErrors when connecting, so they're checked first
+			upstream_errors.inc(upstream, 'timeout' if isinstance(error, requests.Timeout)
+				else 'connection' if isinstance(error, requests.ConnectionError) else str(error.response.status_code))
+			raise error
+		finally:
+			upstream_latency.observe(time.monotonic() - began, upstream)
+
+	def close(self):
+		self.session.close()
+
+http = HttpClient()
+atexit.register(http.close)
+
+#Nominatim's usage policy allows at most 1 request per second
+geocode_interval = 1.0
+geocode_lock = threading.Lock()
+geocode_last = 0
+
+def geocode(query):
+	'''
+	Looks up the latitude and longitude of 'query' with Nominatim. Raises ValueError if nothing matched.
+	'''
+	global geocode_last
+	with geocode_lock:
+		wait = geocode_last + geocode_interval - time.monotonic()
+		if wait > 0:
+			time.sleep(wait)
+		try:
+			response = http.get(geocode_api_base, 'nominatim', params={'q': query, 'format': 'json', 'limit': 1})
+		finally:
+			geocode_last = time.monotonic()
+	response.raise_for_status()
+	results = response.json()
+	if not results:
+		raise ValueError(f'No location found for {query}')
+	return float(results[0]['lat']), float(results[0]['lon'])
+
+def locationKey(city, state, country):
+	'''
+	Normalized location string used as the geocode cache key.
+	'''
+	return ', '.join(' '.join(str(part or '').split()).lower() for part in (city, state, country))
+
+def getCoordinates(city = None, state = None, country = None):
+	'''
+	Gets latitude and longitude of a location, by default the one configured on the system.
+	Results are stored in the geocode_cache table keyed by the normalized location, so Nominatim
+	is only called again after api_city/api_state/api_country change.
 	'''
 	try: 
-		geolocator = Nominatim( user_agent='raspi_gardenbot')
-
-		city = sqlSelectQuery("select val_string from system_params where param = ?", ("api_city",))[0]
-		state = sqlSelectQuery("select val_string from system_params where param = ?", ("api_state",))[0]
-		country = sqlSelectQuery("select val_string from system_params where param = ?", ("api_country",))[0]
-		
-		location = geolocator.geocode(f'{city}, {state}, {country}', timeout=60)
-		
-		return location.latitude, location.longitude
+		if city is None:
+			city = sys_params['api_city']
+			state = sys_params['api_state']
+			country = sys_params['api_country']
+		key = locationKey(city, state, country)
+
+		if key in coordinates:
+			return coordinates[key]
+		cached = sqlSelectQuery('select latitude, longitude from geocode_cache where location = ?', (key,))
+		if cached:
+			coordinates[key] = cached
+			return cached
+
+		latitude, longitude = geocode(f'{city}, {state}, {country}')
+		now = datetime.now()
+		sqlModifyQuery('insert or replace into geocode_cache (location, latitude, longitude, "date", "time") values (?, ?, ?, ?, ?)',
+			(key, latitude, longitude, str(now.date()), now.strftime('%H:%M:%S')))
+		coordinates[key] = (latitude, longitude)
+		return coordinates[key]
 	except Exception as e:
-		print(f'Ran into an error while running getCoordinates()\ntraceback:\n{traceback.print_exception(e)}')
+		print(f'Ran into an error while running getCoordinates() for {city}, {state}, {country}\ntraceback:\n{traceback.print_exception(e)}')
 		return None
 
-def get_forecast(current = True, hourly = True, daily = True):
+class ForecastCache:
+	'''
+	TTL cache for Open-Meteo responses, keyed by (coordinates, forecast_days, timezone, units, sections).
+	Callers that miss the same key at the same time share one in-flight fetch (single-flight).
+	get_many() fetches every missing key of a batch with one call to 'batch_loader', which takes a list of keys
+	and returns {key: data}. refresh() re-fetches entries close to expiring the same way, so page loads are served from memory.
+	Every process refreshes its own entries from a background thread, every 'refresh_seconds'.
+	If a fetch fails the last good response is kept and returned. 'on_update' is called after each successful fetch.
+	'''
+	def __init__(self, ttl, batch_loader, refresh_ahead = 0.8, idle = 24 * 60 * 60, on_update = None, refresh_seconds = 60):
+		self.ttl = ttl
+		self.batch_loader = batch_loader
+		self.refresh_ahead = refresh_ahead
+		self.idle = idle
+		self.on_update = on_update
+		self.refresh_seconds = refresh_seconds
+		self._entries = {}
+		self._inflight = {}
+		self._lock = threading.Lock()
+		self._refresher = BackgroundThread(self._run, 'forecast-refresh')
+
+	def start(self):
+		self._refresher.start()
+
+	def _run(self):
+		while True:
+			time.sleep(self.refresh_seconds)
+			try:
+				self.refresh()
+			except Exception as e:
+				print(f'Ran into an error while refreshing forecasts\ntraceback:\n{traceback.print_exception(e)}')
+
+	def get(self, key, loader):
+		'''
+		Returns (data, age in seconds) for 'key', calling 'loader' only if the entry is missing or expired.
+		'''
+		self.start()
+		now = time.monotonic()
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				entry['used'] = now
+				if now - entry['fetched'] < self.ttl():
+					return entry['data'], now - entry['fetched']
+		return self._load(key, loader)
+
+	def _load(self, key, loader):
+		with self._lock:
+			flight = self._inflight.get(key)
+			leader = flight is None
+			if leader:
+				flight = self._inflight[key] = {'done': threading.Event(), 'error': None}
+		if leader:
+			try:
+				data = loader()
+				now = time.monotonic()
+				with self._lock:
+					self._entries[key] = {'data': data, 'fetched': now, 'used': now}
+				if self.on_update is not None:
+					self.on_update()
+			except Exception as e:
+				flight['error'] = e
+			finally:
+				with self._lock:
+					del self._inflight[key]
+				flight['done'].set()
+		else:
+			flight['done'].wait()
+
+		with self._lock:
+			entry = self._entries.get(key)
+		if entry is None:
+			raise flight['error']
+		if flight['error'] is not None:
+			print(f'Forecast fetch failed, using cached forecast. error: {flight["error"]}')
+		return entry['data'], time.monotonic() - entry['fetched']
+
+	def get_many(self, keys):
+		'''
+		Returns {key: (data, age in seconds)} for 'keys'. Every missing or expired key is fetched with one batch_loader call.
+		Keys that failed to fetch and have no earlier response are left out.
+		'''
+		self.start()
+		now = time.monotonic()
+		results = {}
+		missing = []
+		with self._lock:
+			for key in keys:
+				entry = self._entries.get(key)
+				if entry is not None:
+					entry['used'] = now
+					if now - entry['fetched'] < self.ttl():
+						results[key] = (entry['data'], now - entry['fetched'])
+						continue
+				missing.append(key)
+		if missing:
+			self._fetch_many(missing)
+			now = time.monotonic()
+			with self._lock:
+				for key in missing:
+					entry = self._entries.get(key)
+					if entry is not None:
+						results[key] = (entry['data'], now - entry['fetched'])
+		return results
+
+	def _fetch_many(self, keys):
+		try:
+			fetched = self.batch_loader(keys)
+		except Exception as e:
+			print(f'Forecast fetch failed for {len(keys)} locations, using cached forecasts. error: {e}')
+			return
+		now = time.monotonic()
+		with self._lock:
+			for key, data in fetched.items():
+				used = self._entries[key]['used'] if key in self._entries else now
+				self._entries[key] = {'data': data, 'fetched': now, 'used': used}
+		if fetched and self.on_update is not None:
+			self.on_update()
+
+	def refresh(self):
+		'''
+		Re-fetches entries that are close to expiring, batched. Entries that haven't been read for 'idle' seconds are dropped.
+		'''
+		now = time.monotonic()
+		with self._lock:
+			for key in [k for k, e in self._entries.items() if now - e['used'] > self.idle]:
+				del self._entries[key]
+			stale = [k for k, e in self._entries.items() if now - e['fetched'] >= self.ttl() * self.refresh_ahead]
+		if stale:
+			self._fetch_many(stale)
+
+#'forecast' isn't a table, but fragments built from the forecast are invalidated the same way
+forecast_cache = ForecastCache(ttl=lambda: sys_params.get('forecast_ttl', 15 * 60), batch_loader=lambda keys: fetchForecasts(keys),
+	on_update=lambda: fragments.invalidate(('forecast',)))
+#most locations sent to Open Meteo in one request
+forecast_batch_size = 100
+
+def fetch_forecast(latitude, longitude, forecast_days, timezone, units, current = True, hourly = True, daily = True):
 	'''
 	Sends GET request to Open Meteo to get the forcast.
+	'latitude' and 'longitude' can also be lists, to get the forecasts for many locations in one request.
+	Open Meteo then returns a list of forecasts, in the same order.
+	'''
+	if isinstance(latitude, (list, tuple)):
+		latitude = ','.join(str(value) for value in latitude)
+		longitude = ','.join(str(value) for value in longitude)
+	url = (f'{weather_api_base}?latitude={latitude}&longitude={longitude}&forecast_days={forecast_days}&timezone={timezone}')
+	if str(units).lower() == 'imperial':
+		url += f'&wind_speed_unit=mph&temperature_unit=fahrenheit&precipitation_unit=inch'
+	if current:
+		url += f'&current=temperature_2m,precipitation,rain,showers,snowfall,cloud_cover'
+	if hourly:
+		url += f'&hourly=temperature_2m,precipitation_probability,precipitation,cloud_cover'
+	if daily:
+		url += f'&daily=precipitation_probability_max'
+	response = http.get(url, 'open-meteo')
+	response.raise_for_status()
+
+	# print(f'API URL:\n{url}')
+	return response.json()
+
+def forecastKey(latitude, longitude, current = True, hourly = True, daily = True):
+	'''
+	Forecast cache key for a location, with the configured forecast days, timezone, and units.
+	'''
+	return (latitude, longitude, sys_params['api_forecast_days'], sys_params['api_timezone'],
+		str(sys_params['api_units']).lower(), current, hourly, daily)
+
+def fetchForecasts(keys):
+	'''
+	Fetches the forecasts for many forecast cache keys in as few Open Meteo requests as possible.
+	Keys that only differ by location are sent together, up to 'forecast_batch_size' locations per request.
+	Returns {key: forecast}.
+	'''
+	groups = {}
+	for key in keys:
+		groups.setdefault(key[2:], []).append(key)
+	forecasts = {}
+	for (forecast_days, timezone, units, current, hourly, daily), group in groups.items():
+		for i in range(0, len(group), forecast_batch_size):
+			batch = group[i:i + forecast_batch_size]
+			resp = fetch_forecast([key[0] for key in batch], [key[1] for key in batch], forecast_days, timezone, units,
+				current, hourly, daily)
+			if isinstance(resp, dict):
+				resp = [resp]
+			forecasts.update(zip(batch, resp))
+	return forecasts
+
+def get_forecast(current = True, hourly = True, daily = True, with_age = False):
+	'''
+	Gets the forecast for the configured location from the forecast cache, fetching from Open Meteo on a miss.
+	Returns (forecast, age in seconds) if 'with_age' is set.
 	'''
 	try:
 		latitude, longitude = getCoordinates()
 		# print(f'lat: {latitude}, long: {longitude}')
-		forecast_days = sqlSelectQuery("select val_num from system_params where param = ?", ("api_forecast_days",))[0]
-		timezone = sqlSelectQuery("select val_string from system_params where param = ?", ("api_timezone",))[0]
-		units = sqlSelectQuery("select val_string from system_params where param = ?", ("api_units",))[0]
-
-		url = (f'{weather_api_base}?latitude={latitude}&longitude={longitude}&forecast_days={forecast_days}&timezone={timezone}')
-		if str(units).lower() == 'imperial':
-			url += f'&wind_speed_unit=mph&temperature_unit=fahrenheit&precipitation_unit=inch'
-		if current:
-			url += f'&current=temperature_2m,precipitation,rain,showers,snowfall,cloud_cover'
-		if hourly:
-			url += f'&hourly=temperature_2m,precipitation_probability,precipitation,cloud_cover'
-		if daily:
-			url += f'&daily=precipitation_probability_max'
-		response = requests.request('GET', url)
-		
-		# print(f'API URL:\n{url}')
-		return response.json()
+		key = forecastKey(latitude, longitude, current, hourly, daily)
+		forecast, age = forecast_cache.get(key, lambda: fetchForecasts([key])[key])
+		return (forecast, age) if with_age else forecast
 	except Exception as e:
 		print(f'Ran into an error while running get_forecast()\ntraceback:\n{traceback.print_exception(e)}')
-		return None
+		return (None, None) if with_age else None
+
+
+def hourlyForecast(weather_resp, now, hours = 25):
+	'''
+	Gets the next 'hours' hourly forecast datapoints from 'now', with units, as used by water_on_schedule().
+	'''
+	hourly = []
+	for i in range(0, len(weather_resp['hourly']['time'])):
+		t = datetime.strptime(weather_resp['hourly']['time'][i], "%Y-%m-%dT%H:%M")
+		if t >= now and len(hourly) < hours:
+
+			hourly.append({
+				'date': t.date(),
+				'time': t.time(),
+				'temp': (f'{weather_resp["hourly"]["temperature_2m"][i]}'
+						f'{weather_resp["hourly_units"]["temperature_2m"]}'),
+				'cloud_cover': (f'{weather_resp["hourly"]["cloud_cover"][i]}'
+								f'{weather_resp["hourly_units"]["cloud_cover"]}'),
+				'precipitation_probability': (f'{weather_resp["hourly"]["precipitation_probability"][i]}'
+											f'{weather_resp["hourly_units"]["precipitation_probability"]}'),
+				'precipitation': (f'{weather_resp["hourly"]["precipitation"][i]} '
+								f'{weather_resp["hourly_units"]["precipitation"][:2]}')
+			})
+	return hourly
+
+def hourlyChartData(weather_resp, now, hours = 25):
+	'''
+	Gets the next 'hours' hourly forecast datapoints from 'now' as columns for the weather chart on the home page.
+	'''
+	hourly = {
+		'time': [],
+		'temp': [],
+		'cloud_cover': [],
+		'precipitation_probability': [],
+		'precipitation': []
+	}
+	for i in range(0, len(weather_resp['hourly']['time'])):
+		t = datetime.strptime(weather_resp['hourly']['time'][i], "%Y-%m-%dT%H:%M")
+		if t >= now and len(hourly['time']) < hours:
+			js_time = t.strftime('%d/%m %H:%M')
+			hourly['time'].append(js_time)
+			hourly['temp'].append(weather_resp["hourly"]["temperature_2m"][i])
+			hourly['cloud_cover'].append(weather_resp["hourly"]["cloud_cover"][i])
+			hourly['precipitation_probability'].append(weather_resp["hourly"]["precipitation_probability"][i])
+			hourly['precipitation'].append(weather_resp["hourly"]["precipitation"][i])
+	return hourly
+
+def rainChance(hourly):
+	'''
+	Gets average percent chance over the next 24 hours
+	If any percent chance is above 50%, set 'aboveFiddy' to 'true'
+	Returns (aboveFiddy, avgPercentRain) for the datapoints from hourlyForecast().
+	'''
+	return raindecision.rainChance([int(hour['precipitation_probability'][:-1]) for hour in hourly])
+
+def update_last_rain(increment, garden_id = None):
+	'''
+	Updates how long its been since the last rain in DB, for the main garden or the given garden
+	'''
+	if garden_id is None:
+		sys_params.set('last_rain', increment)
+	else:
+		sqlModifyQuery('update gardens set last_rain = ? where id = ?', (increment, garden_id))
 
+#Per garden settings. The main garden's come from system_params, the others' from the gardens table.
+gardenParams = ('api_city', 'api_state', 'api_country', 'pump_pin', 'valve_enable_pin', 'valve_open_pin', 'valve_close_pin',
+	'water_schedule_hour', 'water_time', 'delay_before', 'delay_after', 'use_api', 'last_rain')
 
-def update_last_rain(increment):
+def gardenList():
+	'''
+	Gets the settings of every garden: the main garden set up on the config page (id None),
+	then each enabled garden in the gardens table.
 	'''
-	Updates how long its been since the last rain in DB
+	gardens = [dict({param: sys_params[param] for param in gardenParams}, id=None, name='Main', latitude=None, longitude=None)]
+	rows = sqlSelectQuery(f'select id, name, latitude, longitude, {", ".join(gardenParams)} from gardens where enabled = 1 order by id',
+		fetchall=True)
+	for row in rows:
+		gardens.append(dict(zip(('id', 'name', 'latitude', 'longitude') + gardenParams, row)))
+	return gardens
+
+def gardenCoordinates(garden):
 	'''
-	update_tuple = (increment, 'last_rain')
-	sqlModifyQuery(f'update system_params set val_num = ? where param = ?', update_tuple)
+	Gets a garden's latitude and longitude, geocoding its city if they aren't set.
+	'''
+	if garden['latitude'] is not None and garden['longitude'] is not None:
+		return (garden['latitude'], garden['longitude'])
+	return getCoordinates(garden['api_city'], garden['api_state'], garden['api_country'])
 
+@timedJob('water_on_schedule')
 def water_on_schedule():
 	'''
-	Function to water crops on configured schedule.
+	Function to water crops on configured schedule. Runs at the top of every hour, and queues each garden whose
+	water_schedule_hour it is on the water executor, so the job returns right away even if watering them takes
+	longer than an hour. The forecasts for all of them are fetched together, in batched Open Meteo requests.
+	'''
+	now = clock.now()
+	try:
+		sys_params.load()
+		due = [garden for garden in gardenList() if int(garden['water_schedule_hour']) == now.hour]
+		if not due:
+			return
+		keys = []
+		for garden in due:
+			location = gardenCoordinates(garden)
+			keys.append(forecastKey(location[0], location[1], daily=False) if location else None)
+		forecasts = forecast_cache.get_many({key for key in keys if key is not None})
+
+		for garden, key in zip(due, keys):
+			forecast = forecasts.get(key)
+			water_executor.submit(waterGarden, garden, forecast[0] if forecast else None)
+	except Exception as e:
+		print(f'Ran into an error while running water_on_schedule() at {str(now)}\ntraceback:\n{traceback.print_exception(e)}')
+
+#[local date, seconds] the pump was on that day, in this process
+pump_today = [date.today(), 0.0]
+pump_today_lock = threading.Lock()
+
+def recordPumpOn(seconds):
+	pump_on_seconds.inc(amount=seconds)
+	with pump_today_lock:
+		if pump_today[0] != date.today():
+			pump_today[:] = [date.today(), 0.0]
+		pump_today[1] += seconds
+
+def pumpOnToday():
+	with pump_today_lock:
+		return pump_today[1] if pump_today[0] == date.today() else 0.0
+
+registry.gauge('gardenbot_pump_on_seconds_today', 'Seconds the pump was on since local midnight.', func=pumpOnToday)
+
+def wateringPhases(cycle, crops):
+	'''
+	Returns the on_phase callback for pins.water(), which publishes a watering cycle's phases to /api/events,
+	and adds the time from 'pump_on' to 'cleanup' (when the pump is switched off) to the pump on metrics.
+	'''
+	pumpOn = []
+
+	def phase(name):
+		if name == 'pump_on':
+			pumpOn.append(clock.monotonic())
+		elif name == 'cleanup' and pumpOn:
+			recordPumpOn(clock.monotonic() - pumpOn.pop())
+		if name == 'valves_open':
+			publishEvent('watering', cycle=cycle, phase=name, crops=crops)
+		else:
+			publishEvent('watering', cycle=cycle, phase=name)
+	return phase
+
+def recordWateringEvent(trigger, outcome, started, garden_id = None, crops = (), water_seconds = 0, reason = None,
+		decision = None, last_rain = None):
+	'''
+	Records one watering cycle in watering_events, ending now, and the crops it watered in watering_event_crops.
+	Inserting those crops adds them to the crop_water_daily and crop_water_monthly rollups (see watering_event_crops_rollup).
+	* trigger - 'schedule', 'all', or 'crop'
+	* outcome - 'watered', 'skipped', or 'failed', with the skip or failure 'reason'
+	* crops - crop rows (id, enabled, crop, pin, rain_inc) watered for 'water_seconds' each
+	* decision, last_rain - the raindecision.decide() result, and days since last rain it was made on
+	A cycle that can't be recorded is only printed, the watering itself already happened.
+	'''
+	ended = clock.now()
+	try:
+		with db.transaction() as conn:
+			cur = conn.execute('''insert into watering_events (garden_id, trigger, outcome, reason, started, ended, duration,
+				water_seconds, rain_avg, rain_any_above, last_rain) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+				(garden_id, trigger, outcome, reason, int(started.timestamp()), int(ended.timestamp()), (ended - started).total_seconds(),
+				water_seconds if crops else 0, decision['avgPercentRain'] if decision else None, decision['aboveFiddy'] if decision else None, last_rain))
+			conn.executemany('insert into watering_event_crops (event_id, crop_id, crop) values (?, ?, ?)',
+				[(cur.lastrowid, crop[0], crop[2]) for crop in crops])
+			db.touch('watering_events', 'watering_event_crops', 'crop_water_daily', 'crop_water_monthly')
+	except Exception as e:
+		print(f'Ran into an error while recording a {trigger} watering event\ntraceback:\n{traceback.print_exception(e)}')
+
+def waterGarden(garden, weather_resp, now = None):
+	'''
+	Waters one garden's crops on schedule, from the garden's settings and its forecast.
 	Contains logic to handle if API is used or simple rotation based on crop rain increment.
+	The forecast is read from 'now', by default the time the garden's watering starts.
 	'''
-	now = datetime.now()
+	#log messages of gardens other than the main one start with the garden's name
+	label = '' if garden['id'] is None else f'{garden["name"]}: '
+	started = clock.now()
+	now = now or started
 	try:
 		#Get forecast, and retreive values from DB
-		weather_resp = get_forecast(daily=False)
 		data = {
-			'use_api': bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('use_api',))[0]),
-			'last_rain': sqlSelectQuery('select val_num from system_params where param = ?', ('last_rain',))[0],
-			'pump_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('pump_pin',))[0],
-			'system_enable': bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('system_enable',))[0]),
-			'crop_data': sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops', fetchall=True),
-			'delay_after' : sqlSelectQuery('select val_num from system_params where param = ?', ('delay_after',))[0],
-			'delay_before' : sqlSelectQuery('select val_num from system_params where param = ?', ('delay_before',))[0],
-			'sysData': sqlSelectQuery('select * from system_temp', fetchall=True),
-			'valve_close_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('valve_close_pin',))[0],
-			'valve_enable_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('valve_enable_pin',))[0],
-			'valve_open_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('valve_open_pin',))[0],
-			'water_time' : sqlSelectQuery('select val_num from system_params where param = ?', ('water_time',))[0],
+			'use_api': garden['use_api'],
+			'last_rain': garden['last_rain'],
+			'pump_pin' : garden['pump_pin'],
+			#the system may have been disabled while this garden was queued
+			'system_enable': sys_params.load()['system_enable'],
+			'crop_data': sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops where garden_id is ?',
+				(garden['id'],), fetchall=True),
+			'delay_after' : garden['delay_after'],
+			'delay_before' : garden['delay_before'],
+			'valve_close_pin' : garden['valve_close_pin'],
+			'valve_enable_pin' : garden['valve_enable_pin'],
+			'valve_open_pin' : garden['valve_open_pin'],
+			'water_time' : garden['water_time'],
 			'weather': {
 				'units': {
 					'temp': f'{weather_resp["current_units"]["temperature_2m"]}',
@@ -178,136 +1723,287 @@ def water_on_schedule():
 			}
 		}
 
-		#Adds relevant forecast datapoints to 'data'.
-		#Adds next 24 hour predictions
-		for i in range(0, len(weather_resp['hourly']['time'])):
-			t = datetime.strptime(weather_resp['hourly']['time'][i], "%Y-%m-%dT%H:%M")
-			if t >= now and len(data['weather']['hourly']) < 25:
-
-				data['weather']['hourly'].append({
-					'date': t.date(),
-					'time': t.time(),
-					'temp': (f'{weather_resp["hourly"]["temperature_2m"][i]}'
-							f'{weather_resp["hourly_units"]["temperature_2m"]}'),
-					'cloud_cover': (f'{weather_resp["hourly"]["cloud_cover"][i]}'
-									f'{weather_resp["hourly_units"]["cloud_cover"]}'),
-					'precipitation_probability': (f'{weather_resp["hourly"]["precipitation_probability"][i]}'
-												f'{weather_resp["hourly_units"]["precipitation_probability"]}'),
-					'precipitation': (f'{weather_resp["hourly"]["precipitation"][i]} '
-									f'{weather_resp["hourly_units"]["precipitation"][:2]}')
-				})
-
-		#Setting variables for logic to determine if system will water crops
-		percentRain = 0
-		avgPercentRain = 0
-		aboveFiddy = False
-		
-		'''
-		Gets average percent chance over the next 24 hours
-		If any percent chance is above 50%, set 'aboveFiddy' to 'true'
-
-		100 / 24 = 4.16 <<<<<< this is the average percent chance value if 
-		there's only 1 hour with 100% chance.
-		'''
-		for hour in data['weather']['hourly']:
-			percentRain += int(hour['precipitation_probability'][:-1])
-			if int(hour['precipitation_probability'][:-1]) > 50:
-				aboveFiddy = True
-		if percentRain != 0 and len(data['weather']['hourly']) > 0:
-			avgPercentRain = percentRain / len(data['weather']['hourly'])
+		#Adds next 24 hour predictions, and decides whether to water on the chance of rain over them
+		data['weather']['hourly'] = hourlyForecast(weather_resp, now)
+		decision = raindecision.decide([int(hour['precipitation_probability'][:-1]) for hour in data['weather']['hourly']],
+			data['last_rain'], data['crop_data'], data['system_enable'], data['use_api'])
+		aboveFiddy, avgPercentRain = decision['aboveFiddy'], decision['avgPercentRain']
 
 		#perform, and log actions
-		if data['system_enable'] == False:
-			insertLogMessage("Did not water plants. Water system not enabled.")
+		if decision['action'] == 'disabled':
+			insertLogMessage(f"{label}Did not water plants. Water system not enabled.")
+			recordWateringEvent('schedule', 'skipped', started, garden['id'], reason='disabled', decision=decision, last_rain=data['last_rain'])
 
 		#if it rains: reset last-rained, and write to log
-		elif (aboveFiddy and avgPercentRain >= 4.16) or avgPercentRain > 50:
-			insertLogMessage(f'Did not water plants due to expected rain in the next 24 hours. '
+		elif decision['action'] == 'skip':
+			insertLogMessage(f'{label}Did not water plants due to expected rain in the next 24 hours. '
 							f'Any hour above 50%: {"Yes" if aboveFiddy else "No"}, ' 
 							f'Average Percent Chance: {round(avgPercentRain)}%.')
-			update_last_rain(0)
+			update_last_rain(decision['last_rain'], garden['id'])
+			recordWateringEvent('schedule', 'skipped', started, garden['id'], reason='rain', decision=decision, last_rain=data['last_rain'])
 
-		#If system is enabled, and API data is not in use OR if it does not rain: 
+		#If system is enabled, and it does not rain: 
 		#water crops based on interval
-		elif data['use_api'] == False or (not aboveFiddy and avgPercentRain < 4.16) or avgPercentRain <= 50:
-			update_last_rain(data["last_rain"] + 1)
-			line = "Watered crops(s): "
-
-			pump = data['pump_pin']
-			valve_enable_pin = data['valve_enable_pin']
-			valve_open_pin = data['valve_open_pin']
-			valve_close_pin = data['valve_close_pin']
-
-			#start watering
-			#setup pins for pump and solenoid controller power
-			GPIO.setup(pump, GPIO.OUT)
-			GPIO.setup(valve_enable_pin, GPIO.OUT)
-			GPIO.setup(valve_open_pin, GPIO.OUT)
-			GPIO.setup(valve_close_pin, GPIO.OUT)
-			valve = GPIO.PWM(valve_enable_pin, 100) #pin, and Hz
-
-			#turn on pump
-			GPIO.output(pump, GPIO.HIGH)
-			time.sleep(data['delay_before'])
-			for crop in data["crop_data"]:
-				if crop[4] <= data["last_rain"] and data["last_rain"] % crop[4] == 0 and crop[1]:
-					GPIO.setup(crop[3], GPIO.OUT)
-					GPIO.output(crop[3], GPIO.LOW)
-					line += f"\"{crop[2]}\", "
-			valve.start(100) #duty cycle
-			GPIO.output(valve_open_pin, GPIO.LOW)
-			GPIO.output(valve_close_pin, GPIO.HIGH)
-			time.sleep(data['water_time'])
-
-			'''
-			end watering
-			1. clean up pump output
-			2. wait for configured after water operation delay
-			3. clean up solenoid and relay output 
-			'''
-			GPIO.cleanup(pump)
-			time.sleep(data['delay_after'])
-			GPIO.cleanup(valve_enable_pin)
-			GPIO.cleanup(valve_open_pin)
-			GPIO.cleanup(valve_close_pin)
-			for crop in data['crop_data']:
-				if crop[4] <= data['last_rain'] and data['last_rain'] % crop[4] == 0 and crop[1]:
-					GPIO.cleanup(crop[3])
-					continue
-
-			#if API not in use and 30 days have passed, reset last rained
-			if data['use_api'] == False and data['last_rain'] == 30:
-				update_last_rain(0)
-
-			#prepare to write log message to 30 day, and 60 day log files
+		else:
+			update_last_rain(decision['last_rain'], garden['id'])
+			line = f"{label}Watered crops(s): "
+			cycle = 'schedule' if garden['id'] is None else f'schedule:{garden["name"]}'
+
+			for crop in decision['crops']:
+				line += f"\"{crop[2]}\", "
+			pins.water(data['pump_pin'], data['valve_enable_pin'], data['valve_open_pin'], data['valve_close_pin'],
+				[crop[3] for crop in decision['crops']], data['delay_before'], data['water_time'], data['delay_after'],
+				wateringPhases(cycle, [crop[2] for crop in decision['crops']]))
+			recordWateringEvent('schedule', 'watered', started, garden['id'], decision['crops'], data['water_time'],
+				decision=decision, last_rain=data['last_rain'])
+
+			#prepare to write log message
 			line = line[ : -2]
 			insertLogMessage(line)
-
-		#if get forecast operation returned erroneous
-		else:
-			update_last_rain(data["last_rain"] + 1)
-			insertLogMessage("An error occurred during watering operations.")
-		print(f'Ran water_on_schedule() at {str(now)}')
+			publishEvent('watering', cycle=cycle, phase='done')
+		print(f'Ran water_on_schedule() for the {garden["name"]} garden at {str(now)}')
 	except Exception as e:
-		print(f'Ran into an error while running water_on_schedule() at {str(now)}\ntraceback:\n{traceback.print_exception(e)}')
+		recordWateringEvent('schedule', 'failed', started, garden['id'], reason=f'{type(e).__name__}: {e}')
+		print(f'Ran into an error while running water_on_schedule() for the {garden["name"]} garden at {str(now)}\ntraceback:\n{traceback.print_exception(e)}')
+
+#How long each resolution of telemetry is kept, in seconds
+telemetry_retention = {
+	'raw': 2 * 24 * 60 * 60,
+	'hourly': 90 * 24 * 60 * 60,
+	'daily': 5 * 365 * 24 * 60 * 60
+}
 
-def get_system_temp():
+def recordTelemetry(metric, value, ts = None):
 	'''
-	Gets current CPU temp
+	Stores one sample of a metric at epoch time 'ts' (now if not given).
 	'''
-	cpu = CPUTemperature()
-	now = datetime.now()
-	units = sqlSelectQuery("select val_string from system_params where param = ?", ("api_units",))[0]
+	ts = int(time.time()) if ts is None else int(ts)
+	sqlModifyQuery('insert or replace into telemetry (metric, ts, value) values (?, ?, ?)', (metric, ts, value))
 
-	temp = round(cpu.temperature, 1)
+@timedJob('rollup_telemetry')
+def rollupTelemetry(now = None):
+	'''
+	Rolls raw telemetry up into hourly min/avg/max for every completed hour, and hourly into daily (local days).
+	Then prunes each resolution past its retention. Each run only aggregates what was added since the last run.
+	'''
+	now = int(time.time()) if now is None else int(now)
+	hour = now - now % 3600
+	#samples from the hour that just ended may still be waiting for the sampler's next flush
+	sampler.flush()
+	with db.transaction():
+		sqlModifyQuery('''insert or replace into telemetry_hourly (metric, ts, min, avg, max, count)
+			select t.metric, t.ts - t.ts % 3600, min(t.value), avg(t.value), max(t.value), count(*)
+			from telemetry t
+			where t.ts < ? and t.ts >= coalesce((select max(h.ts) + 3600 from telemetry_hourly h where h.metric = t.metric), 0)
+			group by t.metric, t.ts - t.ts % 3600''', (hour,))
+		#re-aggregate the local days touched by new hourly rows, today included
+		sqlModifyQuery('''insert or replace into telemetry_daily (metric, ts, min, avg, max, count)
+			select h.metric, cast(strftime('%s', date(h.ts, 'unixepoch', 'localtime'), 'utc') as integer) as day,
+				min(h.min), sum(h.avg * h.count) / sum(h.count), max(h.max), sum(h.count)
+			from telemetry_hourly h
+			where h.ts >= coalesce((select max(d.ts) from telemetry_daily d where d.metric = h.metric), 0)
+			group by h.metric, day''')
+		for table, key in (('telemetry', 'raw'), ('telemetry_hourly', 'hourly'), ('telemetry_daily', 'daily')):
+			sqlModifyQuery(f'delete from {table} where ts < ?', (now - telemetry_retention[key],))
+
+def telemetrySeries(metric, start, end, max_points = 500):
+	'''
+	Gets a metric between epoch times 'start' and 'end' from the finest resolution that covers the range
+	in at most 'max_points' points: raw samples, hourly rollups, or daily rollups.
+	Returns (resolution, rows), where rows are (ts, min, avg, max). Raw rows have min = avg = max.
+	'''
+	span = max(end - start, 1)
+	sample = max(sys_params.get('temp_sample_seconds', 60), 1)
+	if span / sample <= max_points and start >= time.time() - telemetry_retention['raw']:
+		#recent samples come from the sampler's buffer, which also has the ones not written to the DB yet
+		buffered, oldest = sampler.since(metric, start)
+		buffered = [(int(ts), value, value, value) for ts, value in buffered if ts <= end]
+		if oldest is not None and oldest <= start:
+			return 'raw', buffered
+		rows = sqlSelectQuery('''select ts, value, value, value from telemetry
+			where metric = ? and ts >= ? and ts <= ? order by ts''', (metric, start, end), fetchall=True)
+		last = rows[-1][0] if rows else start - 1
+		return 'raw', rows + [row for row in buffered if row[0] > last]
+	elif span / 3600 <= max_points:
+		#hours still in the raw table haven't been rolled up yet
+		rows = sqlSelectQuery('''select ts, min, avg, max from telemetry_hourly
+			where metric = ? and ts >= ? and ts <= ? order by ts''', (metric, start - start % 3600, end), fetchall=True)
+		since = rows[-1][0] + 3600 if rows else start - start % 3600
+		raw = sqlSelectQuery('''select ts, value from telemetry
+			where metric = ? and ts >= ? and ts <= ? order by ts''', (metric, since, end), fetchall=True)
+		#the newest samples are only in the sampler's buffer until its next flush (and only the leader flushes)
+		last = raw[-1][0] if raw else since - 1
+		raw += [(int(ts), value) for ts, value in sampler.since(metric, last + 1)[0] if ts <= end]
+		hours = {}
+		for ts, value in raw:
+			hours.setdefault(ts - ts % 3600, []).append(value)
+		rows += [(hour, min(values), sum(values) / len(values), max(values)) for hour, values in sorted(hours.items())]
+		return 'hourly', rows
+	return 'daily', sqlSelectQuery('''select ts, min, avg, max from telemetry_daily
+		where metric = ? and ts >= ? and ts <= ? order by ts''', (metric, start - 86400, end), fetchall=True)
+
+def celsiusTo(units, temp):
+	'''
+	Converts a celsius temperature to the configured api_units.
+	'''
 	if str(units).lower() == 'imperial':
-		temp = round((cpu.temperature * 1.8) + 32, 1) #convert CPU temperature from celsius to fahrenheit
+		return round((temp * 1.8) + 32, 1) #convert CPU temperature from celsius to fahrenheit
+	return round(temp, 1)
 
-	#Create tuple for temperature at the timestamp this script was ran.
-	temperature = (now.strftime("%m/%d/%Y"), now.strftime("%H:%M:%S"), f'{temp}°F')
-	
-	sqlModifyQuery(f'insert into system_temp ("date", "time", temp) values {temperature}')
-	print(f'Checked system temp at {str(now)}')
+class RingBuffer:
+	'''
+	Fixed size buffer of the last 'size' (ts, value) samples, kept in two preallocated arrays of doubles.
+	Appending overwrites the oldest sample, and never allocates.
+	'''
+	def __init__(self, size):
+		self.size = size
+		self.ts = array.array('d', bytes(8 * size))
+		self.values = array.array('d', bytes(8 * size))
+		self.count = 0
+		self.head = 0
+		self._lock = threading.Lock()
+
+	def append(self, ts, value):
+		with self._lock:
+			self.ts[self.head] = ts
+			self.values[self.head] = value
+			self.head = (self.head + 1) % self.size
+			self.count = min(self.count + 1, self.size)
+
+	def latest(self):
+		'''
+		Returns the newest (ts, value), or None if nothing was appended yet.
+		'''
+		with self._lock:
+			if not self.count:
+				return None
+			i = (self.head - 1) % self.size
+			return self.ts[i], self.values[i]
+
+	def since(self, start):
+		'''
+		Returns every (ts, value) with ts >= 'start', oldest first.
+		'''
+		with self._lock:
+			first = (self.head - self.count) % self.size
+			order = [(first + i) % self.size for i in range(self.count)]
+			return [(self.ts[i], self.values[i]) for i in order if self.ts[i] >= start]
+
+	def oldest(self):
+		with self._lock:
+			return self.ts[(self.head - self.count) % self.size] if self.count else None
+
+class TelemetrySampler:
+	'''
+	Reads every registered sensor from one background thread, every 'temp_sample_seconds' (DB value), into a RingBuffer
+	per metric. Pages and APIs read the buffers instead of the sensors.
+	Samples are written to the telemetry table in batches every 'flush_seconds', and only when 'persist()' is true,
+	so with several app processes only the scheduler leader writes them. Each sample is also passed to 'on_sample'.
+	'''
+	def __init__(self, size = 1440, flush_seconds = 300, persist = lambda: True, on_sample = None):
+		self.size = size
+		self.flush_seconds = flush_seconds
+		self.persist = persist
+		self.on_sample = on_sample
+		self.sensors = {}
+		self.buffers = {}
+		self._pending = []
+		self._pending_lock = threading.Lock()
+		self._flushed = time.monotonic()
+		self._sampler = BackgroundThread(self._run, 'telemetry-sampler')
+		self._stop = threading.Event()
+
+	def add(self, metric, sensor):
+		'''
+		Registers a sensor, anything with a read() method, whose readings are stored as 'metric'.
+		'''
+		self.sensors[metric] = sensor
+		self.buffers.setdefault(metric, RingBuffer(self.size))
+
+	def start(self):
+		if not self._stop.is_set():
+			self._sampler.start()
+
+	def _run(self):
+		while True:
+			self.sample()
+			if self._stop.wait(max(sys_params.get('temp_sample_seconds', 60), 1)):
+				return
+
+	def sample(self):
+		'''
+		Reads every sensor once, then flushes if 'flush_seconds' have passed since the last flush.
+		'''
+		ts = int(time.time())
+		for metric, sensor in list(self.sensors.items()):
+			began = time.perf_counter()
+			try:
+				value = round(float(sensor.read()), 2)
+			except Exception as e:
+				print(f'Ran into an error while reading the {metric} sensor\ntraceback:\n{traceback.print_exception(e)}')
+				continue
+			finally:
+				sensor_latency.observe(time.perf_counter() - began, metric)
+			self.buffers[metric].append(ts, value)
+			with self._pending_lock:
+				self._pending.append((metric, ts, value))
+			if self.on_sample:
+				self.on_sample(metric, ts, value)
+		if time.monotonic() - self._flushed >= self.flush_seconds:
+			self.flush()
+
+	def flush(self):
+		'''
+		Writes the samples taken since the last flush to the telemetry table, in one transaction.
+		'''
+		with self._pending_lock:
+			batch, self._pending = self._pending, []
+			self._flushed = time.monotonic()
+		if not batch or not self.persist():
+			return
+		try:
+			sqlModifyMany('insert or replace into telemetry (metric, ts, value) values (?, ?, ?)', batch)
+		except Exception as e:
+			print(f'Ran into an error while writing {len(batch)} telemetry samples\ntraceback:\n{traceback.print_exception(e)}')
+
+	def latest(self, metric):
+		'''
+		Returns the newest (ts, value) of 'metric', or None if it wasn't sampled yet.
+		'''
+		self.start()
+		buffer = self.buffers.get(metric)
+		return buffer.latest() if buffer else None
+
+	def since(self, metric, start):
+		'''
+		Returns the buffered (ts, value) samples of 'metric' from 'start' on, and the oldest buffered ts.
+		'''
+		self.start()
+		buffer = self.buffers.get(metric)
+		if buffer is None:
+			return [], None
+		return buffer.since(start), buffer.oldest()
+
+	def close(self):
+		self._stop.set()
+		self._sampler.join(timeout=5)
+		self.flush()
+
+def publishSample(metric, ts, value):
+	'''
+	Pushes a new sample to /api/events, and re-renders the page sections that show it.
+	'''
+	fragments.invalidate(('telemetry',))
+	if metric == 'cpu_temp':
+		units = sys_params['api_units']
+		#every process samples its own, so samples aren't relayed between processes
+		events.publish_local('cpu_temp', {'at': datetime.now().isoformat(timespec='seconds'), 'celsius': value,
+			'temp': celsiusTo(units, value), 'units': '°F' if str(units).lower() == 'imperial' else '°C'})
+
+#CPU temperature, in celsius. Fan and UPS sensors can be added with sampler.add()
+sampler = TelemetrySampler(persist=lambda: scheduler_leader.leader, on_sample=publishSample)
+sampler.add('cpu_temp', cpu_sensor)
+atexit.register(sampler.close)
 
 def getNavURL():
 	'''
@@ -330,18 +2026,114 @@ def getStyles():
 
 	return styles
 
-def make_hashbrowns(password):
+class HasherBusy(Exception):
 	'''
-	Hashes provided password when new user is created
+	Raised when too many password hashes are already queued.
 	'''
-	bytes = password.encode('utf-8')
-	salt = bcrypt.gensalt()
-	password_hash = bcrypt.hashpw(bytes, salt)
 
-	if bcrypt.checkpw(password.encode('utf-8'), password_hash):
-		return password_hash
-	else:
-		return None
+class PasswordHasher:
+	'''
+	Runs bcrypt hashing and verification on a small worker pool, so at most 'workers' hashes use the CPU at once,
+	no matter how many requests come in. At most 'max_pending' more can wait for a worker. Past that,
+	hash() and verify() raise HasherBusy right away instead of queueing, or once they've waited 'timeout' seconds.
+	New hashes use 'rounds()' as the cost factor. needs_upgrade() tells if a stored hash used a different cost.
+	'''
+	def __init__(self, rounds, workers = 2, max_pending = 8, timeout = 30):
+		self.rounds = rounds
+		self.timeout = timeout
+		self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+		self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+	def _run(self, func, *args):
+		if not self._slots.acquire(blocking=False):
+			raise HasherBusy('Too many password hashes queued')
+		try:
+			future = self._executor.submit(func, *args)
+		except Exception:
+			self._slots.release()
+			raise
+		future.add_done_callback(lambda f: self._slots.release())
+		try:
+			return future.result(timeout=self.timeout)
+		except FutureTimeout:
+			future.cancel()
+			raise HasherBusy(f'Password hash not done after {self.timeout}s')
+
+	def cost(self):
+		#bcrypt accepts 4 to 31
+		return min(max(int(self.rounds()), 4), 31)
+
+	def hash(self, password):
+		'''
+		Returns the bcrypt hash of 'password' as a string.
+		'''
+		return self._run(lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.cost()))).decode('utf-8')
+
+	def verify(self, password, password_hash):
+		return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+	def needs_upgrade(self, password_hash):
+		try:
+			return int(password_hash.split('$')[2]) != self.cost()
+		except (IndexError, ValueError):
+			return True
+
+	def shutdown(self):
+		self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher(rounds=lambda: sys_params.get('bcrypt_rounds', 12))
+atexit.register(password_hasher.shutdown)
+
+class LoginThrottle:
+	'''
+	Counts failed logins per key (a username or client IP) over the last 'window' seconds.
+	Once a key has 'max_failures' in the window, blocked() is True until the oldest failure ages out,
+	so a flood of guesses is turned away before any bcrypt work is done.
+	'''
+	def __init__(self, max_failures, window = 5 * 60, max_keys = 10000):
+		self.max_failures = max_failures
+		self.window = window
+		self.max_keys = max_keys
+		self._failures = {}
+		self._lock = threading.Lock()
+
+	def _recent(self, key, now):
+		failures = self._failures.get(key)
+		while failures and now - failures[0] > self.window:
+			failures.popleft()
+		if failures is not None and not failures:
+			del self._failures[key]
+			return None
+		return failures
+
+	def blocked(self, key):
+		with self._lock:
+			failures = self._recent(key, time.monotonic())
+			return failures is not None and len(failures) >= self.max_failures
+
+	def fail(self, key):
+		now = time.monotonic()
+		with self._lock:
+			if key not in self._failures and len(self._failures) >= self.max_keys:
+				#drop keys whose failures all aged out, then the oldest if still full
+				for old in list(self._failures):
+					self._recent(old, now)
+				if len(self._failures) >= self.max_keys:
+					del self._failures[next(iter(self._failures))]
+			self._failures.setdefault(key, deque(maxlen=self.max_failures)).append(now)
+
+	def reset(self, key):
+		with self._lock:
+			self._failures.pop(key, None)
+
+user_throttle = LoginThrottle(max_failures=5)
+ip_throttle = LoginThrottle(max_failures=20)
+
+def make_hashbrowns(password):
+	'''
+	Hashes provided password when new user is created, or a password is changed
+	'''
+	return password_hasher.hash(password)
 
 @app.route("/login", methods=['GET', 'POST'])
 def login():
@@ -351,20 +2143,40 @@ def login():
 	if request.method == 'POST':
 		username = request.form.get('username')
 		password = request.form.get('password')
+		client = request.remote_addr
+
+		if user_throttle.blocked(username) or ip_throttle.blocked(client):
+			flash('Too many failed logins. Try again in a few minutes.', 'danger')
+			return redirect(url_for('.login'))
 
 		user = sqlSelectQuery('select id, username, password_hash, priv_level from users where username = ?',
 		(username,))
 		if user:
-			stored_hash = user[2].encode('utf-8')
-			if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
+			try:
+				verified = password_hasher.verify(password, user[2])
+			except HasherBusy:
+				flash('Server is busy. Try again in a moment.', 'danger')
+				return redirect(url_for('.login'))
+
+			if verified:
+				user_throttle.reset(username)
+				if password_hasher.needs_upgrade(user[2]):
+					#re-hash with the configured cost while the plain password is at hand
+					try:
+						sqlModifyQuery('update users set password_hash = ? where id = ?', (make_hashbrowns(password), user[0]))
+					except Exception as e:
+						print(f'Ran into an error while upgrading the password hash for {user[1]}\ntraceback:\n{traceback.print_exception(e)}')
 				session['user'] = user[1]
 				session['priv_level'] = user[3]
 				flash('Login successful!', 'success')
 				return redirect(url_for('.index'))
 			else:
-		                flash('Incorrect password.', 'danger')
-               			return redirect(url_for('.login'))
+				user_throttle.fail(username)
+				ip_throttle.fail(client)
+				flash('Incorrect password.', 'danger')
+				return redirect(url_for('.login'))
 		else:
+			ip_throttle.fail(client)
 			flash('User not found.', 'danger')
 			return redirect(url_for('.login'))
 	else:
@@ -387,72 +2199,30 @@ def waterAll():
 	Waits for 'delay-after' seconds before closing the solenoids to each sector watered.
 	Writes log when finished. 
 	'''
+	started = clock.now()
 	try:
-		system_enable = bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('system_enable',))[0])
+		system_enable = sys_params.load()['system_enable']
 
 		if system_enable == False:
 			insertLogMessage("Did not perform water operation. Water system not enabled.")
+			recordWateringEvent('all', 'skipped', started, reason='disabled')
 		else:
-			#pins
-			pump = sqlSelectQuery('select val_num from system_params where param = ?', ('pump_pin',))[0]
-			valve_enable_pin = sqlSelectQuery('select val_num from system_params where param = ?', ('valve_enable_pin',))[0]
-			valve_open_pin = sqlSelectQuery('select val_num from system_params where param = ?', ('valve_open_pin',))[0]
-			valve_close_pin = sqlSelectQuery('select val_num from system_params where param = ?', ('valve_close_pin',))[0]
-
-			#timers
-			delay_before = sqlSelectQuery('select val_num from system_params where param = ?', ('delay_before',))[0]
-			delay_after = sqlSelectQuery('select val_num from system_params where param = ?', ('delay_after',))[0]
-			water_time = sqlSelectQuery('select val_num from system_params where param = ?', ('water_time',))[0]
-
 			#crops
-			cropData = sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops', fetchall=True)
-
-			#start watering
-			#setup pins for pump and solenoid controller power
-			GPIO.setup(pump, GPIO.OUT)
-			GPIO.setup(valve_enable_pin, GPIO.OUT)
-			GPIO.setup(valve_open_pin, GPIO.OUT)
-			GPIO.setup(valve_close_pin, GPIO.OUT)
-			main_valve = GPIO.PWM(valve_enable_pin, 100) #pin, and Hz
-
-			#turn on pump
-			GPIO.output(pump, GPIO.HIGH)
-
-			#open solenoids
-			time.sleep(delay_before)
-			for crop in cropData:
-				if bool(crop[1]) == True:
-					GPIO.setup(crop[3], GPIO.OUT)
-					GPIO.output(crop[3], GPIO.LOW)
-					continue
-			main_valve.start(100) #duty cycle
-			GPIO.output(valve_open_pin, GPIO.LOW)
-			GPIO.output(valve_close_pin, GPIO.HIGH)
+			cropData = [crop for crop in sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops where garden_id is null',
+				fetchall=True) if bool(crop[1]) == True]
 
-			time.sleep(water_time)
-			
-			# GPIO.output(valve_open_pin, GPIO.LOW)
-			# GPIO.output(valve_close_pin, GPIO.HIGH)
-			'''
-			end watering
-			1. clean up pump output
-			2. wait for configured after water operation delay
-			3. clean up solenoid and relay output 
-			'''
-			GPIO.cleanup(pump)
-			time.sleep(delay_after)
-			GPIO.cleanup(valve_enable_pin)
-			GPIO.cleanup(valve_open_pin)
-			GPIO.cleanup(valve_close_pin)
-			for crop in cropData:
-				if bool(crop[1]) == True:
-					GPIO.cleanup(crop[3])
-					continue
+			pins.water(sys_params['pump_pin'], sys_params['valve_enable_pin'], sys_params['valve_open_pin'], sys_params['valve_close_pin'],
+				[crop[3] for crop in cropData], sys_params['delay_before'], sys_params['water_time'], sys_params['delay_after'],
+				wateringPhases('all', [crop[2] for crop in cropData]))
+			recordWateringEvent('all', 'watered', started, crops=cropData, water_seconds=sys_params['water_time'])
 
 			#generate logs
 			insertLogMessage('Watered all sectors by manual override.')
+			publishEvent('watering', cycle='all', phase='done')
 	except Exception as e:
-		print(f'Ran into an error while running waterAll()\ntraceback:\n{traceback.print_exc(e)}')
+		recordWateringEvent('all', 'failed', started, reason=f'{type(e).__name__}: {e}')
+		print(f'Ran into an error while running waterAll()\ntraceback:\n{traceback.print_exception(e)}')
+		raise
 
 def waterNow(cropName):
 	'''
@@ -462,66 +2232,215 @@ def waterNow(cropName):
 	Waits for 'delay-after' seconds before closing the solenoids to each sector watered.
 	Writes log when finished.
 	'''
+	started = clock.now()
 	try:
-		system_enable = bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('system_enable',))[0])
+		system_enable = sys_params.load()['system_enable']
 
 		if system_enable == False:
 			insertLogMessage("Did not perform water operation. Water system not enabled.")
+			recordWateringEvent('crop', 'skipped', started, reason='disabled')
 		else:
-			#pins
-			pump = sqlSelectQuery('select val_num from system_params where param = ?', ('pump_pin',))[0]
-			valve_enable_pin = sqlSelectQuery('select val_num from system_params where param = ?', ('valve_enable_pin',))[0]
-			valve_open_pin = sqlSelectQuery('select val_num from system_params where param = ?', ('valve_open_pin',))[0]
-			valve_close_pin = sqlSelectQuery('select val_num from system_params where param = ?', ('valve_close_pin',))[0]
-
-			#timers
-			delay_before = sqlSelectQuery('select val_num from system_params where param = ?', ('delay_before',))[0]
-			delay_after = sqlSelectQuery('select val_num from system_params where param = ?', ('delay_after',))[0]
-			water_time = sqlSelectQuery('select val_num from system_params where param = ?', ('water_time',))[0]		
-
 			#crops 
-			cropData = sqlSelectQuery(f'select id, enabled, crop, pin, rain_inc from crops where crop = ?', (cropName,))
-
-			#start watering
-			#setup pins for pump and solenoid controller power
-			GPIO.setup(pump, GPIO.OUT)
-			GPIO.setup(valve_enable_pin, GPIO.OUT)
-			GPIO.setup(valve_open_pin, GPIO.OUT)
-			GPIO.setup(valve_close_pin, GPIO.OUT)
-			main_valve = GPIO.PWM(valve_enable_pin, 100) #pin, and Hz
-
-			#turn on pump
-			GPIO.output(pump, GPIO.HIGH)
-
-			#open and power solenoid
-			time.sleep(delay_before)
-			GPIO.setup(cropData[3], GPIO.OUT)
-			GPIO.output(cropData[3], GPIO.LOW)
-			main_valve.start(100) #duty cycle
-			GPIO.output(valve_open_pin, GPIO.LOW)
-			GPIO.output(valve_close_pin, GPIO.HIGH)
-
-			time.sleep(water_time)
-
-			# GPIO.output(valve_open_pin, GPIO.LOW)
-			# GPIO.output(valve_close_pin, GPIO.HIGH)
-			'''
-			end watering
-			1. clean up pump output
-			2. wait for configured after water operation delay
-			3. clean up solenoid and relay output 
-			'''
-			GPIO.cleanup(pump)
-			time.sleep(delay_after)
-			GPIO.cleanup(valve_enable_pin)
-			GPIO.cleanup(valve_open_pin)
-			GPIO.cleanup(valve_close_pin)
-			GPIO.cleanup(cropData[3])
+			cropData = sqlSelectQuery(f'select id, enabled, crop, pin, rain_inc from crops where crop = ? and garden_id is null', (cropName,))
+
+			pins.water(sys_params['pump_pin'], sys_params['valve_enable_pin'], sys_params['valve_open_pin'], sys_params['valve_close_pin'],
+				[cropData[3]], sys_params['delay_before'], sys_params['water_time'], sys_params['delay_after'],
+				wateringPhases('crop', [cropName]))
+			recordWateringEvent('crop', 'watered', started, crops=[cropData], water_seconds=sys_params['water_time'])
 
 			#generate logs
 			insertLogMessage(f'Watered sector "{cropName}" by manual override.')
+			publishEvent('watering', cycle='crop', phase='done')
+	except Exception as e:
+		recordWateringEvent('crop', 'failed', started, reason=f'{type(e).__name__}: {e}')
+		print(f'Ran into an error while running waterNow() for {cropName}\ntraceback:\n{traceback.print_exception(e)}')
+		raise
+
+#Manual and scheduled watering run on their own single worker, so overlapping runs queue up instead of fighting over
+#the pump, and request threads and the scheduler return right away.
+water_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='water')
+#Jobs are kept in the water_jobs table, with the pid of the process running them, so their status can be polled through any worker
+water_job_columns = ('id', 'name', 'args', 'status', 'submitted', 'started', 'finished', 'error')
+max_water_jobs = 50
+#ids of jobs this process queued that haven't started yet
+queued_water_jobs = set()
+
+def submitWaterJob(func, *args):
+	'''
+	Queues a manual watering function on the water executor.
+	Returns the job id, which can be polled at /api/water-jobs/<id>.
+	'''
+	job_id = uuid.uuid4().hex
+	now = lambda: datetime.now().isoformat(timespec='seconds')
+
+	def run():
+		queued_water_jobs.discard(job_id)
+		sqlModifyQuery("update water_jobs set status = 'running', started = ? where id = ?", (now(), job_id))
+		status, error = 'done', None
+		try:
+			func(*args)
+		except Exception as e:
+			status, error = 'failed', str(e)
+		finally:
+			sqlModifyQuery('update water_jobs set status = ?, error = ?, finished = ? where id = ?', (status, error, now(), job_id))
+
+	with db.transaction() as conn:
+		conn.execute("insert into water_jobs (id, name, args, status, submitted, pid) values (?, ?, ?, 'queued', ?, ?)",
+			(job_id, func.__name__, json.dumps(list(args)), now(), os.getpid()))
+		#forget the oldest finished jobs
+		conn.execute('delete from water_jobs where finished is not null and rowid not in '
+			'(select rowid from water_jobs order by rowid desc limit ?)', (max_water_jobs,))
+	queued_water_jobs.add(job_id)
+	water_executor.submit(run)
+	return job_id
+
+def processAlive(pid):
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+def orphaned(pid):
+	'''
+	True if a job left queued or running by process 'pid' never will finish, because that process is gone.
+	'''
+	return pid is None or (pid != os.getpid() and not processAlive(pid))
+
+def failOrphanedWaterJobs(pids = None):
+	'''
+	Marks jobs left queued or running by a process that has since died (e.g. killed mid-run) as failed,
+	so they aren't polled forever.
+	'''
+	if pids is None:
+		pids = [row[0] for row in sqlSelectQuery("select distinct pid from water_jobs where status in ('queued', 'running')", fetchall=True)]
+	for pid in pids:
+		if orphaned(pid):
+			sqlModifyQuery("update water_jobs set status = 'failed', error = ?, finished = ? where status in ('queued', 'running') and pid is ?",
+				('The process running it exited first', datetime.now().isoformat(timespec='seconds'), pid))
+
+def stopWaterJobs():
+	'''
+	Cancels the manual watering jobs still queued when this process exits, and marks them cancelled.
+	The one running is left to finish, and records its own status.
+	'''
+	water_executor.shutdown(wait=False, cancel_futures=True)
+	cancelled = list(queued_water_jobs)
+	if not cancelled:
+		return
+	try:
+		sqlModifyMany("update water_jobs set status = 'cancelled', finished = ? where id = ? and status = 'queued'",
+			[(datetime.now().isoformat(timespec='seconds'), job_id) for job_id in cancelled])
+	except Exception as e:
+		print(f'Ran into an error while cancelling water jobs\ntraceback:\n{traceback.print_exception(e)}')
+
+#atexit hooks only run after the interpreter has waited for the water worker to run its whole queue,
+#so this is registered with the hooks ran before that wait (the same ones concurrent.futures uses)
+threading._register_atexit(stopWaterJobs)
+
+@app.route("/api/water-jobs/<job_id>")
+def waterJobStatus(job_id):
+	'''
+	Returns the status of a manual watering job: queued, running, done, failed, or cancelled, with timestamps.
+	'''
+	if 'user' not in session:
+		return jsonify({'error': 'login required'}), 401
+
+	row = sqlSelectQuery(f'select {", ".join(water_job_columns)}, pid from water_jobs where id = ?', (job_id,))
+	if row is None:
+		return jsonify({'error': 'job not found'}), 404
+	*row, pid = row
+	job = dict(zip(water_job_columns, row))
+	if job['status'] in ('queued', 'running') and orphaned(pid):
+		failOrphanedWaterJobs([pid])
+		return waterJobStatus(job_id)
+	job['args'] = json.loads(job['args'])
+	return jsonify(job)
+
+def renderFragment(name, tables, template, context, key = ()):
+	'''
+	Renders a page section from the fragment cache. 'context' is a function returning the template's variables,
+	so its queries only run when the section has to be re-rendered after one of 'tables' was written.
+	'''
+	return fragments.get(name, tables, lambda: Markup(render_template(template, **context())), key)
+
+def weatherSummary():
+	'''
+	Gets the location, last rain, and current conditions shown above the weather chart on the home page.
+	The current conditions are as of the forecast's own observation time.
+	'''
+	data = {
+		'api_city': sys_params['api_city'],
+		'api_state': sys_params['api_state'],
+		'api_country': sys_params['api_country'],
+		'use_api': sys_params['use_api'],
+		'last_rain': sys_params['last_rain'],
+		'weather': {}
+	}
+	now = datetime.now()
+	try:
+		#Get weather data and set values for 'data'
+		weather_resp = get_forecast()
+		observed = datetime.strptime(weather_resp['current']['time'], "%Y-%m-%dT%H:%M")
+		data['weather'] = {
+			'units': {
+				'temp': f'{weather_resp["current_units"]["temperature_2m"]}',
+				'cloud_cover': f'{weather_resp["current_units"]["cloud_cover"]}',
+				'precipitation': f'{weather_resp["current_units"]["precipitation"][:2]}',
+				'precipitaion_probability_max': f'{weather_resp["daily_units"]["precipitation_probability_max"]}'
+			},
+			'current': {
+				'date': f'{observed.date()}',
+				'time': observed.strftime('%H:%M'),
+				'temp': f'{weather_resp["current"]["temperature_2m"]}{weather_resp["current_units"]["temperature_2m"]}',
+				'cloud_cover': f'{weather_resp["current"]["cloud_cover"]}{weather_resp["current_units"]["cloud_cover"]}',
+				'precipitation': f'{weather_resp["current"]["precipitation"]}{weather_resp["current_units"]["precipitation"][:2]}',
+				'precipitation_probability_max': ''
+			}
+		}
+
+		# Gets max % chance of rain for the day
+		for i in range(0, len(weather_resp['daily']['time'])):
+			t = datetime.strptime(weather_resp['daily']['time'][i], "%Y-%m-%d")
+			if t.date() == observed.date():
+				data['weather']['current']['precipitation_probability_max'] = (f'{weather_resp["daily"]["precipitation_probability_max"][i]}'
+																			f'{weather_resp["daily_units"]["precipitation_probability_max"]}')
+				break
+
 	except Exception as e:
-		print(f'Ran into an error while running waterNoe() for {cropName}\ntraceback:\n{traceback.print_exc(e)}')
+		print(f'Ran into an error while loading the weather summary at {str(now)}\ntraceback:\n{traceback.print_exception(e)}')
+		data['weather'] = {
+			'units': {
+				'temp': 'err',
+				'cloud_cover': 'err',
+				'precipitation': 'err',
+				'precipitaion_probability_max': 'err'
+			},
+			'current': {
+				'date': f'{now.date()}',
+				'time': f'{now.time()}'[:-7],
+				'temp': 'err',
+				'cloud_cover': 'err',
+				'precipitation': 'err',
+				'precipitation_probability_max': 'err'
+			}
+		}
+	return data
+
+def systemSummary():
+	'''
+	Gets the latest CPU temperature sample, in the configured units.
+	'''
+	units = sys_params['api_units']
+	latest = sampler.latest('cpu_temp')
+	if latest is None:
+		return {'time': 'N/A', 'temp': 'N/A'}
+	return {
+		'time': datetime.fromtimestamp(latest[0]).strftime('%H:%M'),
+		'temp': f'{celsiusTo(units, latest[1])}{"°F" if str(units).lower() == "imperial" else "°C"}'
+	}
 
 @app.route("/")
 @app.route("/index", methods=['GET', 'POST'])
@@ -529,7 +2448,8 @@ def index():
 	'''
 	Home page HTTP handling.
 	GET - loads/reloads the page.
-	POST - checks which water button was pressed, and waters the desired sectors accordingly. Redirects back to the home the page when done.
+	POST - checks which water button was pressed, and queues watering the desired sectors accordingly.
+	Redirects back to the home page right away, with the job id to poll.
 
 	Page contents: Weather data, system data, watering sector data, and manual override buttons for watering.
 	'''
@@ -544,130 +2464,383 @@ def index():
 			elif key == 'userSettings':
 				return userSettings()
 			elif key == 'waterAll':
-				waterAll()
+				return redirect(url_for('.index', job=submitWaterJob(waterAll)))
 			elif key.startswith('waterNow_'):
 				#Water individual crop
 				cropName = key.split('_')[1]
-				waterNow(cropName)
+				return redirect(url_for('.index', job=submitWaterJob(waterNow, cropName)))
 
 		return redirect(url_for('.index'))
 	else:
 		#Set vars for page GET request
 		navURL = getNavURL()
 		styles = getStyles()
-		now = datetime.now()
-		cpu = CPUTemperature()
-		temp = round((cpu.temperature * 1.8) + 32, 1) #display temperature in fahrenheit
-		
+		weather_resp, weather_age = get_forecast(with_age=True)
+
 		data = {
-			'api_city': sqlSelectQuery('select val_string from system_params where param = ?', ('api_city',))[0],
-			'api_state': sqlSelectQuery('select val_string from system_params where param = ?', ('api_state',))[0],
-			'api_country': sqlSelectQuery('select val_string from system_params where param = ?', ('api_country',))[0],
-			'use_api': bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('use_api',))[0]),
-			'last_rain': sqlSelectQuery('select val_num from system_params where param = ?', ('last_rain',))[0],
-			'system_enable': bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('system_enable',))[0]),
-			'cropData': sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops', fetchall=True),
-			# 'sysData': sqlSelectQuery('select * from system_temp', fetchall=True),
-			'sysData': {
-				'timestamp': [],
-				'temp': []
+			'weather': {
+				'age': int(weather_age // 60) if weather_age is not None else None
 			},
-			'weather': {},
-			'cpuTemp': {
-				'time': f'{now.strftime("%H:%M")}',
-				'temp': f'{temp}°F'
-			}
+			'waterJob': request.args.get('job')
 		}
+		#sections are rendered from the fragment cache, and only rebuilt after the tables they show change
+		pageFragments = {
+			'weather_summary': renderFragment('weather_summary', ('forecast', 'system_params'), 'fragments/weather_summary.html',
+				lambda: {'data': weatherSummary()}),
+			'crop_table': renderFragment('crop_table', ('crops', 'system_params'), 'fragments/crop_table.html',
+				lambda: {'data': {
+					'system_enable': sys_params['system_enable'],
+					'cropData': sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops where garden_id is null', fetchall=True)
+				}}),
+			'system_summary': renderFragment('system_summary', ('telemetry', 'system_params'), 'fragments/system_summary.html',
+				lambda: {'cpuTemp': systemSummary()})
+		}
+
+		#Weather and system temperature charts load their data from /api/weather and /api/system-temp
+		return render_template('index.html', navurl=navURL, styles=styles, session=session, data=data, fragments=pageFragments)
+
+def conditionalJSON(payload, last_modified = None):
+	'''
+	Returns 'payload' as compact JSON with an ETag (and Last-Modified if given).
+	Returns an empty 304 instead if the client sent a matching If-None-Match or If-Modified-Since.
+	'''
+	body = json.dumps(payload, separators=(',', ':'))
+	response = app.response_class(body, mimetype='application/json')
+	response.set_etag(hashlib.sha1(body.encode('utf-8')).hexdigest())
+	if last_modified is not None:
+		response.last_modified = last_modified
+	#let browsers keep it, but revalidate on every request
+	response.cache_control.no_cache = True
+	return response.make_conditional(request)
+
+@app.route("/api/weather")
+def apiWeather():
+	'''
+	Hourly forecast for the weather chart, as columns: time, temp, cloud_cover, precipitation_probability, precipitation.
+	'''
+	if 'user' not in session:
+		return jsonify({'error': 'login required'}), 401
+
+	now = datetime.now()
+	weather_resp, weather_age = get_forecast(with_age=True)
+	if weather_resp is None:
+		return jsonify({'error': 'forecast unavailable'}), 503
+
+	payload = {
+		'units': {
+			'temp': weather_resp['hourly_units']['temperature_2m'],
+			'cloud_cover': weather_resp['hourly_units']['cloud_cover'],
+			'precipitation_probability': weather_resp['hourly_units']['precipitation_probability'],
+			'precipitation': weather_resp['hourly_units']['precipitation'][:2]
+		},
+		'hourly': hourlyChartData(weather_resp, now)
+	}
+	#Last-Modified is when the forecast was fetched
+	return conditionalJSON(payload, datetime.fromtimestamp(time.time() - weather_age))
+
+@app.before_request
+def startRequestMetrics():
+	g.metrics_began = time.perf_counter()
+	request_stats.sql = [0, 0.0]
 
+@app.after_request
+def recordResponseStatus(response):
+	g.metrics_status = response.status_code
+	return response
+
+@app.teardown_request
+def recordRequestMetrics(exc):
+	'''
+	Records the request's latency, status, and time in the sql* helpers. Requests that raised count as 500s.
+	'''
+	began = g.pop('metrics_began', None)
+	stats, request_stats.sql = getattr(request_stats, 'sql', None), None
+	if began is None:
+		return
+	endpoint = request.endpoint or 'unmatched'
+	route_latency.observe(time.perf_counter() - began, endpoint, request.method)
+	route_requests.inc(endpoint, request.method, str(g.pop('metrics_status', 500)))
+	if stats is not None:
+		request_sql_statements.observe(stats[0], endpoint)
+		request_sql_seconds.observe(stats[1], endpoint)
+
+#Admins can profile a request by adding ?profile=<mode> or an X-Profile: <mode> header. Modes:
+#* 1 - the page is returned as usual, with X-Profile-Report and X-Profile-Stacks headers linking to the saved report
+#* json - the JSON summary is returned instead of the page
+#* folded - the flamegraph stacks are returned instead of the page
+profile_modes = ('1', 'json', 'folded')
+#saved under the cache dir, so any worker can serve a report
+profileDir = os.path.join(cacheDir, 'profiles')
+#seconds between stack samples
+profile_interval = 0.002
+#most recent reports kept
+profile_keep = 20
+
+@app.before_request
+def startProfile():
+	mode = request.args.get('profile') or request.headers.get('X-Profile')
+	if mode not in profile_modes or session.get('priv_level') != 1:
+		return
+	g.profile_mode = mode
+	g.profile_started = datetime.now()
+	g.profile = request_stats.profile = profiler.Profile(threading.get_ident(), profile_interval)
+	g.profile.start()
+
+def saveProfile(report, stacks):
+	'''
+	Writes a report's JSON summary and folded stacks to profileDir, and removes all but the newest profile_keep reports.
+	'''
+	os.makedirs(profileDir, exist_ok=True)
+	with open(os.path.join(profileDir, f"{report['id']}.json"), 'w') as f:
+		json.dump(report, f, indent=1)
+	with open(os.path.join(profileDir, f"{report['id']}.folded"), 'w') as f:
+		f.write(stacks)
+	saved = sorted(glob.glob(os.path.join(profileDir, '*.json')), key=os.path.getmtime)
+	for path in saved[:-profile_keep]:
+		for old in (path, path[:-len('.json')] + '.folded'):
+			try:
+				os.remove(old)
+			except OSError:
+				pass
+
+@app.after_request
+def finishProfile(response):
+	'''
+	Stops the request's profile, saves its report, and links it from the response or returns it in place of the page.
+	'''
+	profile = g.pop('profile', None)
+	if profile is None:
+		return response
+	request_stats.profile = None
+	profile.stop()
+	started = g.pop('profile_started')
+	report_id = f"{started.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-{uuid.uuid4().hex[:6]}"
+	report = profile.summary(id=report_id, endpoint=request.endpoint, method=request.method, path=request.full_path,
+		status=response.status_code, started=started.isoformat(timespec='seconds'),
+		report=url_for('profileReport', name=f'{report_id}.json'), stacks=url_for('profileReport', name=f'{report_id}.folded'))
+	stacks = profile.sampler.folded()
+	try:
+		saveProfile(report, stacks)
+	except OSError as e:
+		print(f'Ran into an error while saving profile {report_id}\ntraceback:\n{traceback.print_exception(e)}')
+	match g.pop('profile_mode'):
+		case 'json':
+			return Response(json.dumps(report, indent=1), mimetype='application/json',
+				headers={'Content-Disposition': f'attachment; filename={report_id}.json'})
+		case 'folded':
+			return Response(stacks, mimetype='text/plain',
+				headers={'Content-Disposition': f'attachment; filename={report_id}.folded'})
+	response.headers['X-Profile-Report'] = report['report']
+	response.headers['X-Profile-Stacks'] = report['stacks']
+	return response
+
+@app.teardown_request
+def stopProfile(exc):
+	#a request that raised never reaches finishProfile
+	profile = g.pop('profile', None)
+	request_stats.profile = None
+	if profile is not None:
+		profile.stop()
+
+@app.route("/admin/profiles")
+def profileList():
+	'''
+	Saved request profiles, newest first, with their time, SQL statements, and repeated statements.
+	'''
+	if session.get('priv_level') != 1:
+		return jsonify(error='Only admins can view profiles'), 403
+	reports = []
+	for path in sorted(glob.glob(os.path.join(profileDir, '*.json')), key=os.path.getmtime, reverse=True):
 		try:
-			#Get weather data and set values for 'data'
-			weather_resp = get_forecast()
-			# print(f'weather_resp:\n{json.dumps(weather_resp, indent = 2)}')
-			data['weather'] = {
-				'units': {
-					'temp': f'{weather_resp["current_units"]["temperature_2m"]}',
-					'cloud_cover': f'{weather_resp["current_units"]["cloud_cover"]}',
-					'precipitation': f'{weather_resp["current_units"]["precipitation"][:2]}',
-					'precipitaion_probability_max': f'{weather_resp["daily_units"]["precipitation_probability_max"]}'
-				},
-				'current': {
-					'date': f'{now.date()}',
-					'time': f'{now.time()}'[:-7],
-					'temp': f'{weather_resp["current"]["temperature_2m"]}{weather_resp["current_units"]["temperature_2m"]}',
-					'cloud_cover': f'{weather_resp["current"]["cloud_cover"]}{weather_resp["current_units"]["cloud_cover"]}',
-					'precipitation': f'{weather_resp["current"]["precipitation"]}{weather_resp["current_units"]["precipitation"][:2]}',
-					'precipitation_probability_max': ''
-					
-				},
-				# 'hourly': []
-				'hourly': {
-					'time': [],
-					'temp': [],
-					'cloud_cover': [],
-					'precipitation_probability': [],
-					'precipitation': []
-				}
-			}
-			# print(f'{json.dumps(data, indent = 2)}')
-
-			# Gets max % chance of rain for the day
-			for i in range(0, len(weather_resp['daily']['time'])):
-				t = datetime.strptime(weather_resp['daily']['time'][i], "%Y-%m-%d")
-				if t.date() == now.date():
-					data['weather']['current']['precipitation_probability_max'] = (f'{weather_resp["daily"]["precipitation_probability_max"][i]}'
-																				f'{weather_resp["daily_units"]["precipitation_probability_max"]}')
-					break
+			with open(path) as f:
+				report = json.load(f)
+		except (OSError, ValueError):
+			continue
+		reports.append({key: report.get(key) for key in ('id', 'started', 'path', 'status', 'ms', 'report', 'stacks')}
+			| {'statements': report['sql']['statements'], 'sql_ms': report['sql']['ms'], 'repeated': len(report['repeated'])})
+	return jsonify(reports)
+
+@app.route("/admin/profiles/<name>")
+def profileReport(name):
+	'''
+	Downloads a saved profile's JSON summary (<id>.json) or folded stacks (<id>.folded).
+	'''
+	if session.get('priv_level') != 1:
+		return jsonify(error='Only admins can view profiles'), 403
+	return send_from_directory(profileDir, name, as_attachment=True)
 
-			#Add datasets for Weather graph
-			for i in range(0, len(weather_resp['hourly']['time'])):
-				t = datetime.strptime(weather_resp['hourly']['time'][i], "%Y-%m-%dT%H:%M")
-				if t >= now and len(data['weather']['hourly']['time']) < 25:
-					js_time = t.strftime('%d/%m %H:%M')
-					data['weather']['hourly']['time'].append(js_time),
-					data['weather']['hourly']['temp'].append(weather_resp["hourly"]["temperature_2m"][i]),
-					data['weather']['hourly']['cloud_cover'].append(weather_resp["hourly"]["cloud_cover"][i]),
-					data['weather']['hourly']['precipitation_probability'].append(weather_resp["hourly"]["precipitation_probability"][i]),
-					data['weather']['hourly']['precipitation'].append(weather_resp["hourly"]["precipitation"][i])
+def breakerStates():
+	states = {'closed': 0, 'half_open': 1, 'open': 2}
+	with http._lock:
+		breakers = list(http.breakers.items())
+	return {(upstream,): states[breaker.state] for upstream, breaker in breakers}
 
-		except Exception as e:
-			print(f'Ran into an error while loading index HTML at {str(now)}\ntraceback:\n{traceback.print_exception(e)}')
-			data['weather'] = {
-				'units': {
-					'temp': 'err',
-					'cloud_cover': 'err',
-					'precipitation': 'err',
-					'precipitaion_probability_max': 'err'
-				},
-				'current': {
-					'date': f'{now.date()}',
-					'time': f'{now.time()}'[:-7],
-					'temp': 'err',
-					'cloud_cover': 'err',
-					'precipitation': 'err',
-					'precipitation_probability_max': 'err'
-					
-				},
-				'hourly': [{
-					'date': f'{now.date()}',
-					'time': f'{now.time()}'[:-7],
-					'temp': 'err',
-					'cloud_cover': 'err',
-					'precipitation_probability': 'err',
-					'precipitation': 'err'
-				}] 
-			} 
-
-		#Get system temperature data
+registry.gauge('gardenbot_upstream_circuit_state', 'Circuit breaker state per outside API: 0 closed, 1 half open, 2 open.',
+	('upstream',), func=breakerStates)
+
+#Behind a reverse proxy on the Pi every request comes from this machine, so requests from it are only let in without
+#a login or token when GARDENBOT_METRICS_LOCAL=1, for a Prometheus on the Pi scraping the app directly.
+metrics_local = os.environ.get('GARDENBOT_METRICS_LOCAL') == '1'
+
+@app.route("/metrics")
+def metricsPage():
+	'''
+	Metrics of this process in the Prometheus text format.
+	Open to logged in users, to requests with 'Authorization: Bearer <GARDENBOT_METRICS_TOKEN>', and to requests from this machine
+	if 'metrics_local' is set.
+	'''
+	token = os.environ.get('GARDENBOT_METRICS_TOKEN')
+	local = metrics_local and request.remote_addr in ('127.0.0.1', '::1')
+	allowed = 'user' in session or local or (token and
+		hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'))
+	if not allowed:
+		return Response('metrics require login or a token\n', status=401, mimetype='text/plain')
+	return Response(registry.render(), content_type=registry.content_type)
+
+@app.route("/api/watering-usage")
+def apiWateringUsage():
+	'''
+	Watering per crop, from the crop_water_daily or crop_water_monthly rollups, as columns: day (or month), crop_id, crop, cycles, seconds.
+	'period' is 'daily' (default) or 'monthly'. 'start' and 'end' are YYYY-MM-DD or YYYY-MM, inclusive, and default to the last 30 days
+	or 12 months.
+	'''
+	if 'user' not in session:
+		return jsonify({'error': 'login required'}), 401
+
+	monthly = request.args.get('period', 'daily') == 'monthly'
+	today = date.today()
+	if monthly:
+		table, column = 'crop_water_monthly', 'month'
+		default_start = f'{today.year}-01' if today.month == 12 else f'{today.year - 1}-{today.month + 1:02d}'
+		default_end = today.strftime('%Y-%m')
+	else:
+		table, column = 'crop_water_daily', 'day'
+		default_start, default_end = str(today - timedelta(days=29)), str(today)
+	start = request.args.get('start', default_start)
+	end = request.args.get('end', default_end)
+
+	rows = sqlSelectQuery(f'''select "{column}", crop_id, crop, cycles, seconds from {table}
+		where "{column}" >= ? and "{column}" <= ? order by "{column}", crop_id''', (start, end), fetchall=True)
+	return conditionalJSON({
+		'period': 'monthly' if monthly else 'daily',
+		'start': start,
+		'end': end,
+		column: [row[0] for row in rows],
+		'crop_id': [row[1] for row in rows],
+		'crop': [row[2] for row in rows],
+		'cycles': [row[3] for row in rows],
+		'seconds': [row[4] for row in rows]
+	})
+
+#longest history /api/system-temp returns
+max_temp_hours = 24 * 365
+
+@app.route("/api/system-temp")
+def apiSystemTemp():
+	'''
+	CPU temperature history for the system chart, as columns: ts (epoch seconds), label, min, avg, max.
+	'hours' sets how far back to go (default 24, at most a year). The resolution is picked by telemetrySeries().
+	'''
+	if 'user' not in session:
+		return jsonify({'error': 'login required'}), 401
+
+	hours = request.args.get('hours', 24, type=float)
+	if not math.isfinite(hours) or hours <= 0:
+		return jsonify({'error': 'hours must be a positive number'}), 400
+	hours = min(hours, max_temp_hours)
+	end = int(time.time())
+	resolution, rows = telemetrySeries('cpu_temp', end - int(hours * 60 * 60), end)
+	units = sys_params['api_units']
+	label = '%m/%d\n%H:%M' if resolution != 'daily' else '%m/%d'
+
+	payload = {
+		'resolution': resolution,
+		'units': '°F' if str(units).lower() == 'imperial' else '°C',
+		'ts': [row[0] for row in rows],
+		'label': [datetime.fromtimestamp(row[0]).strftime(label) for row in rows],
+		'min': [celsiusTo(units, row[1]) for row in rows],
+		'avg': [celsiusTo(units, row[2]) for row in rows],
+		'max': [celsiusTo(units, row[3]) for row in rows]
+	}
+	latest = sampler.latest('cpu_temp')
+	return conditionalJSON(payload, datetime.fromtimestamp(latest[0]) if latest else None)
+
+#seconds an /api/events stream stays open before the browser has to reconnect
+events_stream_seconds = 300
+
+@app.route("/api/events")
+def apiEvents():
+	'''
+	Server-Sent Events stream of watering cycle phases ('watering'), new log messages ('log'),
+	and CPU temperature samples ('cpu_temp'), pushed as they happen.
+	'''
+	if 'user' not in session:
+		return jsonify({'error': 'login required'}), 401
+
+	q = events.subscribe(request.headers.get('Last-Event-ID', type=int))
+	if q is None:
+		return jsonify({'error': 'too many live update streams'}), 503, {'Retry-After': '30'}
+
+	def stream():
+		#streams end after events_stream_seconds, and the browser reconnects (from Last-Event-ID), so a worker
+		#is never held by one client for long
+		ends = time.monotonic() + events_stream_seconds
 		try:
-			sysData_temp = sqlSelectQuery('select * from system_temp', fetchall=True)
+			yield 'retry: 5000\n\n'
+			while events.subscribed(q) and time.monotonic() < ends:
+				try:
+					event_id, event, data = q.get(timeout=min(15, max(ends - time.monotonic(), 0.1)))
+				except queue.Empty:
+					#comment line keeps the connection open, and notices clients that went away
+					yield ': keepalive\n\n'
+					continue
+				if event_id is not None:
+					yield f'id: {event_id}\n'
+				yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+		finally:
+			events.unsubscribe(q)
 
-			for temp in sysData_temp:
-				data['sysData']['timestamp'].append(f'{temp[1][:-5]}\n{temp[2][:-3]}')
-				data['sysData']['temp'].append(float(temp[3][:-2]))
-		except Exception as e:
-			print(f'Ran into an error while loading index HTML at {str(now)}\ntraceback:\n{traceback.print_exception(e)}')
+	return Response(stream(), mimetype='text/event-stream',
+		headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-		return render_template('index.html', navurl=navURL, styles=styles, session=session, data=data)
+def applyConfig(params, crops):
+	'''
+	Applies a config page save as one transaction, writing only what differs from the stored state:
+	params whose value changed (as upserts), and crops that were added, changed, or removed (with executemany).
+	'crops' is a list of (id, name, enabled, pin, rain_inc), with id None for new crops. Crops are matched by id, so a renamed
+	crop keeps its id and its watering history. Crops are only removed if at least one crop was submitted.
+	Returns the set of param names that changed.
+	'''
+	#diffed against a fresh read, in case another process changed a param since it was cached
+	current = sys_params.load()
+	changed = {param: value for param, value in params.items() if current.get(param) != value}
+
+	stored = {row[0]: row for row in sqlSelectQuery('select id, crop, enabled, pin, rain_inc from crops where garden_id is null', fetchall=True)}
+	now = datetime.now()
+	inserts = []
+	updates = []
+	kept = set()
+	for crop_id, name, enabled, pin, rain_inc in crops:
+		row = stored.get(crop_id)
+		if row is None:
+			inserts.append((int(enabled), name, pin, rain_inc, str(now.date()), now.strftime('%H:%M:%S')))
+			continue
+		kept.add(crop_id)
+		if (row[1], bool(row[2]), row[3], row[4]) != (name, enabled, pin, rain_inc):
+			updates.append((name, int(enabled), pin, rain_inc, crop_id))
+	deletes = [(crop_id,) for crop_id in stored if crop_id not in kept] if crops else []
+
+	with db.transaction():
+		if changed:
+			sys_params.set_many(changed)
+		#crops are unique on (crop, pin), so removed and changed crops go first, in case a new crop takes the same name and pin
+		if deletes:
+			sqlModifyMany('delete from crops where id = ?', deletes)
+		if updates:
+			sqlModifyMany('update crops set crop = ?, enabled = ?, pin = ?, rain_inc = ? where id = ?', updates)
+		if inserts:
+			sqlModifyMany('insert into crops (enabled, crop, pin, rain_inc, "date", "time") values (?, ?, ?, ?, ?, ?)', inserts)
+	return set(changed)
 
 @app.route("/config", methods=['GET', 'POST'])
 def config():
@@ -696,26 +2869,26 @@ def config():
 
 	#get stored parameters
 	data = {
-		'api_city' : sqlSelectQuery('select val_string from system_params where param = ?', ('api_city',))[0],
-		'api_country' : sqlSelectQuery('select val_string from system_params where param = ?', ('api_country',))[0],
-		'api_forecast_days': sqlSelectQuery('select val_num from system_params where param = ?', ('api_forecast_days',))[0],
-		'api_state' : sqlSelectQuery('select val_string from system_params where param = ?', ('api_state',))[0],
-		'api_timezone' : sqlSelectQuery('select val_string from system_params where param = ?', ('api_timezone',))[0],
-		'api_units' : sqlSelectQuery('select val_string from system_params where param = ?', ('api_units',))[0],
-		'delay_after' : sqlSelectQuery('select val_num from system_params where param = ?', ('delay_after',))[0],
-		'delay_before' : sqlSelectQuery('select val_num from system_params where param = ?', ('delay_before',))[0],
+		'api_city' : sys_params['api_city'],
+		'api_country' : sys_params['api_country'],
+		'api_forecast_days': sys_params['api_forecast_days'],
+		'api_state' : sys_params['api_state'],
+		'api_timezone' : sys_params['api_timezone'],
+		'api_units' : sys_params['api_units'],
+		'delay_after' : sys_params['delay_after'],
+		'delay_before' : sys_params['delay_before'],
 		'hours': list(range(24)),
-		'max_crops' : sqlSelectQuery('select val_num from system_params where param = ?', ('max_crops',))[0],
-		'pump_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('pump_pin',))[0],
-		'system_enable' : bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('system_enable',))[0]),
+		'max_crops' : sys_params['max_crops'],
+		'pump_pin' : sys_params['pump_pin'],
+		'system_enable' : sys_params['system_enable'],
 		'timezones': timezones,
-		'use_api' : bool(sqlSelectQuery('select val_bool from system_params where param = ?', ('use_api',))[0]),
-		'valve_close_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('valve_close_pin',))[0],
-		'valve_enable_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('valve_enable_pin',))[0],
-		'valve_open_pin' : sqlSelectQuery('select val_num from system_params where param = ?', ('valve_open_pin',))[0],
-		'water_schedule_hour' : sqlSelectQuery('select val_string from system_params where param = ?', ('water_schedule_hour',))[0],
-		'water_time' : sqlSelectQuery('select val_num from system_params where param = ?', ('water_time',))[0],
-		'crop_data': sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops', fetchall=True)
+		'use_api' : sys_params['use_api'],
+		'valve_close_pin' : sys_params['valve_close_pin'],
+		'valve_enable_pin' : sys_params['valve_enable_pin'],
+		'valve_open_pin' : sys_params['valve_open_pin'],
+		'water_schedule_hour' : sys_params['water_schedule_hour'],
+		'water_time' : sys_params['water_time'],
+		'crop_data': sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops where garden_id is null', fetchall=True)
 	}
 
 	navURL = getNavURL()
@@ -747,13 +2920,15 @@ def config():
 			'crop_data': []
 		}
 		#consolidate crop data to respective crop data values
+		#crops are identified by id (empty for crops not saved yet), and their enable switches by position
+		crop_ids = [int(crop_id) if crop_id else None for crop_id in request.form.getlist('crop_id')]
 		crop_names = request.form.getlist('crop_name')
 		crop_pins = request.form.getlist('crop_pin')
 		crop_rain_incs = request.form.getlist('crop_rain_inc')
 		crop_enabled_list = []
 
-		for crop in crop_names:
-			crop_enabled_list.append(request.form.get(f'crop_enable_{crop}', False))
+		for i in range(len(crop_names)):
+			crop_enabled_list.append(request.form.get(f'crop_enable_{i}', False))
 		for key in request.form.keys():
 			if key == 'logout':
 				return logout()
@@ -761,11 +2936,10 @@ def config():
 				return userSettings()
 			elif key.startswith('cropDel_'):
 				#if sector has been deleted
-				del_crop_name = key.split('_')[1]
+				del_crop = int(key.split('_')[1])
 				for i in range(len(crop_names)):
-					if crop_names[i] != del_crop_name:
-						crop_temp = (sqlSelectQuery('select id from crops where crop = ?', (crop_names[i],))[0],
-							bool(crop_enabled_list[i]), crop_names[i], int(crop_pins[i]), int(crop_rain_incs[i]))
+					if i != del_crop:
+						crop_temp = (crop_ids[i], bool(crop_enabled_list[i]), crop_names[i], int(crop_pins[i]), int(crop_rain_incs[i]))
 						tempData['crop_data'].append(crop_temp)
 				if len(tempData['crop_data']) < tempData['max_crops']:
 					addButton = True
@@ -775,12 +2949,11 @@ def config():
 				#if adding a new crop
 				counter = 0
 				for i in range(len(crop_names)):
-					crop_temp = (sqlSelectQuery('select id from crops where crop = ?', (crop_names[i],))[0], 
-						bool(crop_enabled_list[i]), crop_names[i], int(crop_pins[i]), int(crop_rain_incs[i]))
+					crop_temp = (crop_ids[i], bool(crop_enabled_list[i]), crop_names[i], int(crop_pins[i]), int(crop_rain_incs[i]))
 					counter = i + 1
 					tempData['crop_data'].append(crop_temp)
 
-				empty = (9999, False, "Plant!", 0, 0)
+				empty = (None, False, "Plant!", 0, 0)
 				tempData['crop_data'].append(empty)
 				if len(tempData['crop_data']) < tempData['max_crops']:
 					addButton = True
@@ -788,47 +2961,15 @@ def config():
 				return render_template('config.html', navurl=navURL, styles=styles, data=tempData, addButton=addButton)
 			elif key == 'cropSave':
 				#if writing parameters
-				for key, value in tempData.items():
-					if (key != "crop_data" and key != 'hours' and key != 'timezones'):
-						val = None
-						# print(f'key: {key}, val: {value}')
-						if isinstance(tempData[key], bool):
-							val = "val_bool"
-						elif isinstance(tempData[key], int):
-							val = "val_num"
-						elif isinstance(tempData[key], str):
-							val = "val_string"
-						param_tuple = (value, key)
-						sqlModifyQuery(f'update system_params set {val} = ? where param = ?', param_tuple)
-
-				if crop_names:
-					crop_names_join = ','.join(crop_names)
-					crop_names_db = sqlSelectQuery('select id, crop from crops', fetchall=True)
-					for crop in crop_names_db:
-						if crop[1] not in crop_names_join:
-							sqlModifyQuery(f'delete from crops where crop = ?', (crop[1],))
-				for i in range(len(crop_names)):
-
-					if sqlSelectQuery('select count(*) from crops where crop = ?', (crop_names[i],))[0] == 0:
-						insert_crop = (crop_enabled_list[i], crop_names[i], crop_pins[i], crop_rain_incs[i], str(date.today()), str(datetime.now().time().strftime('%H:%M:%S')))
-						sqlModifyQuery(f'insert into crops (enabled, crop, pin, rain_inc, "date", "time") values {insert_crop}')
-					else:
-						crop_tuple = (crop_enabled_list[i], crop_names[i], crop_pins[i], crop_rain_incs[i], crop_names[i])
-						sqlModifyQuery(f'update crops set enabled = ?, crop = ?, pin = ?, rain_inc = ? where crop = ?', crop_tuple)
-
-					crop_temp = (sqlSelectQuery('select id from crops where crop = ?', (crop_names[i],))[0],
-						crop_names[i], int(crop_pins[i]), int(crop_rain_incs[i]), bool(crop_enabled_list[i]))
-					tempData['crop_data'].append(crop_temp)
-
-				if len(tempData['crop_data']) < tempData['max_crops']:
-					addButton = True
+				params = {param: value for param, value in tempData.items() if param not in ('crop_data', 'hours', 'timezones')}
+				crops = [(crop_ids[i], crop_names[i], bool(crop_enabled_list[i]), int(crop_pins[i]), int(crop_rain_incs[i]))
+					for i in range(len(crop_names))]
+				#water_on_schedule runs every hour and reads water_schedule_hour when it runs, so it isn't rescheduled
+				changed = applyConfig(params, crops)
 
-				scheduler.reschedule_job(
-					    job_id='water_on_schedule',
-    					trigger='cron',
-    					hour=sqlSelectQuery('select val_string from system_params where param = "water_schedule_hour"')[0], 
-						minute='0'
-				)
+				#geocode a new location in the background, so the next forecast doesn't wait on Nominatim
+				if changed & {'api_city', 'api_state', 'api_country'}:
+					threading.Thread(target=getCoordinates, daemon=True).start()
 
 				return redirect(url_for('.config'))
 
@@ -841,21 +2982,96 @@ def config():
 			addButton = True
 		return render_template('config.html', navurl=navURL, styles=styles, data=data, addButton=addButton)
 
+log_page_size = 50
+
+def logSearchQuery(text):
+	'''
+	Turns search box text into an FTS5 query matching every word, as a prefix, so FTS5 syntax in it is taken literally.
+	'''
+	words = text.split()
+	return ' '.join('"' + word.replace('"', '""') + '"*' for word in words) if words else None
+
+def logPage(search = None, start = None, end = None, before = None, after = None, since_id = 0, size = log_page_size):
+	'''
+	Gets one page of log messages, newest first, as (rows, has_older, has_newer). Rows are (id, date, time, message).
+	* search - FTS5 query over messages
+	* start, end - epoch seconds, end excluded
+	* before, after - keyset cursors: the page of messages older than id 'before', or newer than id 'after'
+	* since_id - only messages with a larger id (messages cleared from the default view have smaller ids)
+	Pages follow ids (insertion order). A Pi has no RTC, so its clock can jump at boot, and ts doesn't always grow with id.
+	The date range is narrowed to the id span of messages in it through the ts index, and ts is also checked on each row,
+	so messages logged under a wrong clock are still filtered by their own ts. Every page is an indexed range scan.
+	'''
+	low, high = since_id + 1, 2 ** 63 - 1
+	if start is not None or end is not None:
+		start = 0 if start is None else start
+		end = 2 ** 63 - 1 if end is None else end
+		first, last = sqlSelectQuery('select min(id), max(id) from log_entries where ts >= ? and ts < ?', (start, end))
+		if first is None:
+			return [], False, False
+		low, high = max(low, first), last
+	else:
+		start, end = 0, 2 ** 63 - 1
+	if before is not None:
+		high = min(high, before - 1)
+	if after is not None:
+		low = max(low, after + 1)
+
+	if search:
+		query = '''select l.id, l."date", l."time", l.message from log_search s join log_entries l on l.id = s.rowid
+			where log_search match ? and s.rowid between ? and ? and l.ts >= ? and l.ts < ? order by s.rowid {order} limit ?'''
+		query_params = (search, low, high, start, end, size + 1)
+	else:
+		query = '''select id, "date", "time", message from log_entries
+			where id between ? and ? and ts >= ? and ts < ? order by id {order} limit ?'''
+		query_params = (low, high, start, end, size + 1)
+
+	#paging forward reads the next ids up, then flips them back to newest first
+	rows = sqlSelectQuery(query.format(order='asc' if after is not None else 'desc'), query_params, fetchall=True)
+	more = len(rows) > size
+	rows = rows[:size]
+	if after is not None:
+		rows.reverse()
+		return rows, True, more
+	return rows, more, before is not None
+
+def logTable(full):
+	'''
+	Renders the first page of the log from the fragment cache: everything if 'full', otherwise messages since the log was last cleared.
+	'''
+	def context():
+		rows, older, _ = logPage(since_id=0 if full else int(sys_params.get('log_cleared_id', 0)))
+		return {'waterLog': rows, 'older': older, 'newer': False, 'args': {'full': 1} if full else {}}
+	return renderFragment('log_table', ('log_entries', 'system_params'), 'fragments/log_table.html', context, key=full)
+
+def logDate(value, days = 0):
+	'''
+	Parses a YYYY-MM-DD filter into epoch seconds at local midnight, 'days' later. Returns None if it's empty or invalid.
+	'''
+	try:
+		return int((datetime.strptime(value, '%Y-%m-%d') + timedelta(days=days)).timestamp()) if value else None
+	except ValueError:
+		flash(f'Invalid date: {value}', 'danger')
+		return None
+
 @app.route("/water-log", methods=['GET', 'POST'])
 def waterLog():
 	'''
 	Water Log page HTTP handling.
-	GET - loads/reloads the page.
+	GET - loads/reloads the page. Query args:
+	* q - full text search over messages
+	* start, end - YYYY-MM-DD dates to show messages from, inclusive
+	* before, after - page cursors, set by the Older/Newer links
+	* full - include messages hidden by Clear Log
 	POST - depending on which button was pressed:
-	* Clear Log - deletes all items in the 30 day log. Preserves the 60 day log.
-	* View 60 Day Log - Changes the log view to the 60 day log.
+	* Clear Log - hides every message so far from the default view. They are kept, and still shown in the full log.
+	* View Full Log - Changes the log view to the full log.
 
-	Page contents: Log messages collected over both 30, and 60 day periods.
+	Page contents: Log messages, newest first, a page at a time.
 	'''
 	if 'user' not in session:
 		return redirect(url_for('.login'))
 
-	formButtons = True
 	if request.method == 'POST':
 		for key in request.form.keys():
 			match key:
@@ -864,24 +3080,61 @@ def waterLog():
 				case "userSettings":
 					return userSettings()
 				case 'clear':
-					#clear 30 day log
-					sqlModifyQuery('delete from water_log')
+					#hide the current log from the default view
+					latest = sqlSelectQuery('select max(id) from log_entries')[0]
+					sys_params.set_many({'log_cleared_id': latest or 0})
 					return redirect(url_for('.waterLog'))
-				case '60daylog':
-					#display 60 day log
-					formButtons = False
-					navURL = getNavURL()
-					styles = getStyles()
-					waterLog = sqlSelectQuery('select * from water_log_60 order by date desc, time desc', fetchall=True)
-					return render_template('water-log.html', navurl=navURL, styles=styles, waterLog=waterLog, formButtons=formButtons)
+				case 'fullLog':
+					return redirect(url_for('.waterLog', full=1))
 				case 'back':
 					return redirect(url_for('.waterLog'))
 		return redirect(url_for('.waterLog'))
 	else:
 		navURL = getNavURL()
 		styles = getStyles()
-		waterLog = sqlSelectQuery('select * from water_log order by date desc, time desc', fetchall=True)
-		return render_template('water-log.html', navurl=navURL, styles=styles, waterLog=waterLog, formButtons=formButtons)
+		full = request.args.get('full', 0, type=int) == 1
+		filters = {
+			'q': request.args.get('q', '').strip(),
+			'start': request.args.get('start', '').strip(),
+			'end': request.args.get('end', '').strip()
+		}
+		before = request.args.get('before', type=int)
+		after = request.args.get('after', type=int)
+
+		if not any(filters.values()) and before is None and after is None:
+			#the first page without filters is what's usually opened, so it's cached
+			table = logTable(full)
+		else:
+			rows, older, newer = logPage(logSearchQuery(filters['q']), logDate(filters['start']), logDate(filters['end'], days=1),
+				before, after, 0 if full else int(sys_params.get('log_cleared_id', 0)))
+			args = {key: value for key, value in filters.items() if value}
+			if full:
+				args['full'] = 1
+			table = Markup(render_template('fragments/log_table.html', waterLog=rows, older=older, newer=newer, args=args))
+		return render_template('water-log.html', navurl=navURL, styles=styles, logTable=table, formButtons=not full, filters=filters, full=full)
+
+def userData():
+	'''
+	Gets every user for the admin page, with only the end of the password hash shown.
+	'''
+	user_sql_resp = sqlSelectQuery('select id, username, password_hash, priv_level from users', fetchall=True)
+	user_data = []
+	for user in user_sql_resp:
+		user_data.append({
+			'username': user[1],
+			'password_hash': f'*******...{user[2][-5:]}',
+			'priv_level': user[3]
+		})
+	return user_data
+
+def userList(edit):
+	'''
+	Renders the admin page's user list. The read-only list comes from the fragment cache, edit mode is rendered fresh.
+	'''
+	if edit['edit']:
+		return Markup(render_template('fragments/user_list.html', user_data=userData(), edit=edit))
+	return renderFragment('user_list', ('users',), 'fragments/user_list.html',
+		lambda: {'user_data': userData(), 'edit': edit})
 
 @app.route("/admin", methods=['GET', 'POST'])
 def admin():
@@ -903,15 +3156,7 @@ def admin():
 	#Set vars for page request
 	navURL = getNavURL()
 	styles = getStyles()
-	user_sql_resp = sqlSelectQuery('select id, username, password_hash, priv_level from users', fetchall=True)
-	user_data = []
-	for user in user_sql_resp:
-		user_data.append({
-			'username': user[1],
-			'password_hash': f'*******...{user[2][-5:]}',
-			'priv_level': user[3]
-		})
-	
+
 	if request.method == "POST":
 		for key in request.form.keys():
 			match key:
@@ -923,7 +3168,7 @@ def admin():
 					#Returns page with specified user's fields enabled
 					edit['edit'] = True
 					edit['username'] = request.form.get('username')
-					return render_template('admin.html', navurl=navURL, styles=styles, session=session, user_data=user_data, edit=edit)
+					return render_template('admin.html', navurl=navURL, styles=styles, session=session, userList=userList(edit), edit=edit)
 				case "saveUser":
 					#Only in edit user mode. Saves changes to user.
 					username = request.form.get('username')
@@ -943,15 +3188,19 @@ def admin():
 					new_user = request.form.get('username')
 					new_password = request.form.get('password')
 					new_priv_level = request.form.get('priv_level')
-					password_hash = make_hashbrowns(new_password)
+					try:
+						password_hash = make_hashbrowns(new_password)
+					except HasherBusy:
+						flash('Server is busy. Try again in a moment.', 'danger')
+						password_hash = None
 					if password_hash:
-						user_tuple = (new_user, password_hash.decode('utf-8'), new_priv_level)
+						user_tuple = (new_user, password_hash, new_priv_level)
 						sqlModifyQuery(f'insert into users (username, password_hash, priv_level) values {user_tuple}')
 					return redirect(url_for('.admin')) 
 			
 		return redirect(url_for('.admin'))
 	else:
-		return render_template('admin.html', navurl=navURL, styles=styles, session=session, user_data=user_data, edit=edit) 
+		return render_template('admin.html', navurl=navURL, styles=styles, session=session, userList=userList(edit), edit=edit) 
 
 @app.route("/userSettings", methods=['GET', 'POST'])
 def userSettings():
@@ -981,51 +3230,89 @@ def userSettings():
 					oldPass = request.form.get('oldPass')
 					newPass = request.form.get('newPass')
 
-					if bcrypt.checkpw(oldPass.encode('utf-8'), user_sql_resp[2].encode('utf-8')):
-						newPass_hash = make_hashbrowns(newPass)
-						user_tuple = (newPass_hash.decode('utf-8'), user_sql_resp[1])
-						sqlModifyQuery('update users set password_hash = ? where username = ?', user_tuple)
+					try:
+						if password_hasher.verify(oldPass, user_sql_resp[2]):
+							newPass_hash = make_hashbrowns(newPass)
+							user_tuple = (newPass_hash, user_sql_resp[1])
+							sqlModifyQuery('update users set password_hash = ? where username = ?', user_tuple)
+					except HasherBusy:
+						flash('Server is busy. Try again in a moment.', 'danger')
 
 		return redirect(url_for('.userSettings'))
 	else:
 		return render_template('user-settings.html', navurl=navURL, styles=styles, session=session)
 
+def ensure_job(job_id, func, trigger, misfire_grace_time):
+	'''
+	Adds a job to the job store, or brings a stored one up to date. A job whose trigger didn't change keeps its stored
+	next run time, so a run that was missed while no process was leader is caught up on (within 'misfire_grace_time').
+	'''
+	job = scheduler.get_job(job_id)
+	if job is None:
+		scheduler.add_job(func, trigger, id=job_id, misfire_grace_time=misfire_grace_time)
+		return
+	scheduler.modify_job(job_id, func=func, misfire_grace_time=misfire_grace_time)
+	if str(job.trigger) != str(trigger):
+		scheduler.reschedule_job(job_id, trigger=trigger)
+
 def init_jobs():
 	'''
-	Initializes tasks to be ran on a schedule for the app.
+	Initializes tasks to be ran on a schedule for the app. Only ran by the scheduler leader.
 	Tasks:
-	* get_system_temp: gets system temp data every hour.
-	* water_on_schedule: waters crops at the configured time. Uses DB value.
-	'''
-	def check_job(job):
-		if scheduler.get_job(job_id=job):
-			scheduler.remove_job(job_id=job)
-		
-	check_job("get_system_temp")
-	check_job("water_on_schedule")
-
-	scheduler.add_job(
-		id="get_system_temp",
-		func=get_system_temp,  
-		trigger="cron", 
-		hour='*', 
-		minute='0',
-		# minute='*',
-		second='0',
-		replace_existing=True)
-
-	scheduler.add_job(
-		id="water_on_schedule",
-		func=water_on_schedule,  
-		trigger="cron", 
-		hour=sqlSelectQuery('select val_string from system_params where param = "water_schedule_hour"')[0], 
-		minute='0',
-		# hour='*',
-		# minute='*',
-		# second='0',
-		replace_existing=True)
-
-init_jobs()
+	* rollup_telemetry: rolls telemetry up into hourly and daily min/avg/max every hour.
+	* water_on_schedule: every hour, waters the gardens whose configured water_schedule_hour it is. Uses DB values.
+	Still ran if the leader was down at the top of the hour, as long as it is back (or failed over) within 15 minutes.
+	Forecasts aren't refreshed by a job: every process refreshes its own forecast_cache.
+	'''
+	jobs = ('rollup_telemetry', 'water_on_schedule')
+	for job in scheduler.get_jobs():
+		if job.id not in jobs:
+			scheduler.remove_job(job.id)
+
+	ensure_job('rollup_telemetry', rollupTelemetry,
+		CronTrigger(hour='*', minute='1'), misfire_grace_time=30 * 60)
+	ensure_job('water_on_schedule', water_on_schedule,
+		CronTrigger(hour='*', minute='0'), misfire_grace_time=15 * 60)
+
+def start_scheduler():
+	'''
+	Starts running scheduled jobs in this process, once it is elected leader.
+	'''
+	scheduler.start(paused=True)
+	init_jobs()
+	scheduler.resume()
+
+scheduler_leader = SchedulerLeader(os.environ.get('GARDENBOT_SCHEDULER_LOCK', f'{dbPath}.scheduler.lock'), start_scheduler)
+os.register_at_fork(after_in_child=scheduler_leader.after_fork)
+
+def warmTemplates():
+	'''
+	Loads every template once, from the bytecode cache when possible, so the first page load doesn't compile them.
+	'''
+	for name in app.jinja_env.list_templates(extensions=['html']):
+		app.jinja_env.get_template(name)
+
+def startupReport():
+	'''
+	Prints how long each part of startup took.
+	'''
+	total = time.perf_counter() - startup_began
+	phases = ', '.join(f'{phase} {seconds * 1000:.0f}ms' for phase, seconds in startup_timings.items())
+	print(f'Started RaspiGardenBot {__version__} in {total * 1000:.0f}ms ({phases})')
+
+began = time.perf_counter()
+init_db()
+failOrphanedWaterJobs()
+startup_timings['db'] = time.perf_counter() - began
+began = time.perf_counter()
+warmTemplates()
+startup_timings['templates'] = time.perf_counter() - began
+began = time.perf_counter()
+scheduler_leader.start()
+sampler.start()
+forecast_cache.start()
+startup_timings['jobs'] = time.perf_counter() - began
+startupReport()
 
 if __name__ == '__main__':
 	app.run(host='0.0.0.0', debug=False, use_reloader=False)
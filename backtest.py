@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+'''
+Purpose: Replays recorded hourly rain forecasts through the rain-skip decision in raindecision.py,
+to see how often each crop would have been watered or skipped under different thresholds.
+
+Input is one or more Open-Meteo JSON responses (hourly.time and hourly.precipitation_probability),
+or CSV files with a time column and a precipitation_probability column (Open-Meteo CSV exports work as is).
+Crops, water_time, water_schedule_hour, last_rain, and use_api are read from the app DB, for the main garden or --garden.
+
+Every day's scheduled run is evaluated at once with NumPy, so a full season takes milliseconds per threshold set.
+Requires numpy, which the app itself doesn't need: pip3 install numpy
+
+Usage: python3 backtest.py forecasts/*.json [--db database/app_data.db] [--garden NAME] [--any-above 40,50,60]
+	[--avg-with-any 4.16] [--avg-alone 50] [--flow 2.0] [--json]
+'''
+
+import argparse, csv, itertools, json, os, sqlite3, sys, time
+import numpy as np
+import raindecision
+
+def loadSeries(paths):
+	'''
+	Loads hourly (time, precipitation_probability) points from JSON and CSV files into one hourly series.
+	Overlapping hours keep the value from the later file. Missing hours are NaN.
+	Returns (times as datetime64[h], probabilities as float64).
+	'''
+	points = {}
+	for path in paths:
+		if path.lower().endswith('.csv'):
+			with open(path, newline='') as f:
+				rows = list(csv.reader(f))
+			#Open-Meteo CSVs have a location block before the data header
+			start = next(i for i, row in enumerate(rows) if row and row[0].strip().lower() == 'time')
+			col = next(i for i, name in enumerate(rows[start]) if name.strip().lower().startswith('precipitation_probability'))
+			for row in rows[start + 1:]:
+				if len(row) > col and row[col].strip():
+					points[np.datetime64(row[0].strip(), 'h')] = float(row[col])
+		else:
+			with open(path) as f:
+				hourly = json.load(f)['hourly']
+			for t, p in zip(hourly['time'], hourly['precipitation_probability']):
+				if p is not None:
+					points[np.datetime64(t, 'h')] = float(p)
+	if not points:
+		raise ValueError('No hourly precipitation_probability data found')
+
+	times = np.array(sorted(points), dtype='datetime64[h]')
+	series = np.arange(times[0], times[-1] + 1, dtype='datetime64[h]')
+	probabilities = np.full(len(series), np.nan)
+	probabilities[(times - series[0]).astype(np.int64)] = [points[t] for t in times]
+	return series, probabilities
+
+def scheduledRuns(times, probabilities, hour, hours = 25):
+	'''
+	Gets the 'hours' hourly points the app would see at each day's scheduled run, as water_on_schedule() does.
+	The run starts a few seconds after 'hour':00, and hourlyForecast() keeps the points from then on,
+	so each window starts with the following hour.
+	Days without a complete window are dropped.
+	Returns (days as datetime64[D], max chance per day, average chance per day).
+	'''
+	if len(times) < hours + 1:
+		raise ValueError(f'Need at least {hours + 1} hours of data')
+	runs = np.nonzero((times - times.astype('datetime64[D]')).astype(np.int64) == hour)[0]
+	runs = runs[runs + 1 + hours <= len(times)]
+	windows = np.lib.stride_tricks.sliding_window_view(probabilities, hours)[runs + 1]
+	complete = ~np.isnan(windows).any(axis=1)
+	windows = windows[complete]
+	return times[runs][complete].astype('datetime64[D]'), windows.max(axis=1), windows.mean(axis=1)
+
+def backtest(maxChance, avgChance, crops, last_rain, use_api, limits):
+	'''
+	Runs the rain-skip decision for every scheduled run at once.
+	'crops' are crop rows (id, enabled, crop, pin, rain_inc). Matches raindecision.decide() run day after day,
+	with the system enabled.
+	Returns (skip per day, last_rain before each run, crops watered per day as a days x crops bool array).
+	'''
+	skip = ((maxChance > limits['any_above']) & (avgChance >= limits['avg_with_any'])) | (avgChance > limits['avg_alone'])
+	day = np.arange(len(skip))
+
+	#days since last rain restart at 0 after each skipped day
+	lastSkip = np.maximum.accumulate(np.where(skip, day, -1))
+	previousSkip = np.concatenate(([-1], lastSkip[:-1]))
+	base = np.where(previousSkip >= 0, 0, last_rain)
+	offset = np.where(previousSkip >= 0, day - previousSkip - 1, day)
+	lastRain = base + offset
+	if not use_api:
+		#the rotation wraps to 0 after 'rotation_days'
+		wraps = base <= raindecision.rotation_days
+		lastRain = np.where(wraps, (base + offset) % (raindecision.rotation_days + 1), lastRain)
+
+	enabled = np.array([bool(crop[1]) for crop in crops], dtype=bool)
+	rainInc = np.array([crop[4] for crop in crops], dtype=np.int64)
+	due = (lastRain[:, None] >= rainInc[None, :]) & (lastRain[:, None] % rainInc[None, :] == 0)
+	watered = due & enabled[None, :] & ~skip[:, None]
+	return skip, lastRain, watered
+
+def loadGarden(path, garden = None):
+	'''
+	Reads crops and the watering params backtest() needs from the app DB, for the main garden or the named garden.
+	'''
+	conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+	try:
+		params = {row[0]: row[1] if row[1] is not None else row[2] if row[2] is not None else row[3]
+			for row in conn.execute('select param, val_num, val_bool, val_string from system_params')}
+		if garden is None:
+			#DBs from before multiple gardens have no garden_id
+			if 'garden_id' in [row[1] for row in conn.execute('pragma table_info(crops)')]:
+				crops = conn.execute('select id, enabled, crop, pin, rain_inc from crops where garden_id is null').fetchall()
+			else:
+				crops = conn.execute('select id, enabled, crop, pin, rain_inc from crops').fetchall()
+		else:
+			row = conn.execute('select id, water_schedule_hour, water_time, use_api, last_rain from gardens where name = ?', (garden,)).fetchone()
+			if row is None:
+				raise ValueError(f'No garden named {garden}')
+			params.update(zip(('water_schedule_hour', 'water_time', 'use_api', 'last_rain'), row[1:]))
+			crops = conn.execute('select id, enabled, crop, pin, rain_inc from crops where garden_id = ?', (row[0],)).fetchall()
+	finally:
+		conn.close()
+	return crops, params
+
+def numbers(text):
+	return [float(value) for value in text.split(',')]
+
+def main():
+	parser = argparse.ArgumentParser(description='Backtest the rain-skip watering decision on recorded forecasts')
+	parser.add_argument('files', nargs='+', help='Open-Meteo JSON responses or CSV files with hourly precipitation_probability')
+	parser.add_argument('--db', default=os.environ.get('GARDENBOT_DB', 'database/app_data.db'), help='app DB to read crops and params from')
+	parser.add_argument('--garden', help='garden from the gardens table to use. Defaults to the main garden')
+	parser.add_argument('--any-above', type=numbers, default=[raindecision.thresholds['any_above']], help='comma separated values to try')
+	parser.add_argument('--avg-with-any', type=numbers, default=[raindecision.thresholds['avg_with_any']], help='comma separated values to try')
+	parser.add_argument('--avg-alone', type=numbers, default=[raindecision.thresholds['avg_alone']], help='comma separated values to try')
+	parser.add_argument('--last-rain', type=int, help='days since last rain before the first day. Defaults to the DB value')
+	parser.add_argument('--all-enabled', action='store_true', help='treat every crop as enabled')
+	parser.add_argument('--flow', type=float, default=2.0, help='litres per minute through each crop valve, for the water use estimate')
+	parser.add_argument('--json', action='store_true', help='print results as JSON')
+	args = parser.parse_args()
+
+	crops, params = loadGarden(args.db, args.garden)
+	if args.all_enabled:
+		crops = [(crop[0], 1) + tuple(crop[2:]) for crop in crops]
+	last_rain = args.last_rain if args.last_rain is not None else int(params.get('last_rain', 0))
+	use_api = bool(params.get('use_api', True))
+	water_time = int(params.get('water_time', 0))
+
+	began = time.perf_counter()
+	times, probabilities = loadSeries(args.files)
+	days, maxChance, avgChance = scheduledRuns(times, probabilities, int(params.get('water_schedule_hour', 0)))
+	loaded = time.perf_counter() - began
+	if not len(days):
+		sys.exit('No scheduled runs have a complete 24 hour forecast window')
+
+	results = []
+	began = time.perf_counter()
+	for any_above, avg_with_any, avg_alone in itertools.product(args.any_above, args.avg_with_any, args.avg_alone):
+		limits = {'any_above': any_above, 'avg_with_any': avg_with_any, 'avg_alone': avg_alone}
+		skip, lastRain, watered = backtest(maxChance, avgChance, crops, last_rain, use_api, limits)
+		wateredDays = watered.sum(axis=0)
+		results.append({
+			'thresholds': limits,
+			'days': len(days),
+			'skipped_days': int(skip.sum()),
+			'pump_days': int((~skip).sum()),
+			'crops': {crop[2]: {
+				'watered_days': int(wateredDays[i]),
+				'water_seconds': int(wateredDays[i]) * water_time,
+				'water_litres': round(int(wateredDays[i]) * water_time / 60 * args.flow, 1)
+			} for i, crop in enumerate(crops)}
+		})
+	evaluated = time.perf_counter() - began
+
+	if args.json:
+		print(json.dumps({'start': str(days[0]), 'end': str(days[-1]), 'results': results}, indent=2))
+		return
+
+	print(f'{len(days)} scheduled runs from {days[0]} to {days[-1]} at {params.get("water_schedule_hour")}:00, '
+		f'loaded in {loaded * 1000:.1f}ms, {len(results)} threshold sets evaluated in {evaluated * 1000:.1f}ms')
+	for result in results:
+		limits = result['thresholds']
+		print(f'\nany hour > {limits["any_above"]:g}% with avg >= {limits["avg_with_any"]:g}%, or avg > {limits["avg_alone"]:g}%: '
+			f'{result["skipped_days"]} skipped, {result["pump_days"]} pump runs')
+		for name, crop in result['crops'].items():
+			print(f'  {name:<16} watered {crop["watered_days"]:>4} days  {crop["water_seconds"]:>7} s  {crop["water_litres"]:>8.1f} L')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+'''
+Purpose: Microbenchmarks for the data and decision hot paths of FlaskApp.py.
+Runs against a temp DB built from database/app_data.sql, simulated hardware, and a local fake Open-Meteo
+server serving benchmarks/fixtures/open_meteo_forecast.json, so it can be ran on or off the Pi.
+
+Results are written to benchmarks/results/<timestamp>.json. Each run is compared to a baseline
+(by default, the median of the last 5 results), and exits with status 1 if any benchmark's fastest repeat
+is more than --threshold (or the baseline's own spread, if wider) slower, even after being measured again. The fastest repeat is used because it's
+the least affected by whatever else the machine was doing. --quick and --filter runs aren't saved or compared,
+since they're partial.
+
+Usage: python3 benchmarks/bench.py [--quick] [--filter NAME] [--baseline FILE] [--history 5] [--threshold 0.25] [--confirm 2]
+'''
+
+import argparse, glob, json, os, platform, sqlite3, statistics, sys, tempfile, threading, time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+repoDir = os.path.dirname(benchDir)
+fixturePath = os.path.join(benchDir, 'fixtures', 'open_meteo_forecast.json')
+resultsDir = os.path.join(benchDir, 'results')
+#first hour of the fixture forecast
+fixtureNow = datetime(2026, 6, 14, 0, 0)
+
+def make_db(directory):
+	'''
+	Builds a fresh copy of the app DB from database/app_data.sql.
+	'''
+	path = os.path.join(directory, 'app_data.db')
+	conn = sqlite3.connect(path)
+	with open(os.path.join(repoDir, 'database', 'app_data.sql')) as f:
+		conn.executescript(f.read())
+	conn.close()
+	return path
+
+def start_fake_open_meteo(body):
+	'''
+	Serves 'body' as the JSON response to any GET on a local port. Returns the server.
+	'''
+	class Handler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, *args):
+			pass
+
+	server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def load_app(directory):
+	'''
+	Imports FlaskApp against a temp DB and simulated hardware.
+	'''
+	os.environ['GARDENBOT_DB'] = make_db(directory)
+	os.environ['GARDENBOT_HARDWARE'] = 'sim'
+	sys.path.insert(0, repoDir)
+	os.chdir(repoDir)
+	import FlaskApp
+	return FlaskApp
+
+def log_batch(F, count):
+	'''
+	Queues 'count' log messages and waits for the log writer to write them.
+	'''
+	for i in range(count):
+		F.insertLogMessage(f'Benchmark log message {i}.')
+	F.log_writer.flush()
+
+def benchmarks(F, fixture_text, api_base):
+	'''
+	Returns {name: (function, calls per repeat)} for every benchmark.
+	'''
+	forecast = json.loads(fixture_text)
+	hourly = F.hourlyForecast(forecast, fixtureNow)
+	F.weather_api_base = api_base
+
+	return {
+		'sql_select_param': (lambda: F.sqlSelectQuery('select val_num from system_params where param = ?', ('water_time',)), 2000),
+		'sql_select_crops': (lambda: F.sqlSelectQuery('select id, enabled, crop, pin, rain_inc from crops', fetchall=True), 2000),
+		'sql_modify_param': (lambda: F.sqlModifyQuery('update system_params set val_num = ? where param = ?', (10, 'water_time')), 200),
+		'settings_read': (lambda: F.sys_params['water_time'], 20000),
+		'insert_log_message': (lambda: F.insertLogMessage('Benchmark log message.'), 200),
+		'log_write_flush_100': (lambda: log_batch(F, 100), 5),
+		'forecast_json_parse': (lambda: json.loads(fixture_text), 500),
+		'forecast_fetch_local': (lambda: F.fetch_forecast(35.78, -78.64, 7, 'auto', 'Imperial'), 50),
+		'hourly_forecast': (lambda: F.hourlyForecast(forecast, fixtureNow), 500),
+		'hourly_chart_data': (lambda: F.hourlyChartData(forecast, fixtureNow), 500),
+		'rain_chance': (lambda: F.rainChance(hourly), 20000)
+	}
+
+def run(func, number, repeat):
+	'''
+	Times 'number' calls of 'func', 'repeat' times. Returns per call timings in microseconds.
+	'''
+	func()
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		for _ in range(number):
+			func()
+		timings.append((time.perf_counter() - start) / number * 1e6)
+	return {
+		'number': number,
+		'repeat': repeat,
+		'min_us': round(min(timings), 3),
+		'median_us': round(statistics.median(timings), 3),
+		'mean_us': round(statistics.mean(timings), 3)
+	}
+
+def latest_results(count):
+	return sorted(glob.glob(os.path.join(resultsDir, '*.json')))[-count:]
+
+def load_baseline(paths):
+	'''
+	Combines result files into one baseline: each benchmark's median 'min_us' and 'median_us' across them, so one noisy run can't move it.
+	'''
+	runs = []
+	for path in paths:
+		with open(path) as f:
+			runs.append(json.load(f)['results'])
+	names = {name for results in runs for name in results}
+	return {name: {key: statistics.median(results[name][key] for results in runs if name in results) for key in ('median_us', 'min_us')}
+		for name in names}
+
+def compare(results, baseline, threshold):
+	'''
+	Returns the benchmarks whose fastest repeat is more than 'threshold' slower than the baseline's.
+	A benchmark whose repeats were spread wider than that in the baseline (median vs fastest) is allowed that spread instead,
+	since it's as much noise as anything.
+	'''
+	regressions = []
+	for name, result in results.items():
+		base = baseline.get(name)
+		if base and result['min_us'] > base['min_us'] * (1 + max(threshold, base['median_us'] / base['min_us'] - 1)):
+			regressions.append((name, base['min_us'], result['min_us']))
+	return regressions
+
+def stop_app(F):
+	'''
+	Stops every background thread of the app that uses the DB, so the temp DB can be removed.
+	'''
+	if F.scheduler.running:
+		F.scheduler.shutdown()
+	F.sampler.close()
+	F.events.close()
+	F.log_writer.close()
+	F.db.close()
+
+def main():
+	parser = argparse.ArgumentParser(description='RaspiGardenBot microbenchmarks')
+	parser.add_argument('--quick', action='store_true', help="fewer calls per benchmark. Not saved or compared")
+	parser.add_argument('--repeat', type=int, default=10)
+	parser.add_argument('--filter', default='', help="only run benchmarks whose name contains this. Not saved or compared")
+	parser.add_argument('--baseline', help='result file to compare against. Defaults to the last --history results in benchmarks/results')
+	parser.add_argument('--history', type=int, default=5, help='previous results combined into the default baseline')
+	parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown of the fastest repeat, e.g. 0.25 = 25%%')
+	parser.add_argument('--confirm', type=int, default=2, help='times a benchmark that looks slower is measured again')
+	parser.add_argument('--no-save', action='store_true', help="don't write the result file")
+	args = parser.parse_args()
+
+	with open(fixturePath, 'rb') as f:
+		fixture = f.read()
+	partial = args.quick or bool(args.filter)
+	baselinePaths = [] if partial else [args.baseline] if args.baseline else latest_results(args.history)
+	baseline = load_baseline(baselinePaths) if baselinePaths else None
+
+	with tempfile.TemporaryDirectory() as directory:
+		F = load_app(directory)
+		server = start_fake_open_meteo(fixture)
+		api_base = f'http://127.0.0.1:{server.server_address[1]}/v1/forecast'
+
+		suite = {}
+		results = {}
+		for name, (func, number) in benchmarks(F, fixture.decode('utf-8'), api_base).items():
+			if args.filter not in name:
+				continue
+			if args.quick:
+				number = max(1, number // 10)
+			suite[name] = (func, number)
+			results[name] = run(func, number, args.repeat)
+			print(f'{name:<24} median {results[name]["median_us"]:>12.3f} us   min {results[name]["min_us"]:>12.3f} us')
+
+		if baseline:
+			#a real regression is still there when measured again, noise usually isn't
+			for name, before, after in compare(results, baseline, args.threshold):
+				func, number = suite[name]
+				for _ in range(args.confirm):
+					retry = run(func, number, args.repeat)
+					if retry['min_us'] < results[name]['min_us']:
+						results[name] = retry
+				print(f'{name:<24} measured again, min {after:.3f} us -> {results[name]["min_us"]:.3f} us')
+
+		server.shutdown()
+		stop_app(F)
+
+	report = {
+		'timestamp': datetime.now().isoformat(timespec='seconds'),
+		'version': F.__version__,
+		'python': platform.python_version(),
+		'machine': platform.machine(),
+		'node': platform.node(),
+		'results': results
+	}
+	if not args.no_save and not partial:
+		os.makedirs(resultsDir, exist_ok=True)
+		path = os.path.join(resultsDir, f'{datetime.now().strftime("%Y%m%d-%H%M%S")}.json')
+		with open(path, 'w') as f:
+			json.dump(report, f, indent=2)
+		print(f'Saved results to {path}')
+
+	if baseline:
+		regressions = compare(results, baseline, args.threshold)
+		print(f'Compared to {", ".join(baselinePaths)}')
+		for name, before, after in regressions:
+			print(f'REGRESSION {name}: {before:.3f} us -> {after:.3f} us ({(after / before - 1) * 100:.0f}% slower)')
+		if regressions:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -18,13 +18,6 @@ create table if not exists system_params(
 	unique(param)
 	);
 
-create table if not exists system_temp(
-	id smallint primary key default (abs(random()) % 8999 + 1000),
-	"date" date not null,
-	"time" time not null,
-	temp text not null
-	);
-
 create table if not exists crops(
 	id smallint primary key default (abs(random()) % 8999 + 1000),
 	enabled boolean not null default 0,
@@ -33,52 +26,180 @@ create table if not exists crops(
 	rain_inc tinyint not null default 1 check (rain_inc >= 1 and rain_inc <= 31),
 	"date" date not null,
 	"time" time not null,
+	garden_id integer default null references gardens(id),
 	unique(crop, pin)
 	);
+create index if not exists crops_garden on crops(garden_id);
+create table if not exists scheduler_jobs(
+	id text primary key,
+	next_run_time real,
+	job_state blob not null
+	);
+create index if not exists scheduler_jobs_next_run_time on scheduler_jobs(next_run_time);
+create table if not exists gardens(
+	id integer primary key,
+	name text not null unique,
+	enabled boolean not null default 1,
+	api_city text,
+	api_state text,
+	api_country text,
+	latitude real,
+	longitude real,
+	pump_pin tinyint not null check (pump_pin >= 0 and pump_pin <= 40),
+	valve_enable_pin tinyint not null check (valve_enable_pin >= 0 and valve_enable_pin <= 40),
+	valve_open_pin tinyint not null check (valve_open_pin >= 0 and valve_open_pin <= 40),
+	valve_close_pin tinyint not null check (valve_close_pin >= 0 and valve_close_pin <= 40),
+	water_schedule_hour tinyint not null default 11 check (water_schedule_hour >= 0 and water_schedule_hour <= 23),
+	water_time int not null default 10,
+	delay_before int not null default 1,
+	delay_after int not null default 1,
+	use_api boolean not null default 1,
+	last_rain int not null default 0,
+	"date" date not null default (date('now')),
+	"time" time not null default (time('now'))
+	);
 
-create table if not exists water_log(
-	id smallint primary key default (abs(random()) % 8999 + 1000),
+create table if not exists log_entries(
+	id integer primary key,
+	ts integer not null,
 	"date" date not null,
 	"time" time not null,
-	message text not null default "An error occured in script execution. This was logged from the database."
+	message text not null
+	);
+create index if not exists log_entries_ts on log_entries(ts);
+create virtual table if not exists log_search using fts5(message, content='log_entries', content_rowid='id');
+create trigger if not exists log_entries_search_insert after insert on log_entries
+begin
+	insert into log_search (rowid, message) values (new.id, new.message);
+end;
+create trigger if not exists log_entries_search_delete after delete on log_entries
+begin
+	insert into log_search (log_search, rowid, message) values ('delete', old.id, old.message);
+end;
+
+create table if not exists live_events(
+	id integer primary key,
+	ts integer not null,
+	event text not null,
+	data text not null
+	);
+create table if not exists water_jobs(
+	id text primary key,
+	name text not null,
+	args text not null,
+	status text not null,
+	submitted text not null,
+	started text,
+	finished text,
+	error text,
+	pid integer
 	);
+create table if not exists watering_events(
+	id integer primary key,
+	garden_id integer default null references gardens(id),
+	trigger text not null,
+	outcome text not null,
+	reason text,
+	started integer not null,
+	ended integer not null,
+	duration real not null,
+	water_seconds real not null default 0,
+	rain_avg real,
+	rain_any_above boolean,
+	last_rain int
+	);
+create index if not exists watering_events_started on watering_events(started);
+create table if not exists watering_event_crops(
+	event_id integer not null references watering_events(id),
+	crop_id integer not null,
+	crop text not null,
+	primary key (event_id, crop_id)
+	) without rowid;
+create table if not exists crop_water_daily(
+	"day" date not null,
+	crop_id integer not null,
+	crop text not null,
+	cycles integer not null,
+	seconds real not null,
+	primary key ("day", crop_id)
+	) without rowid;
+create table if not exists crop_water_monthly(
+	"month" text not null,
+	crop_id integer not null,
+	crop text not null,
+	cycles integer not null,
+	seconds real not null,
+	primary key ("month", crop_id)
+	) without rowid;
+
+create table if not exists geocode_cache(
+	location text primary key,
+	latitude real not null,
+	longitude real not null,
+	"date" date not null,
+	"time" time not null
+	);
+
+/*
+Numeric time-series samples (epoch seconds, canonical units e.g. celsius), with hourly and daily rollups
+*/
+create table if not exists telemetry(
+	metric text not null,
+	ts integer not null,
+	value real not null,
+	primary key (metric, ts)
+	) without rowid;
+
+create table if not exists telemetry_hourly(
+	metric text not null,
+	ts integer not null,
+	min real not null,
+	avg real not null,
+	max real not null,
+	count integer not null,
+	primary key (metric, ts)
+	) without rowid;
 
-create table if not exists water_log_60(
-        id smallint primary key default (abs(random()) % 8999 + 1000),
-        "date" date not null,
-        "time" time not null,
-        message text not null default "An error occured in script execution. This was logged from the database."
-        );
+create table if not exists telemetry_daily(
+	metric text not null,
+	ts integer not null,
+	min real not null,
+	avg real not null,
+	max real not null,
+	count integer not null,
+	primary key (metric, ts)
+	) without rowid;
 
 /*
 Trigger Definitions
 */
 create trigger if not exists enforce_max_crops after insert on crops
-when (select count(*) from crops) > (select val_num from system_params where param = 'max_crops')
+when (select count(*) from crops where garden_id is new.garden_id) > (select val_num from system_params where param = 'max_crops')
 begin
 	delete from crops
-	where id in (select id from crops order by "date" desc, "time" desc, id asc limit 1);
+	where id in (select id from crops where garden_id is new.garden_id order by "date" desc, "time" desc, id asc limit 1);
 end;
 
-create trigger if not exists max_temp_entries after insert on system_temp
-when (select count(*) from system_temp) > 12
+create trigger if not exists watering_event_crops_rollup after insert on watering_event_crops
 begin
-	delete from system_temp
-	where id in (select id from system_temp order by "date" asc, "time" asc limit 1);
+	insert into crop_water_daily ("day", crop_id, crop, cycles, seconds)
+	select date(e.started, 'unixepoch', 'localtime'), new.crop_id, new.crop, 1, e.water_seconds
+	from watering_events e where e.id = new.event_id
+	on conflict ("day", crop_id) do update set cycles = cycles + 1, seconds = seconds + excluded.seconds, crop = excluded.crop;
+	insert into crop_water_monthly ("month", crop_id, crop, cycles, seconds)
+	select strftime('%Y-%m', e.started, 'unixepoch', 'localtime'), new.crop_id, new.crop, 1, e.water_seconds
+	from watering_events e where e.id = new.event_id
+	on conflict ("month", crop_id) do update set cycles = cycles + 1, seconds = seconds + excluded.seconds, crop = excluded.crop;
 end;
 
-create trigger if not exists max_log_entries after insert on water_log
-when (select count(*) from water_log) > 30
+create trigger if not exists log_entries_retention after insert on log_entries
 begin
-	delete from water_log
-	where id in (select id from water_log order by "date" asc, "time" asc limit 1);
+	delete from log_entries where id <= new.id - (select val_num from system_params where param = 'log_max_entries');
 end;
 
-create trigger if not exists max_log_entries_60 after insert on water_log_60
-when (select count(*) from water_log_60) > 60
+create trigger if not exists live_events_retention after insert on live_events
 begin
-        delete from water_log_60
-        where id in (select id from water_log_60 order by "date" asc, "time" asc limit 1);
+	delete from live_events where id <= new.id - 500;
 end;
 
 /*
@@ -96,12 +217,17 @@ values
 	("api_state", "NC", null, null),
 	("api_timezone", "auto", null, null),
 	("api_units", "Imperial", null, null),
+	("bcrypt_rounds", null, 12, null),
 	("delay_after", null, 1, null),
 	("delay_before", null, 1, null),
+	("forecast_ttl", null, 900, null),
 	("last_rain", null, 28, null),
+	("log_cleared_id", null, 0, null),
+	("log_max_entries", null, 100000, null),
 	("max_crops", null, 4, null),
 	("pump_pin", null, 27, null),
 	("system_enable", null, null, 0),
+	("temp_sample_seconds", null, 60, null),
 	("use_api", null, null, 0),
 	("valve_close_pin", null, 16, null),
 	("valve_enable_pin", null, 13, null),
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+'''
+Purpose: Hardware backends for the irrigation system.
+'gpio' drives the real pins through RPi.GPIO, and reads the CPU temperature from the kernel's thermal zone.
+'sim' records every pin transition and PWM duty cycle in memory, with a virtual clock that advances instantly
+instead of sleeping, so watering cycles can be ran and checked off a Pi.
+PinController runs watering sequences on a backend, and PinClient runs them through hardwared.py over a Unix socket.
+'''
+
+import json, os, socket, threading, time
+from datetime import datetime, timedelta
+
+class RealClock:
+	'''
+	Wall clock. sleep() blocks for real.
+	'''
+	def monotonic(self):
+		return time.monotonic()
+
+	def now(self):
+		return datetime.now()
+
+	def sleep(self, seconds):
+		time.sleep(seconds)
+
+class VirtualClock:
+	'''
+	Clock that starts at 'start' and only moves when sleep() or advance() is called.
+	sleep() returns immediately after moving the clock forward.
+	'''
+	def __init__(self, start = None):
+		self.start = start or datetime.now()
+		self.elapsed = 0.0
+		self._lock = threading.Lock()
+
+	def monotonic(self):
+		return self.elapsed
+
+	def now(self):
+		return self.start + timedelta(seconds=self.elapsed)
+
+	def advance(self, seconds):
+		with self._lock:
+			self.elapsed += seconds
+
+	def sleep(self, seconds):
+		self.advance(seconds)
+
+class SimulatedPWM:
+	'''
+	Stand in for RPi.GPIO.PWM. Records duty cycle changes on the owning SimulatedGPIO.
+	'''
+	def __init__(self, gpio, pin, frequency):
+		if gpio.modes.get(pin) != gpio.OUT:
+			raise RuntimeError(f'You must setup() the GPIO channel {pin} as an output first')
+		self.gpio = gpio
+		self.pin = pin
+		self.frequency = frequency
+		gpio.record(pin, 'pwm', frequency)
+
+	def start(self, duty_cycle):
+		self.gpio.record(self.pin, 'duty', duty_cycle)
+
+	def ChangeDutyCycle(self, duty_cycle):
+		self.gpio.record(self.pin, 'duty', duty_cycle)
+
+	def ChangeFrequency(self, frequency):
+		self.frequency = frequency
+		self.gpio.record(self.pin, 'pwm', frequency)
+
+	def stop(self):
+		self.gpio.record(self.pin, 'duty', 0)
+
+class SimulatedGPIO:
+	'''
+	Stand in for the parts of the RPi.GPIO module the app uses.
+	Every setup, output, PWM, and cleanup call is appended to 'timeline' as (clock time, pin, event, value),
+	and the current level of each pin is kept in 'levels'.
+	'''
+	BCM = 11
+	BOARD = 10
+	OUT = 0
+	IN = 1
+	HIGH = 1
+	LOW = 0
+
+	def __init__(self, clock):
+		self.clock = clock
+		self.mode = None
+		self.modes = {}
+		self.levels = {}
+		self.timeline = []
+		self._lock = threading.Lock()
+
+	def record(self, pin, event, value = None):
+		with self._lock:
+			self.timeline.append((self.clock.monotonic(), pin, event, value))
+
+	def setmode(self, mode):
+		self.mode = mode
+
+	def setwarnings(self, flag):
+		pass
+
+	def setup(self, pin, direction, initial = None):
+		if self.mode is None:
+			raise RuntimeError('Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)')
+		self.modes[pin] = direction
+		self.record(pin, 'setup', direction)
+		if initial is not None:
+			self.output(pin, initial)
+
+	def output(self, pin, value):
+		if self.modes.get(pin) != self.OUT:
+			raise RuntimeError('The GPIO channel has not been set up as an OUTPUT')
+		self.levels[pin] = int(bool(value))
+		self.record(pin, 'output', self.levels[pin])
+
+	def input(self, pin):
+		return self.levels.get(pin, self.LOW)
+
+	def PWM(self, pin, frequency):
+		return SimulatedPWM(self, pin, frequency)
+
+	def cleanup(self, pins = None):
+		if pins is None:
+			pins = list(self.modes)
+		elif isinstance(pins, int):
+			pins = [pins]
+		for pin in pins:
+			self.modes.pop(pin, None)
+			self.levels.pop(pin, None)
+			self.record(pin, 'cleanup')
+
+	def events(self, pin = None, event = None):
+		'''
+		Filters the timeline by pin and/or event.
+		'''
+		with self._lock:
+			return [e for e in self.timeline if (pin is None or e[1] == pin) and (event is None or e[2] == event)]
+
+	def reset(self):
+		with self._lock:
+			self.timeline = []
+		self.modes = {}
+		self.levels = {}
+
+class ThermalZone:
+	'''
+	Sensor for a Linux thermal zone, in celsius (what gpiozero.CPUTemperature reads).
+	The sysfs file is opened once and re-read in place, so a reading is a single pread().
+	Sensors are anything with a read() method returning a number.
+	'''
+	def __init__(self, path = '/sys/class/thermal/thermal_zone0/temp'):
+		self.path = path
+		self._fd = None
+		self._lock = threading.Lock()
+
+	def read(self):
+		with self._lock:
+			if self._fd is None:
+				self._fd = os.open(self.path, os.O_RDONLY)
+			try:
+				return int(os.pread(self._fd, 16, 0)) / 1000
+			except OSError:
+				os.close(self._fd)
+				self._fd = None
+				raise
+
+	@property
+	def temperature(self):
+		return self.read()
+
+	def close(self):
+		with self._lock:
+			if self._fd is not None:
+				os.close(self._fd)
+				self._fd = None
+
+class SimulatedCPUTemperature:
+	'''
+	Stand in for ThermalZone. 'temperature' is in celsius.
+	'''
+	temperature = 45.0
+
+	def read(self):
+		return self.temperature
+
+class HardwareError(Exception):
+	'''
+	Raised when a watering sequence can't be ran, or the hardware daemon reports an error.
+	'''
+
+#Levels pins are held at between sequences. The pump relay is on when HIGH, crop valve relays are active low,
+#and the valve controller's inputs are both LOW with its enable pin at 0% duty cycle.
+idle_levels = {
+	'pump': 0,
+	'crop': 1,
+	'valve_open': 0,
+	'valve_close': 0
+}
+pwm_frequency = 100
+
+class PinController:
+	'''
+	Sole owner of the pins on one GPIO backend.
+	Pins are set up the first time a sequence uses them and then kept configured at their idle level, instead of
+	being set up and cleaned up for every sequence. Sequences are ran one at a time: a second one waits on 'lock'.
+	'''
+	def __init__(self, GPIO, clock):
+		self.GPIO = GPIO
+		self.clock = clock
+		self.lock = threading.RLock()
+		self.roles = {}
+		self.pwms = {}
+		self.running = None
+
+	def configure(self, pin, role):
+		'''
+		Sets up 'pin' as an output for 'role' ('pump', 'crop', 'valve_enable', 'valve_open' or 'valve_close'),
+		unless it already is. A pin given a new role is set up again.
+		'''
+		if self.roles.get(pin) == role:
+			return
+		if pin in self.pwms:
+			self.pwms.pop(pin).stop()
+		if role == 'valve_enable':
+			self.GPIO.setup(pin, self.GPIO.OUT, initial=self.GPIO.LOW)
+			self.pwms[pin] = self.GPIO.PWM(pin, pwm_frequency)
+			self.pwms[pin].start(0)
+		else:
+			self.GPIO.setup(pin, self.GPIO.OUT, initial=idle_levels[role])
+		self.roles[pin] = role
+
+	def idle(self, pins = None):
+		'''
+		Puts 'pins' (every configured pin by default) back at their idle levels.
+		'''
+		for pin in list(self.roles) if pins is None else pins:
+			role = self.roles.get(pin)
+			if role == 'valve_enable':
+				self.pwms[pin].ChangeDutyCycle(0)
+			elif role is not None:
+				self.GPIO.output(pin, idle_levels[role])
+
+	def water(self, pump, valve_enable, valve_open, valve_close, crops, delay_before, water_time, delay_after, on_phase = None):
+		'''
+		Runs one watering sequence: pump on, wait 'delay_before', open the 'crops' valve pins and power the valve controller,
+		wait 'water_time', pump off, wait 'delay_after', then put every pin back at its idle level.
+		The pins are put back at their idle levels even if the sequence fails part way.
+		'on_phase' is called with 'pump_on', 'valves_open', and 'cleanup' as the sequence reaches them.
+		'''
+		phase = on_phase or (lambda name: None)
+		pins = [pump, valve_enable, valve_open, valve_close] + list(crops)
+		if len(set(pins)) != len(pins):
+			raise HardwareError(f'A pin is used for more than one thing in this sequence: {pins}')
+		with self.lock:
+			self.running = {'pins': pins, 'started': self.clock.now().isoformat(timespec='seconds')}
+			try:
+				self.configure(pump, 'pump')
+				self.configure(valve_enable, 'valve_enable')
+				self.configure(valve_open, 'valve_open')
+				self.configure(valve_close, 'valve_close')
+				for pin in crops:
+					self.configure(pin, 'crop')
+
+				self.GPIO.output(pump, self.GPIO.HIGH)
+				phase('pump_on')
+				self.clock.sleep(delay_before)
+				for pin in crops:
+					self.GPIO.output(pin, self.GPIO.LOW)
+				self.pwms[valve_enable].ChangeDutyCycle(100)
+				self.GPIO.output(valve_open, self.GPIO.LOW)
+				self.GPIO.output(valve_close, self.GPIO.HIGH)
+				phase('valves_open')
+				self.clock.sleep(water_time)
+
+				self.GPIO.output(pump, self.GPIO.LOW)
+				phase('cleanup')
+				self.clock.sleep(delay_after)
+			finally:
+				self.idle(pins)
+				self.running = None
+
+	def status(self):
+		return {'busy': self.running is not None, 'running': self.running, 'pins': {str(pin): role for pin, role in self.roles.items()}}
+
+	def close(self):
+		'''
+		Stops PWM and releases every configured pin.
+		'''
+		with self.lock:
+			for pwm in self.pwms.values():
+				pwm.stop()
+			self.pwms = {}
+			if self.roles:
+				self.GPIO.cleanup(list(self.roles))
+			self.roles = {}
+
+class PinClient:
+	'''
+	Same interface as PinController, for running sequences on the hardware daemon (hardwared.py) listening on 'path'.
+	Commands and replies are JSON lines. A watering sequence streams its phases back, then an 'ok' reply.
+	'timeout' is how long to wait on the daemon beyond the longest step of a sequence.
+	'''
+	def __init__(self, path, timeout = 30):
+		self.path = path
+		self.timeout = timeout
+
+	def request(self, command, on_phase = None, timeout = None):
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			sock.settimeout(timeout or self.timeout)
+			sock.connect(self.path)
+			sock.sendall(json.dumps(command).encode('utf-8') + b'\n')
+			with sock.makefile('rb') as replies:
+				for line in replies:
+					reply = json.loads(line)
+					if 'phase' in reply:
+						if on_phase and reply['phase'] != 'queued':
+							on_phase(reply['phase'])
+						continue
+					if not reply.get('ok'):
+						raise HardwareError(reply.get('error', 'Unknown hardware daemon error'))
+					return reply.get('result')
+			raise HardwareError('Hardware daemon closed the connection')
+		except OSError as e:
+			raise HardwareError(f'Could not reach the hardware daemon at {self.path}: {e}') from e
+		finally:
+			sock.close()
+
+	def water(self, pump, valve_enable, valve_open, valve_close, crops, delay_before, water_time, delay_after, on_phase = None):
+		return self.request({
+			'cmd': 'water',
+			'pump': pump,
+			'valve_enable': valve_enable,
+			'valve_open': valve_open,
+			'valve_close': valve_close,
+			'crops': list(crops),
+			'delay_before': delay_before,
+			'water_time': water_time,
+			'delay_after': delay_after
+		}, on_phase, self.timeout + max(delay_before, water_time, delay_after))
+
+	def status(self):
+		return self.request({'cmd': 'status'})
+
+	def close(self):
+		pass
+
+def load(backend = 'gpio'):
+	'''
+	Returns (GPIO, clock, CPU temperature sensor) for the named backend: 'gpio' for the Pi, 'sim' for simulated pins.
+	'''
+	if backend == 'gpio':
+		import RPi.GPIO as GPIO
+		return GPIO, RealClock(), ThermalZone()
+	elif backend == 'sim':
+		clock = VirtualClock()
+		return SimulatedGPIO(clock), clock, SimulatedCPUTemperature()
+	raise ValueError(f'Unknown hardware backend: {backend}')
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+'''
+Purpose: Hardware daemon. The one process that owns the GPIO pins, so any number of web and scheduler processes
+can water without fighting over the pump and valves. Watering sequences from every client are ran one at a time.
+
+Listens on a Unix socket for JSON line commands:
+* {"cmd": "water", "pump": 17, "valve_enable": 22, "valve_open": 23, "valve_close": 24, "crops": [5, 6],
+  "delay_before": 5, "water_time": 300, "delay_after": 5}
+  Replies with {"phase": ...} lines as the sequence runs ('queued' every few seconds while another sequence runs),
+  then {"ok": true}.
+* {"cmd": "status"} - pin roles, and the sequence being ran if any.
+* {"cmd": "timeline"} - every recorded pin event, with --hardware sim only.
+Errors are replied as {"ok": false, "error": "..."}.
+
+Point the app at it with GARDENBOT_HARDWARE_SOCKET=<socket>.
+
+Usage: python3 hardwared.py [--socket /tmp/raspigardenbot-hardware.sock] [--hardware gpio|sim] [--mode 660]
+'''
+
+import argparse, json, os, signal, socket, socketserver, sys, threading, traceback
+import hardware
+
+default_socket = '/tmp/raspigardenbot-hardware.sock'
+#seconds between 'queued' replies while a sequence waits for the one before it
+queued_interval = 5
+
+class CommandHandler(socketserver.StreamRequestHandler):
+	def send(self, reply):
+		self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+		self.wfile.flush()
+
+	def handle(self):
+		for line in self.rfile:
+			try:
+				command = json.loads(line)
+				self.send({'ok': True, 'result': self.server.run(command, self)})
+			except (BrokenPipeError, ConnectionResetError):
+				return
+			except Exception as e:
+				print(f'Ran into an error while running {line[:200]!r}\ntraceback:\n{traceback.print_exception(e)}')
+				try:
+					self.send({'ok': False, 'error': str(e) or type(e).__name__})
+				except OSError:
+					return
+
+class HardwareDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, path, controller, GPIO):
+		self.controller = controller
+		self.GPIO = GPIO
+		super().__init__(path, CommandHandler)
+
+	def run(self, command, handler):
+		name = command.get('cmd')
+		if name == 'water':
+			return self.water(command, handler)
+		elif name == 'status':
+			return self.controller.status()
+		elif name == 'timeline' and hasattr(self.GPIO, 'timeline'):
+			return self.GPIO.events()
+		raise ValueError(f'Unknown command: {name}')
+
+	def water(self, command, handler):
+		def phase(name):
+			#the sequence has to finish and put the pins back at idle even if the client went away
+			try:
+				handler.send({'phase': name})
+			except OSError:
+				pass
+
+		while not self.controller.lock.acquire(timeout=queued_interval):
+			handler.send({'phase': 'queued'})
+		try:
+			self.controller.water(int(command['pump']), int(command['valve_enable']), int(command['valve_open']),
+				int(command['valve_close']), [int(pin) for pin in command.get('crops', [])],
+				float(command['delay_before']), float(command['water_time']), float(command['delay_after']), phase)
+		finally:
+			self.controller.lock.release()
+
+def bind_path(path):
+	'''
+	Removes a socket file left by a daemon that didn't shut down cleanly. Exits if another daemon is listening on it.
+	'''
+	if not os.path.exists(path):
+		return
+	probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		probe.connect(path)
+	except OSError:
+		os.unlink(path)
+	else:
+		sys.exit(f'A hardware daemon is already listening on {path}')
+	finally:
+		probe.close()
+
+def main():
+	parser = argparse.ArgumentParser(description='RaspiGardenBot hardware daemon')
+	parser.add_argument('--socket', default=os.environ.get('GARDENBOT_HARDWARE_SOCKET', default_socket), help='Unix socket to listen on')
+	parser.add_argument('--hardware', default=os.environ.get('GARDENBOT_HARDWARE', 'gpio'), choices=['gpio', 'sim'])
+	parser.add_argument('--mode', default='660', help='permissions of the socket file, in octal')
+	args = parser.parse_args()
+
+	GPIO, clock, _ = hardware.load(args.hardware)
+	GPIO.setmode(GPIO.BCM)
+	controller = hardware.PinController(GPIO, clock)
+
+	bind_path(args.socket)
+	server = HardwareDaemon(args.socket, controller, GPIO)
+	os.chmod(args.socket, int(args.mode, 8))
+	#shutdown() waits for serve_forever() to return, so it can't be called from the thread running it
+	signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+	print(f'Hardware daemon ({args.hardware}) listening on {args.socket}', flush=True)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		controller.close()
+		if os.path.exists(args.socket):
+			os.unlink(args.socket)
+
+if __name__ == '__main__':
+	main()
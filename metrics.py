@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+'''
+Purpose: Small in-process metrics registry, rendered in the Prometheus text exposition format (version 0.0.4).
+Counters, gauges, and histograms keep their values per label set in plain dicts under one lock per metric,
+so recording a value costs a dict lookup and, for histograms, a bisect over the bucket bounds.
+Values are per process. With several app processes, each one's /metrics shows its own.
+'''
+
+import bisect, math, threading
+
+#seconds, for request, query, and job timings
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+def escape(value):
+	return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def formatLabels(names, values, extra = ''):
+	pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+	if extra:
+		pairs.append(extra)
+	return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def formatValue(value):
+	if value == math.inf:
+		return '+Inf'
+	if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+		return str(int(value))
+	return repr(value)
+
+class Metric:
+	kind = 'untyped'
+
+	def __init__(self, name, help, labels = ()):
+		self.name = name
+		self.help = help
+		self.labels = tuple(labels)
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def samples(self):
+		'''
+		Returns [(name suffix, label values, extra label, value)] for rendering.
+		'''
+		with self._lock:
+			return [('', key, '', value) for key, value in self._values.items()]
+
+	def render(self):
+		lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+		for suffix, key, extra, value in self.samples():
+			lines.append(f'{self.name}{suffix}{formatLabels(self.labels, key, extra)} {formatValue(value)}')
+		return lines
+
+class Counter(Metric):
+	'''
+	Value that only goes up.
+	'''
+	kind = 'counter'
+
+	def __init__(self, name, help, labels = ()):
+		super().__init__(name, help, labels)
+		#without labels there's one series, reported as 0 until it's counted
+		if not self.labels:
+			self._values[()] = 0
+
+	def inc(self, *labels, amount = 1):
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0) + amount
+
+	def value(self, *labels):
+		with self._lock:
+			return self._values.get(labels, 0)
+
+class Gauge(Metric):
+	'''
+	Value that is set, or read from 'func' (returning {label values: value}, or a number if there are no labels) when rendered.
+	'''
+	kind = 'gauge'
+
+	def __init__(self, name, help, labels = (), func = None):
+		super().__init__(name, help, labels)
+		self.func = func
+
+	def set(self, value, *labels):
+		with self._lock:
+			self._values[labels] = value
+
+	def inc(self, *labels, amount = 1):
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0) + amount
+
+	def samples(self):
+		if self.func is None:
+			return super().samples()
+		values = self.func()
+		if not isinstance(values, dict):
+			values = {(): values}
+		return [('', key, '', value) for key, value in values.items() if value is not None]
+
+class Histogram(Metric):
+	'''
+	Counts observations into cumulative buckets with upper bounds 'buckets', and keeps their sum and count.
+	'''
+	kind = 'histogram'
+
+	def __init__(self, name, help, labels = (), buckets = default_buckets):
+		super().__init__(name, help, labels)
+		self.buckets = tuple(sorted(buckets))
+
+	def observe(self, value, *labels):
+		i = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			series = self._values.get(labels)
+			if series is None:
+				#per bucket counts (the last one is +Inf), sum, count
+				series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+			series[0][i] += 1
+			series[1] += value
+			series[2] += 1
+
+	def samples(self):
+		with self._lock:
+			values = [(key, list(series[0]), series[1], series[2]) for key, series in self._values.items()]
+		samples = []
+		for key, counts, total, count in values:
+			cumulative = 0
+			for bound, bucket in zip(self.buckets + (math.inf,), counts):
+				cumulative += bucket
+				samples.append(('_bucket', key, f'le="{formatValue(float(bound))}"', cumulative))
+			samples.append(('_sum', key, '', total))
+			samples.append(('_count', key, '', count))
+		return samples
+
+class Registry:
+	'''
+	Named metrics, rendered together by render().
+	'''
+	content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+	def __init__(self):
+		self.metrics = {}
+		self._lock = threading.Lock()
+
+	def register(self, metric):
+		with self._lock:
+			if metric.name in self.metrics:
+				raise ValueError(f'Metric {metric.name} is already registered')
+			self.metrics[metric.name] = metric
+		return metric
+
+	def counter(self, name, help, labels = ()):
+		return self.register(Counter(name, help, labels))
+
+	def gauge(self, name, help, labels = (), func = None):
+		return self.register(Gauge(name, help, labels, func))
+
+	def histogram(self, name, help, labels = (), buckets = default_buckets):
+		return self.register(Histogram(name, help, labels, buckets))
+
+	def render(self):
+		with self._lock:
+			metrics = list(self.metrics.values())
+		lines = []
+		for metric in metrics:
+			lines.extend(metric.render())
+		return '\n'.join(lines) + '\n'
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+'''
+Purpose: Profiles one request at a time, for finding out where a slow page spends its time on the device itself.
+StackSampler samples the request thread's call stack every few milliseconds and counts them as folded stacks
+('outer;inner;leaf count' lines, which flamegraph.pl, speedscope, and inferno read).
+Profile adds a trace of every SQL statement with its time and call site, and flags statements ran over and over
+in one request (N+1 queries).
+Samples are taken by another thread, so a request that holds the GIL for long stretches is sampled less often.
+'''
+
+import os, re, sys, threading, time
+
+#string and number literals formatted into a statement, replaced with ? when grouping repeated statements
+literal = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def normalizeQuery(query):
+	return ' '.join(literal.sub('?', query).split())
+
+def frameName(frame):
+	'''
+	Names a stack frame by its function, file, and first line, so every sample of a function is merged.
+	'''
+	code = frame.f_code
+	return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+def callSite(frame, skip = ()):
+	'''
+	Returns 'function (file:line)' of the first frame from 'frame' outwards that isn't in a function named in 'skip'
+	or in contextlib.
+	'''
+	while frame is not None and (frame.f_code.co_name in skip or frame.f_code.co_filename.endswith('contextlib.py')):
+		frame = frame.f_back
+	if frame is None:
+		return None
+	return f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})'
+
+class StackSampler:
+	'''
+	Counts the call stacks of thread 'thread_id', sampled every 'interval' seconds until stop().
+	'''
+	def __init__(self, thread_id, interval = 0.002):
+		self.thread_id = thread_id
+		self.interval = interval
+		self.stacks = {}
+		self.samples = 0
+		self._stop = threading.Event()
+		self._thread = None
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+		self._thread.start()
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			if frame is None:
+				return
+			stack = []
+			while frame is not None:
+				stack.append(frameName(frame))
+				frame = frame.f_back
+			key = ';'.join(reversed(stack))
+			self.stacks[key] = self.stacks.get(key, 0) + 1
+			self.samples += 1
+
+	def stop(self):
+		self._stop.set()
+		if self._thread is not None and self._thread is not threading.current_thread():
+			self._thread.join()
+
+	def folded(self):
+		return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+	def functions(self, limit = 25):
+		'''
+		Returns the 'limit' functions seen in the most samples, with the samples they were running in ('self')
+		and the samples they were anywhere on the stack in ('total').
+		'''
+		own = {}
+		total = {}
+		for stack, count in self.stacks.items():
+			names = stack.split(';')
+			own[names[-1]] = own.get(names[-1], 0) + count
+			for name in set(names):
+				total[name] = total.get(name, 0) + count
+		ranked = sorted(total, key=lambda name: (-total[name], -own.get(name, 0)))[:limit]
+		return [{'function': name, 'self': own.get(name, 0), 'total': total[name]} for name in ranked]
+
+class Profile:
+	'''
+	Stack samples and SQL statements of one request, ran on thread 'thread_id'.
+	Statements ran at least 'repeat_threshold' times (after replacing literals with ?) are reported as repeated.
+	'''
+	def __init__(self, thread_id, interval = 0.002, repeat_threshold = 3):
+		self.sampler = StackSampler(thread_id, interval)
+		self.repeat_threshold = repeat_threshold
+		self.statements = []
+		self.began = None
+		self.elapsed = None
+
+	def start(self):
+		self.began = time.perf_counter()
+		self.sampler.start()
+
+	def stop(self):
+		if self.elapsed is None:
+			self.sampler.stop()
+			self.elapsed = time.perf_counter() - self.began
+
+	def statement(self, kind, query, seconds, site):
+		'''
+		Records a statement that took 'seconds' and just finished, called from 'site'.
+		'''
+		self.statements.append({
+			'at_ms': round((time.perf_counter() - self.began - seconds) * 1000, 3),
+			'ms': round(seconds * 1000, 3),
+			'kind': kind,
+			'query': ' '.join(query.split()),
+			'site': site
+		})
+
+	def repeated(self):
+		'''
+		Returns groups of statements ran at least repeat_threshold times, most ran first, with where they were ran from.
+		'''
+		groups = {}
+		for statement in self.statements:
+			group = groups.setdefault(normalizeQuery(statement['query']), {'count': 0, 'ms': 0.0, 'sites': {}})
+			group['count'] += 1
+			group['ms'] += statement['ms']
+			group['sites'][statement['site']] = group['sites'].get(statement['site'], 0) + 1
+		return [{'query': query, 'count': group['count'], 'ms': round(group['ms'], 3), 'sites': group['sites']}
+			for query, group in sorted(groups.items(), key=lambda item: -item[1]['count'])
+			if group['count'] >= self.repeat_threshold]
+
+	def summary(self, **info):
+		'''
+		JSON friendly report of the profile, starting with the key/values in 'info'.
+		'''
+		sql_ms = sum(statement['ms'] for statement in self.statements)
+		return {
+			**info,
+			'ms': round(self.elapsed * 1000, 3),
+			'samples': self.sampler.samples,
+			'interval_ms': self.sampler.interval * 1000,
+			'sql': {'statements': len(self.statements), 'ms': round(sql_ms, 3)},
+			'repeated': self.repeated(),
+			'functions': self.sampler.functions(),
+			'statements': self.statements
+		}
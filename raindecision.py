@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+'''
+Purpose: The rain-skip watering decision made by water_on_schedule(), as pure functions with no DB, network,
+or GPIO access, so the same rules can be ran offline by backtest.py.
+'''
+
+#Default thresholds, in percent chance of rain over the next 24 hours.
+#Skip watering if any hour is above 'any_above' and the average is at least 'avg_with_any',
+#or if the average alone is above 'avg_alone'.
+#100 / 24 = 4.16 <<<<<< this is the average percent chance value if there's only 1 hour with 100% chance.
+thresholds = {
+	'any_above': 50,
+	'avg_with_any': 4.16,
+	'avg_alone': 50
+}
+
+#last_rain wraps back to 0 after this many days when the API isn't in use
+rotation_days = 30
+
+def rainChance(probabilities, any_above = thresholds['any_above']):
+	'''
+	Gets average percent chance over the given hourly percent chances,
+	and whether any of them is above 'any_above'.
+	Returns (aboveFiddy, avgPercentRain).
+	'''
+	aboveFiddy = any(p > any_above for p in probabilities)
+	avgPercentRain = sum(probabilities) / len(probabilities) if probabilities else 0
+	return aboveFiddy, avgPercentRain
+
+def rainExpected(aboveFiddy, avgPercentRain, limits = thresholds):
+	'''
+	True if watering should be skipped for the expected rain.
+	'''
+	return (aboveFiddy and avgPercentRain >= limits['avg_with_any']) or avgPercentRain > limits['avg_alone']
+
+def cropDue(enabled, rain_inc, last_rain):
+	'''
+	True if a crop is watered on a day 'last_rain' days after the last rain: every 'rain_inc' days, if enabled.
+	'''
+	return bool(enabled) and rain_inc <= last_rain and last_rain % rain_inc == 0
+
+def decide(probabilities, last_rain, crops, system_enable = True, use_api = True, limits = thresholds):
+	'''
+	Decides one scheduled watering run.
+	'probabilities' are the hourly percent chances of rain for the next 24 hours, 'crops' are crop rows
+	(id, enabled, crop, pin, rain_inc) as stored in the crops table.
+	Returns a dict with:
+	* action - 'disabled', 'skip' (rain expected), or 'water'
+	* crops - the crop rows to water
+	* last_rain - the new days since last rain, or None if it is unchanged
+	* aboveFiddy, avgPercentRain - the rain chance the decision was made on
+	'''
+	aboveFiddy, avgPercentRain = rainChance(probabilities, limits['any_above'])
+	decision = {
+		'action': 'water',
+		'crops': [],
+		'last_rain': None,
+		'aboveFiddy': aboveFiddy,
+		'avgPercentRain': avgPercentRain
+	}
+
+	if not system_enable:
+		decision['action'] = 'disabled'
+	elif rainExpected(aboveFiddy, avgPercentRain, limits):
+		decision['action'] = 'skip'
+		decision['last_rain'] = 0
+	else:
+		#crops are picked by the days since last rain before this run is counted
+		decision['crops'] = [crop for crop in crops if cropDue(crop[1], crop[4], last_rain)]
+		decision['last_rain'] = last_rain + 1
+		if not use_api and last_rain == rotation_days:
+			decision['last_rain'] = 0
+	return decision
@@ -0,0 +1,47 @@
+document.addEventListener("DOMContentLoaded", () => {
+    const status = document.getElementById('liveStatus');
+    const cpuTemp = document.getElementById('cpuTempNow');
+    if (!status || !window.EventSource) return;
+
+    const cycles = {
+        schedule: 'Scheduled watering',
+        all: 'Watering all sectors',
+        crop: 'Watering sector'
+    };
+    const phases = {
+        pump_on: 'pump on',
+        valves_open: 'valves open',
+        cleanup: 'cleaning up',
+        done: 'done'
+    };
+
+    const onWatering = e => {
+        const event = JSON.parse(e.data);
+        let text = `${cycles[event.cycle] || event.cycle}: ${phases[event.phase] || event.phase}`;
+        if (event.crops && event.crops.length) text += ` (${event.crops.join(', ')})`;
+        status.textContent = `${event.at.split('T')[1]} ${text}`;
+    };
+
+    const onLog = e => {
+        const event = JSON.parse(e.data);
+        status.textContent = `${event.time} ${event.message}`;
+    };
+
+    const onCpuTemp = e => {
+        const event = JSON.parse(e.data);
+        if (cpuTemp) cpuTemp.textContent = `${event.at.split('T')[1].slice(0, 5)}, ${event.temp}${event.units}`;
+    };
+
+    // One stream for all live updates. EventSource reconnects on its own when the server ends the stream, resuming
+    // from the last event id. If the server turns the stream away (too many open), it gives up, so try again later.
+    const connect = () => {
+        const source = new EventSource(status.dataset.url);
+        source.addEventListener('watering', onWatering);
+        source.addEventListener('log', onLog);
+        source.addEventListener('cpu_temp', onCpuTemp);
+        source.addEventListener('error', () => {
+            if (source.readyState === EventSource.CLOSED) setTimeout(connect, 30000);
+        });
+    };
+    connect();
+});
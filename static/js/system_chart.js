@@ -1,14 +1,14 @@
 document.addEventListener("DOMContentLoaded", () => {
     const ctx = document.getElementById('tempChart').getContext('2d');
-    if (!ctx || !window.sysData) return;
+    if (!ctx) return;
 
     const canvas = document.getElementById('tempChart');
     const styles = getComputedStyle(canvas);
     const data = {
-        labels: window.sysData.timestamp,
+        labels: [],
         datasets: [{
             // label: 'System Temperature (°F)',
-            data: window.sysData.temp,
+            data: [],
             // borderColor: 'rgb(34, 139, 34)',
             borderColor: styles.getPropertyValue('--line-color'),
             // backgroundColor: 'rgba(34, 139, 34, 0.2)',
@@ -66,4 +66,25 @@ document.addEventListener("DOMContentLoaded", () => {
     };
 
     const tempChart = new Chart(ctx, config);
+
+    // Loads /api/system-temp. The browser revalidates with If-None-Match, so unchanged data costs a 304.
+    let etag = null;
+    const load = () => {
+        fetch(canvas.dataset.url, {cache: 'no-cache'})
+            .then(resp => {
+                if (!resp.ok || resp.headers.get('ETag') === etag) return null;
+                etag = resp.headers.get('ETag');
+                return resp.json();
+            })
+            .then(sysData => {
+                if (!sysData) return;
+                tempChart.data.labels = sysData.label.map(label => label.split('\n'));
+                tempChart.data.datasets[0].data = sysData.avg;
+                tempChart.options.scales.y.title.text = `Temperature (${sysData.units})`;
+                tempChart.update();
+            })
+            .catch(() => {});
+    };
+    load();
+    setInterval(load, 60 * 1000);
 });
\ No newline at end of file
@@ -0,0 +1,37 @@
+document.addEventListener("DOMContentLoaded", () => {
+    const status = document.getElementById('waterJobStatus');
+    if (!status) return;
+
+    const labels = {
+        queued: 'Watering queued...',
+        running: 'Watering in progress...',
+        done: 'Watering finished.',
+        failed: 'Watering failed.',
+        cancelled: 'Watering cancelled.'
+    };
+    //stop polling after about 30 minutes, longer than any watering run
+    const maxPolls = 900;
+    let polls = 0;
+
+    const poll = () => {
+        if (++polls > maxPolls) {
+            status.textContent += ' Reload the page to check again.';
+            return;
+        }
+        fetch(status.dataset.url)
+            .then(resp => resp.json())
+            .then(job => {
+                if (job.error && !job.status) {
+                    status.textContent = job.error;
+                    return;
+                }
+                let text = labels[job.status] || job.status;
+                if (job.finished) text += ` (${job.finished.replace('T', ' ')})`;
+                if (job.status === 'failed' && job.error) text += ` ${job.error}`;
+                status.textContent = text;
+                if (job.status === 'queued' || job.status === 'running') setTimeout(poll, 2000);
+            })
+            .catch(() => setTimeout(poll, 5000));
+    };
+    poll();
+});
@@ -10,7 +10,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
     const dataset = [{
             label: 'Temperature (°F)',
-            data: window.weather.hourly.temp,
+            data: [],
             borderColor: styles.getPropertyValue('--temperature-color'),
             backgroundColor: styles.getPropertyValue('--temperature-color'),
             fill: true,
@@ -28,7 +28,7 @@ document.addEventListener("DOMContentLoaded", () => {
         // },
         {
             label: 'Cloud Cover',
-            data: window.weather.hourly.cloud_cover,
+            data: [],
             borderColor: styles.getPropertyValue('--cloud-cover-color'),
             backgroundColor: styles.getPropertyValue('--cloud-cover-color'),
             fill: true,
@@ -37,7 +37,7 @@ document.addEventListener("DOMContentLoaded", () => {
         },
         {
             label: 'Precipitation %',
-            data: window.weather.hourly.precipitation_probability,
+            data: [],
             borderColor: styles.getPropertyValue('--precipitation-percent-color'),
             backgroundColor: styles.getPropertyValue('--precipitation-percent-color'),
             fill: true,
@@ -66,7 +66,7 @@ document.addEventListener("DOMContentLoaded", () => {
             }
     ];
     const data = {
-        labels: window.weather.hourly.time,
+        labels: [],
         datasets: dataset
     };
 
@@ -170,4 +170,26 @@ document.addEventListener("DOMContentLoaded", () => {
     `).join('');
 
     const tempChart = new Chart(ctx, config);
+
+    // Loads /api/weather. The browser revalidates with If-None-Match, so unchanged data costs a 304.
+    let etag = null;
+    const load = () => {
+        fetch(canvas.dataset.url, {cache: 'no-cache'})
+            .then(resp => {
+                if (!resp.ok || resp.headers.get('ETag') === etag) return null;
+                etag = resp.headers.get('ETag');
+                return resp.json();
+            })
+            .then(weather => {
+                if (!weather) return;
+                tempChart.data.labels = weather.hourly.time;
+                tempChart.data.datasets[0].data = weather.hourly.temp;
+                tempChart.data.datasets[1].data = weather.hourly.cloud_cover;
+                tempChart.data.datasets[2].data = weather.hourly.precipitation_probability;
+                tempChart.update();
+            })
+            .catch(() => {});
+    };
+    load();
+    setInterval(load, 5 * 60 * 1000);
 });
\ No newline at end of file